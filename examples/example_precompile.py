@@ -5,6 +5,9 @@ $ python -m pylsb.compile -i ../testing/mjvr_types.h ../testing/climber_config.h
 
 After compiling, import your definitions:
 from rnel_msg_defs import *
+
+Or compile on first import and reuse the cached module afterwards:
+pylsb.compile.install_import_hook("rnel_msg_defs", [header files])
 """
 
 import sys
@@ -1,6 +1,5 @@
 from dash import Dash, dcc, html, Input, Output, State
 import pylsb, ctypes, threading, time, sys
-from queue import Queue
 
 
 # Choose a unique message type id number
@@ -28,7 +27,7 @@ app = Dash(
     external_stylesheets=["https://codepen.io/chriddyp/pen/bWLwgP.css"],
 )
 
-msg_queue = Queue()  # global message queue
+new_msgs = []  # filled by the USER_MESSAGE handler in interval_callback
 
 
 def send_lsb_message(msg):
@@ -40,64 +39,49 @@ def send_lsb_message(msg):
         print("Error sending LSB message")
 
 
-class LsbThread(threading.Thread):
-    def __init__(self):
-        self.running = False
-        self.connected = mod.connected
-        super().__init__()
-        self.setDaemon(True)
-        pass
+def on_user_message(msg):
+    new_msgs.append(msg)
 
-    def run(self):
-        self.running = True
 
+def run_lsb(max_attempts=10):
+    """Keep the client connected, reading messages on its dispatcher thread.
+    USER_MESSAGE handlers run when interval_callback calls dispatch_pending.
+    When the dispatcher stops, e.g. because the message manager restarted,
+    the client reconnects and starts it again.
+    """
+    mod.on(MT_USER_MESSAGE, on_user_message, main_thread=True)
+
+    connect_attempts = 0
+    while True:
+        # connect to LSB
+        try:
+            mod.connect()
+        except pylsb.ClientError:
+            connect_attempts += 1
+            if connect_attempts < max_attempts:
+                print("Warning: Exception connecting to message manager, trying again.")
+                time.sleep(2)
+                continue
+            print(
+                "ERROR: Could not connect to message manager, exceeded max tries.",
+                file=sys.stderr,
+            )
+            return
         connect_attempts = 0
-        max_attempts = 10
-        while self.running:
-            # connect to LSB
-            if not (mod.connected and self.connected):
-                connect_attempts += 1
-                try:
-                    mod.connect()
-                    self.connected = mod.connected
-                    connect_attempts = 0
-                    print("Connected to LSB message manager")
-                except:
-                    if connect_attempts < max_attempts:
-                        print(
-                            "Warning: Exception connecting to message manager in LsbThread, trying again."
-                        )
-                        time.sleep(2)
-                        continue
-                    else:
-                        print(
-                            "ERROR: Could not connect to message manager in LsbThread, exceeded max tries.",
-                            file=sys.stderr,
-                        )
-                        self.running = False
-                        break
-
-            # subscribe to message
-            if mod.connected and self.connected:
-                print("Subscribing to USER_MESSAGE")
-                try:
-                    mod.subscribe([MT_USER_MESSAGE])
-                except:
-                    self.connected = False
-                    print("Warning: Exception when subscribing to USER_MESSAGE")
-                    time.sleep(2)
-
-            # read messages
-            while self.running and mod.connected and self.connected:
-                try:
-                    msg = mod.read_message(timeout=0.200)
-
-                    if msg is not None and msg.name == "USER_MESSAGE":
-                        msg_queue.put(msg)
-                except:
-                    self.connected = False
-                    print("Exception in LsbThread read loop")
-                    time.sleep(2)
+        print("Connected to LSB message manager")
+
+        # subscribe and read messages until the connection is lost
+        try:
+            print("Subscribing to USER_MESSAGE")
+            mod.subscribe([MT_USER_MESSAGE])
+            mod.start_dispatcher()
+            while mod.dispatcher_running:
+                time.sleep(0.2)
+            mod.stop_dispatcher()
+        except Exception as e:
+            print(f"Warning: Lost connection to message manager ({e!r}), reconnecting.")
+        mod.disconnect()
+        time.sleep(2)
 
 
 send_txt_style = {"width": "100%", "height": "85px", "resize": "none", "margin": "auto"}
@@ -171,9 +155,10 @@ def send_callback(n_clicks):
 )
 def interval_callback(txt, n):
     MAX_ROWS = 50
-    while not msg_queue.empty():
-        msg = msg_queue.get().data
-        txt = str(msg) + "\n" + txt
+    new_msgs.clear()
+    mod.dispatch_pending()
+    for msg in new_msgs:
+        txt = str(msg.data) + "\n" + txt
         if len(txt.splitlines()) > MAX_ROWS:
             txt = "\n".join(txt.split("\n")[:MAX_ROWS])
     return txt
@@ -181,7 +166,7 @@ def interval_callback(txt, n):
 
 if __name__ == "__main__":
     try:
-        lsb_thread = LsbThread()
+        lsb_thread = threading.Thread(target=run_lsb, daemon=True)
         lsb_thread.start()
         app.run(
             host="127.0.0.1",
@@ -5,10 +5,12 @@ import asyncio, websockets, json, ctypes, sys
 sys.path.append("../../")
 
 import pylsb
+from pylsb.aio import AsyncClient
 
 # Choose a unique message type id number
 MT_SINE_TEST_MSG = 9000
 
+
 # Create a user defined message from a ctypes.Structure or basic ctypes
 @pylsb.msg_def
 class SINE_TEST_MSG(pylsb.MessageData):
@@ -22,30 +24,25 @@ async def lsb_ws(websocket):
     print("starting lsb_ws coroutine")
     # Setup Client
     try:
-        mod = pylsb.Client()
-        mod.connect()  # this should ideally be an "await" statement
+        mod = AsyncClient()
+        await mod.connect()
 
         # Select the messages to receive
-        mod.subscribe([MT_SINE_TEST_MSG])  # this should ideally be an "await" statement
+        await mod.subscribe([MT_SINE_TEST_MSG])
     except:
         return
 
     data = {"time": [], "value": []}
-    while True:
-        try:
-            msg = mod.read_message(
-                timeout=0
-            )  # this should REALLY be an "await" statement
-            if msg is not None and msg.name == "SINE_TEST_MSG":
+    try:
+        async for msg in mod:
+            if msg.name == "SINE_TEST_MSG":
                 data["time"] = msg.data.time
                 data["value"] = msg.data.value
                 await websocket.send(json.dumps(data))
-            else:
-                await asyncio.sleep(0.01)
-        except websockets.ConnectionClosedOK:
-            break
-        except:
-            break
+    except (websockets.ConnectionClosed, pylsb.ClientError):
+        pass
+    finally:
+        await mod.disconnect()
 
 
 async def main():
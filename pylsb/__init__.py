@@ -1,3 +1,5 @@
+__version__ = "0.1"
+
 from ._core import (
     MessageHeader,
     MessageData,
@@ -6,6 +8,7 @@ from ._core import (
     core_msg_defs,
     msg_defs,
     msg_def,
+    MessageDefs,
     AddMessage,
 )
 
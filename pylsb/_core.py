@@ -1,29 +1,187 @@
 import ctypes
+import struct
 
 from dataclasses import dataclass
 from collections import ChainMap
-from typing import Type, ClassVar, Optional, Any, Dict, ChainMap
+from collections.abc import ItemsView, KeysView, ValuesView
+from typing import (
+    Type,
+    ClassVar,
+    Optional,
+    Any,
+    Callable,
+    Dict,
+    ChainMap,
+    Iterator,
+    List,
+    Tuple,
+    Union,
+)
 
 from .constants import *
 
+
+class MessageDefs(dict):
+    """Message definitions by type id. Definitions added with add_lazy are
+    built by their factory on first lookup, which registers the class.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.factories: Dict[int, Callable[[], Type["MessageData"]]] = {}
+
+    def add_lazy(self, type_id: int, factory: Callable[[], Type["MessageData"]]):
+        if not dict.__contains__(self, type_id):
+            self.factories[type_id] = factory
+            invalidate_entry(type_id)
+
+    def __missing__(self, type_id: int) -> Type["MessageData"]:
+        factory = self.factories.pop(type_id, None)
+        if factory is None:
+            raise KeyError(type_id)
+        msg_cls = factory()
+        if not dict.__contains__(self, type_id):
+            # The factory did not register the class with msg_def
+            self[type_id] = msg_cls
+        return msg_cls
+
+    def __setitem__(self, type_id: int, msg_cls: Type["MessageData"]):
+        self.factories.pop(type_id, None)
+        super().__setitem__(type_id, msg_cls)
+        invalidate_entry(type_id)
+
+    def __contains__(self, type_id) -> bool:
+        return dict.__contains__(self, type_id) or type_id in self.factories
+
+    def __iter__(self) -> Iterator[int]:
+        yield from dict.__iter__(self)
+        yield from list(self.factories)
+
+    def __len__(self) -> int:
+        return dict.__len__(self) + len(self.factories)
+
+    def get(self, type_id, default=None):
+        try:
+            return self[type_id]
+        except KeyError:
+            return default
+
+    def keys(self) -> KeysView:
+        return KeysView(self)
+
+    def items(self) -> ItemsView:
+        return ItemsView(self)
+
+    def values(self) -> ValuesView:
+        return ValuesView(self)
+
+
 core_msg_defs: Dict[int, Type["MessageData"]] = {}
-user_msg_defs: Dict[int, Type["MessageData"]] = {}
+user_msg_defs: MessageDefs = MessageDefs()
 
 msg_defs: ChainMap[int, Type["MessageData"]] = ChainMap(core_msg_defs, user_msg_defs)
 
 
+def check_data_struct(msg_cls):
+    data_struct = msg_cls.__dict__.get("data_struct")
+    if data_struct is not None and data_struct.size != ctypes.sizeof(msg_cls):
+        raise TypeError(
+            f"{msg_cls.__name__}.data_struct packs {data_struct.size} bytes, "
+            f"the structure has {ctypes.sizeof(msg_cls)}"
+        )
+
+
 def msg_def(msg_cls, *args, **kwargs):
     """Decorator to add user message definitions."""
+    check_data_struct(msg_cls)
     user_msg_defs[msg_cls.type_id] = msg_cls
+    resolve_entry(msg_cls.type_id)
     return msg_cls
 
 
 def core_def(msg_cls, *args, **kwargs):
     """Decorator to add core message definitions."""
+    check_data_struct(msg_cls)
     core_msg_defs[msg_cls.type_id] = msg_cls
+    resolve_entry(msg_cls.type_id)
     return msg_cls
 
 
+@dataclass
+class MessageEntry:
+    """Registry entry of a message type: its class, payload size and how
+    payloads are decoded.
+    """
+
+    msg_cls: Optional[Type["MessageData"]]
+    size: int
+
+    def decode(
+        self, buffer, offset: int, data_size: int, zero_copy: bool = False
+    ) -> "MessageData":
+        if data_size == self.size:
+            if zero_copy:
+                return self.msg_cls.from_buffer(buffer, offset)
+            return self.msg_cls.from_buffer_copy(buffer, offset)
+        # Signal or size mismatch, copy what fits
+        data = self.msg_cls()
+        nbytes = min(data_size, self.size)
+        with memoryview(buffer) as view:
+            memoryview(data).cast("B")[:nbytes] = view[offset : offset + nbytes]
+        return data
+
+
+class RawEntry(MessageEntry):
+    """Entry of types without a definition, their payloads pass through as bytes."""
+
+    def __init__(self):
+        super().__init__(None, -1)
+
+    def decode(
+        self, buffer, offset: int, data_size: int, zero_copy: bool = False
+    ) -> bytes:
+        with memoryview(buffer) as view:
+            return bytes(view[offset : offset + data_size])
+
+
+RAW_ENTRY = RawEntry()
+
+# Entries by type id, filled on registration or on the first lookup of a
+# type, so receiving resolves a payload with one list index
+msg_registry: List[Optional[MessageEntry]] = [None] * MAX_MESSAGE_TYPES
+
+
+def resolve_entry(type_id: int) -> MessageEntry:
+    """Registry entry of a type from msg_defs, building lazy definitions."""
+    msg_cls = msg_defs.get(type_id)
+    if msg_cls is None:
+        entry = RAW_ENTRY
+    else:
+        entry = MessageEntry(msg_cls, ctypes.sizeof(msg_cls))
+    if 0 <= type_id < MAX_MESSAGE_TYPES:
+        msg_registry[type_id] = entry
+    return entry
+
+
+def message_entry(type_id: int) -> MessageEntry:
+    entry = msg_registry[type_id] if 0 <= type_id < MAX_MESSAGE_TYPES else None
+    if entry is None:
+        entry = resolve_entry(type_id)
+    return entry
+
+
+def invalidate_entry(type_id: int):
+    if 0 <= type_id < MAX_MESSAGE_TYPES:
+        msg_registry[type_id] = None
+
+
+def rebuild_registry():
+    """Drop every entry, e.g. after changing core_msg_defs or user_msg_defs
+    without msg_def, AddMessage or item assignment.
+    """
+    msg_registry[:] = [None] * MAX_MESSAGE_TYPES
+
+
 # Field type name to ctypes
 ctypes_map = {
     "char": ctypes.c_char,
@@ -51,6 +209,45 @@ ctypes_map = {
 }
 
 
+def ctypes_dtype(ctype) -> "numpy.dtype":
+    """NumPy dtype with the memory layout of a ctypes type. Structure
+    offsets and sizes come from ctypes, so _pack_, base class fields,
+    nested structures, unions and multi-dimensional arrays are laid out
+    exactly. char arrays become fixed length byte strings.
+    numpy is imported on first use, it is only needed for these views.
+    """
+    import numpy as np
+
+    if issubclass(ctype, (ctypes.Structure, ctypes.Union)):
+        names, formats, offsets = [], [], []
+        for cls in reversed(ctype.__mro__):
+            for field in cls.__dict__.get("_fields_", ()):
+                if len(field) > 2:
+                    raise TypeError(f"Bit field {field[0]} has no NumPy equivalent")
+                name, field_type = field
+                names.append(name)
+                formats.append(ctypes_dtype(field_type))
+                offsets.append(getattr(ctype, name).offset)
+        return np.dtype(
+            {
+                "names": names,
+                "formats": formats,
+                "offsets": offsets,
+                "itemsize": ctypes.sizeof(ctype),
+            }
+        )
+    if issubclass(ctype, ctypes.Array):
+        if ctype._type_ is ctypes.c_char:
+            return np.dtype(f"S{ctype._length_}")
+        item = ctypes_dtype(ctype._type_)
+        if item.subdtype is not None:
+            # Array of arrays, one multi-dimensional field
+            item, shape = item.subdtype
+            return np.dtype((item, (ctype._length_,) + shape))
+        return np.dtype((item, (ctype._length_,)))
+    return np.dtype(ctype)
+
+
 def print_ctype_array(arr):
     """expand and print ctype arrays"""
     max_len = 20
@@ -70,6 +267,21 @@ class MessageData(ctypes.Structure):
     type_id: ClassVar[int] = -1
     type_name: ClassVar[str] = ""
 
+    # Optional struct with the same layout, fields in order with nested
+    # structures and arrays flattened (char arrays are one bytes value).
+    # pylsb.compile generates it, msg_def checks its size.
+    data_struct: ClassVar[Optional[struct.Struct]] = None
+
+    @classmethod
+    def pack_into(cls, buffer, offset: int, *values):
+        """Encode field values with data_struct, without a ctypes object."""
+        cls.data_struct.pack_into(buffer, offset, *values)
+
+    @classmethod
+    def unpack_from(cls, buffer, offset: int = 0) -> Tuple:
+        """Decode field values with data_struct, without a ctypes object."""
+        return cls.data_struct.unpack_from(buffer, offset)
+
     @property
     def size(self) -> int:
         return ctypes.sizeof(self)
@@ -78,6 +290,23 @@ class MessageData(ctypes.Structure):
     def buffer(self):
         return memoryview(self)
 
+    @classmethod
+    def numpy_dtype(cls) -> "numpy.dtype":
+        """NumPy structured dtype of the message, built once per class."""
+        dtype = cls.__dict__.get("_numpy_dtype")
+        if dtype is None:
+            dtype = ctypes_dtype(cls)
+            cls._numpy_dtype = dtype
+        return dtype
+
+    def as_numpy(self) -> "numpy.ndarray":
+        """0-d structured ndarray over the message memory, fields are ndarray
+        views, e.g. msg.as_numpy()["counts"]. Writes go to the message.
+        """
+        import numpy as np
+
+        return np.frombuffer(self, self.numpy_dtype(), 1).reshape(())
+
     # custom print for message data
     def pretty_print(self, add_tabs=0):
         str = "\t" * add_tabs + f"{type(self).__name__}:"
@@ -129,6 +358,9 @@ class MessageHeader(ctypes.Structure):
         ("reserved", ctypes.c_int),
     ]
 
+    # Same field layout as a struct, for packing headers without ctypes objects
+    header_struct: ClassVar[struct.Struct] = struct.Struct("=iiddhhhhiiii")
+
     @property
     def size(self) -> int:
         return ctypes.sizeof(self)
@@ -151,7 +383,10 @@ class MessageHeader(ctypes.Structure):
 
     @property
     def get_data(self) -> Type[MessageData]:
-        return msg_defs[self.msg_type]
+        msg_cls = message_entry(self.msg_type).msg_cls
+        if msg_cls is None:
+            raise KeyError(self.msg_type)
+        return msg_cls
 
 
 class TimeCodeMessageHeader(MessageHeader):
@@ -160,6 +395,8 @@ class TimeCodeMessageHeader(MessageHeader):
         ("utc_fraction", ctypes.c_uint),
     ]
 
+    header_struct: ClassVar[struct.Struct] = struct.Struct("=iiddhhhhiiiiII")
+
 
 def get_header_cls(timecode: bool = False) -> Type[MessageHeader]:
     if timecode:
@@ -171,21 +408,63 @@ def get_header_cls(timecode: bool = False) -> Type[MessageHeader]:
 @dataclass
 class Message:
     header: MessageHeader
-    data: MessageData
+    # bytes for message types without a definition
+    data: Union[MessageData, bytes]
 
     @property
     def type_id(self) -> int:
-        return self.data.type_id
+        return self.header.msg_type
 
     @property
     def name(self) -> str:
+        if isinstance(self.data, bytes):
+            return ""
         return self.data.type_name
 
+    def copy(self) -> "Message":
+        """Copy of the message that owns its memory, e.g. to keep a zero-copy message past the next read."""
+        if isinstance(self.data, bytes):
+            data = self.data
+        else:
+            data = type(self.data).from_buffer_copy(self.data)
+        return Message(type(self.header).from_buffer_copy(self.header), data)
+
     # custom print for message data
     def pretty_print(self, add_tabs=0):
-        return (
-            self.header.pretty_print(add_tabs) + "\n" + self.data.pretty_print(add_tabs)
-        )
+        if isinstance(self.data, bytes):
+            data = "\t" * add_tabs + f"{len(self.data)} bytes of unknown type"
+        else:
+            data = self.data.pretty_print(add_tabs)
+        return self.header.pretty_print(add_tabs) + "\n" + data
+
+
+class LazyMessage(Message):
+    """Message that keeps its payload as bytes, or as a view into the receive
+    buffer for zero_copy clients, and decodes data on first access.
+    Consumers that only look at the header never build the payload object.
+    """
+
+    def __init__(
+        self, header: MessageHeader, payload, entry: MessageEntry, zero_copy=False
+    ):
+        self.header = header
+        self.payload = payload
+        self._entry = entry
+        self._zero_copy = zero_copy
+        self._data = None
+
+    @property
+    def data(self) -> Union[MessageData, bytes]:
+        if self._data is None:
+            self._data = self._entry.decode(
+                self.payload, 0, len(self.payload), self._zero_copy
+            )
+        return self._data
+
+    @property
+    def name(self) -> str:
+        msg_cls = self._entry.msg_cls
+        return "" if msg_cls is None else msg_cls.type_name
 
 
 # START OF LSB INTERNAL MESSAGE DEFINITIONS
@@ -217,6 +496,7 @@ class CONNECT(MessageData):
 @core_def
 class SUBSCRIBE(MessageData):
     _fields_ = [("msg_type", MSG_TYPE)]
+    data_struct: ClassVar[struct.Struct] = struct.Struct("=i")
     type_id: ClassVar[int] = MT_SUBSCRIBE
     type_name: ClassVar[str] = "SUBSCRIBE"
 
@@ -224,6 +504,7 @@ class SUBSCRIBE(MessageData):
 @core_def
 class UNSUBSCRIBE(MessageData):
     _fields_ = [("msg_type", MSG_TYPE)]
+    data_struct: ClassVar[struct.Struct] = struct.Struct("=i")
     type_id: ClassVar[int] = MT_UNSUBSCRIBE
     type_name: ClassVar[str] = "UNSUBSCRIBE"
 
@@ -231,6 +512,7 @@ class UNSUBSCRIBE(MessageData):
 @core_def
 class PAUSE_SUBSCRIPTION(MessageData):
     _fields_ = [("msg_type", MSG_TYPE)]
+    data_struct: ClassVar[struct.Struct] = struct.Struct("=i")
     type_id: ClassVar[int] = MT_PAUSE_SUBSCRIPTION
     type_name: ClassVar[str] = "PAUSE_SUBSCRIPTION"
 
@@ -238,6 +520,7 @@ class PAUSE_SUBSCRIPTION(MessageData):
 @core_def
 class RESUME_SUBSCRIPTION(MessageData):
     _fields_ = [("msg_type", MSG_TYPE)]
+    data_struct: ClassVar[struct.Struct] = struct.Struct("=i")
     type_id: ClassVar[int] = MT_RESUME_SUBSCRIPTION
     type_name: ClassVar[str] = "RESUME_SUBSCRIPTION"
 
@@ -268,6 +551,7 @@ class FAILED_MESSAGE(MessageData):
 @core_def
 class FORCE_DISCONNECT(MessageData):
     _fields_ = [("mod_id", ctypes.c_int)]
+    data_struct: ClassVar[struct.Struct] = struct.Struct("=i")
     type_id: ClassVar[int] = MT_FORCE_DISCONNECT
     type_name: ClassVar[str] = "FORCE_DISCONNECT"
 
@@ -275,6 +559,7 @@ class FORCE_DISCONNECT(MessageData):
 @core_def
 class MODULE_READY(MessageData):
     _fields_ = [("pid", ctypes.c_int)]
+    data_struct: ClassVar[struct.Struct] = struct.Struct("=i")
     type_id: ClassVar[int] = MT_MODULE_READY
     type_name: ClassVar[str] = "MODULE_READY"
 
@@ -289,6 +574,36 @@ class SAVE_MESSAGE_LOG(MessageData):
     type_name: ClassVar[str] = "SAVE_MESSAGE_LOG"
 
 
+@core_def
+class MESSAGE_LOG_SAVED(MessageData):
+    type_id: ClassVar[int] = MT_MESSAGE_LOG_SAVED
+    type_name: ClassVar[str] = "MESSAGE_LOG_SAVED"
+
+
+@core_def
+class PAUSE_MESSAGE_LOGGING(MessageData):
+    type_id: ClassVar[int] = MT_PAUSE_MESSAGE_LOGGING
+    type_name: ClassVar[str] = "PAUSE_MESSAGE_LOGGING"
+
+
+@core_def
+class RESUME_MESSAGE_LOGGING(MessageData):
+    type_id: ClassVar[int] = MT_RESUME_MESSAGE_LOGGING
+    type_name: ClassVar[str] = "RESUME_MESSAGE_LOGGING"
+
+
+@core_def
+class RESET_MESSAGE_LOG(MessageData):
+    type_id: ClassVar[int] = MT_RESET_MESSAGE_LOG
+    type_name: ClassVar[str] = "RESET_MESSAGE_LOG"
+
+
+@core_def
+class DUMP_MESSAGE_LOG(MessageData):
+    type_id: ClassVar[int] = MT_DUMP_MESSAGE_LOG
+    type_name: ClassVar[str] = "DUMP_MESSAGE_LOG"
+
+
 @core_def
 class TIMING_MESSAGE(MessageData):
     _fields_ = [
@@ -300,6 +615,33 @@ class TIMING_MESSAGE(MessageData):
     type_name: ClassVar[str] = "TIMING_MESSAGE"
 
 
+@core_def
+class SHM_CONNECT(MessageData):
+    _fields_ = [
+        ("name", ctypes.c_char * MAX_SHM_NAME_LENGTH),
+        ("ring_size", ctypes.c_int),
+        ("nonce", ctypes.c_ubyte * SHM_NONCE_LENGTH),
+    ]
+    data_struct: ClassVar[struct.Struct] = struct.Struct(
+        f"={MAX_SHM_NAME_LENGTH}si{SHM_NONCE_LENGTH}s"
+    )
+    type_id: ClassVar[int] = MT_SHM_CONNECT
+    type_name: ClassVar[str] = "SHM_CONNECT"
+
+
+@core_def
+class SHM_CONNECT_CONFIRM(MessageData):
+    type_id: ClassVar[int] = MT_SHM_CONNECT_CONFIRM
+    type_name: ClassVar[str] = "SHM_CONNECT_CONFIRM"
+
+
+@core_def
+class SHM_CONNECT_CANCEL(MessageData):
+    type_id: ClassVar[int] = MT_SHM_CONNECT_CANCEL
+    type_name: ClassVar[str] = "SHM_CONNECT_CANCEL"
+
+
 def AddMessage(msg_type_id: int, msg_cls: Type[MessageData]):
     """Add a user message definition to the LSB module"""
     msg_defs.maps[1][msg_type_id] = msg_cls
+    resolve_entry(msg_type_id)
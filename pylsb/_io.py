@@ -0,0 +1,22 @@
+import os
+import socket
+
+from typing import Sequence
+
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+
+
+def sendmsg(sock: socket.socket, buffers: Sequence[memoryview]) -> int:
+    """Scatter/gather write of buffers with a single syscall.
+    Falls back to one joined send on platforms without sendmsg (Windows).
+    Returns the number of bytes written, which may be less than the total.
+    """
+    if HAS_SENDMSG:
+        return sock.sendmsg(buffers[:IOV_MAX])
+    else:
+        return sock.send(b"".join(buffers[:IOV_MAX]))
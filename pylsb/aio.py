@@ -0,0 +1,597 @@
+import asyncio
+import ctypes
+import os
+import struct
+import time
+
+from ._core import *
+from .constants import *
+from .manager import Module, MessageManager, freeze
+from .client import (
+    ClientError,
+    MessageManagerNotFound,
+    NotConnectedError,
+    ConnectionLost,
+    AcknowledgementTimeout,
+    InvalidDestinationModule,
+    InvalidDestinationHost,
+    MSG_COUNT_MASK,
+    parse_server_name,
+)
+
+from dataclasses import dataclass
+from functools import wraps
+from typing import Callable, List, Optional, Set, Tuple, Type, Union
+
+__all__ = ["AsyncClient", "AsyncMessageManager"]
+
+# Received messages queued before the client stops reading from the socket
+DEFAULT_MAX_QUEUED_MESSAGES = 10000
+
+
+def requires_connection(func):
+    @wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        if not self.connected:
+            raise NotConnectedError
+        else:
+            return await func(self, *args, **kwargs)
+
+    return wrapper
+
+
+class _ClientProtocol(asyncio.Protocol):
+    """Splits the byte stream from the message manager into Messages.
+    Complete messages are put on a queue, None marks a lost connection.
+    """
+
+    def __init__(self, header_cls: Type[MessageHeader], max_queued_messages: int):
+        self.header_cls = header_cls
+        self.header_size = ctypes.sizeof(header_cls)
+        self.num_data_bytes_offset = header_cls.num_data_bytes.offset
+        self.num_data_bytes_struct = struct.Struct("=i")
+        self.max_queued_messages = max_queued_messages
+
+        self.transport = None
+        self.messages = asyncio.Queue()
+        self.buffer = bytearray()
+        self.reading_paused = False
+        self.writing_paused = False
+        self.drain_waiter = None
+        self.lost = False
+
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+
+    def data_received(self, data: bytes):
+        self.buffer += data
+        buffer = self.buffer
+        offset = 0
+        while len(buffer) - offset >= self.header_size:
+            (num_data_bytes,) = self.num_data_bytes_struct.unpack_from(
+                buffer, offset + self.num_data_bytes_offset
+            )
+            frame_size = self.header_size + num_data_bytes
+            if len(buffer) - offset < frame_size:
+                break
+            self.messages.put_nowait(self.decode(buffer, offset, num_data_bytes))
+            offset += frame_size
+        del buffer[:offset]
+
+        if self.messages.qsize() >= self.max_queued_messages:
+            self.transport.pause_reading()
+            self.reading_paused = True
+
+    def decode(self, buffer: bytearray, offset: int, data_size: int) -> Message:
+        header = self.header_cls.from_buffer_copy(buffer, offset)
+        header.recv_time = time.time()
+        offset += self.header_size
+
+        msg_type = header.msg_type
+        entry = msg_registry[msg_type] if 0 <= msg_type < MAX_MESSAGE_TYPES else None
+        if entry is None:
+            entry = resolve_entry(msg_type)
+        return Message(header, entry.decode(buffer, offset, data_size))
+
+    def message_taken(self):
+        if (
+            self.reading_paused
+            and self.messages.qsize() < self.max_queued_messages // 2
+        ):
+            self.reading_paused = False
+            self.transport.resume_reading()
+
+    def connection_lost(self, exc: Optional[Exception]):
+        self.lost = True
+        self.messages.put_nowait(None)
+        self.wake_writer()
+
+    def pause_writing(self):
+        self.writing_paused = True
+
+    def resume_writing(self):
+        self.writing_paused = False
+        self.wake_writer()
+
+    def wake_writer(self):
+        if self.drain_waiter is not None and not self.drain_waiter.done():
+            self.drain_waiter.set_result(None)
+        self.drain_waiter = None
+
+    async def drain(self):
+        """Wait until the transport accepts more data."""
+        if self.lost:
+            raise ConnectionLost
+        if not self.writing_paused:
+            return
+        if self.drain_waiter is None:
+            self.drain_waiter = asyncio.get_running_loop().create_future()
+        await asyncio.shield(self.drain_waiter)
+        if self.lost:
+            raise ConnectionLost
+
+
+class AsyncClient(object):
+    """asyncio counterpart of Client.
+    Sending, reading and waiting for acknowledgements are coroutines, so many
+    clients can share one event loop without polling. Received messages can
+    also be iterated with "async for msg in client" until the connection ends.
+    """
+
+    def __init__(
+        self,
+        module_id: int = 0,
+        host_id: int = 0,
+        timecode: bool = False,
+        max_queued_messages: int = DEFAULT_MAX_QUEUED_MESSAGES,
+    ):
+        self._module_id = module_id
+        self._host_id = host_id
+        self._msg_count = 0
+        self._server = ("", -1)
+        self._connected = False
+        self._header_cls = get_header_cls(timecode)
+        self._max_queued_messages = max_queued_messages
+        self._transport = None
+        self._protocol = None
+
+    async def connect(
+        self,
+        server_name: str = "localhost:7111",
+        logger_status: bool = False,
+        daemon_status: bool = False,
+    ):
+        self._server = parse_server_name(server_name)
+
+        loop = asyncio.get_running_loop()
+        protocol_factory = lambda: _ClientProtocol(
+            self._header_cls, self._max_queued_messages
+        )
+        try:
+            if self.port < 0:
+                self._transport, self._protocol = await loop.create_unix_connection(
+                    protocol_factory, self.ip_addr
+                )
+            else:
+                self._transport, self._protocol = await loop.create_connection(
+                    protocol_factory, self.ip_addr, self.port
+                )
+        except (ConnectionRefusedError, FileNotFoundError) as e:
+            raise MessageManagerNotFound(
+                f"No message manager server responding at {server_name}"
+            ) from e
+        self._connected = True
+
+        msg = CONNECT()
+        msg.logger_status = int(logger_status)
+        msg.daemon_status = int(daemon_status)
+
+        await self.send_message(msg)
+        ack_msg = await self.wait_for_acknowledgement()
+
+        # save own module ID from ACK if asked to be assigned dynamic ID
+        if self._module_id == 0:
+            self._module_id = ack_msg.header.dest_mod_id
+
+    async def disconnect(self):
+        try:
+            if self._connected:
+                await self.send_signal(MT_DISCONNECT)
+                await self.wait_for_acknowledgement(timeout=0.5)
+        except (AcknowledgementTimeout, ConnectionLost):
+            pass
+        finally:
+            if self._transport is not None:
+                self._transport.close()
+            self._connected = False
+
+    @property
+    def server(self) -> Tuple[str, int]:
+        return self._server
+
+    @property
+    def ip_addr(self) -> str:
+        return self._server[0]
+
+    @property
+    def port(self) -> int:
+        return self._server[1]
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    @property
+    def msg_count(self) -> int:
+        return self._msg_count
+
+    @property
+    def module_id(self) -> int:
+        return self._module_id
+
+    @property
+    def header_cls(self) -> Type[MessageHeader]:
+        return self._header_cls
+
+    @requires_connection
+    async def send_module_ready(self):
+        msg = MODULE_READY()
+        msg.pid = os.getpid()
+        await self.send_message(msg)
+
+    async def _subscription_control(self, msg_list: List[int], msg_cls):
+        if not isinstance(msg_list, list):
+            msg_list = [msg_list]
+
+        msg = msg_cls()
+        for msg_type in msg_list:
+            msg.msg_type = msg_type
+            await self.send_message(msg)
+
+    @requires_connection
+    async def subscribe(self, msg_list: List[int]):
+        await self._subscription_control(msg_list, SUBSCRIBE)
+
+    @requires_connection
+    async def unsubscribe(self, msg_list: List[int]):
+        await self._subscription_control(msg_list, UNSUBSCRIBE)
+
+    @requires_connection
+    async def pause_subscription(self, msg_list: List[int]):
+        await self._subscription_control(msg_list, PAUSE_SUBSCRIPTION)
+
+    @requires_connection
+    async def resume_subscription(self, msg_list: List[int]):
+        await self._subscription_control(msg_list, RESUME_SUBSCRIPTION)
+
+    @requires_connection
+    async def send_signal(
+        self,
+        signal_type: int,
+        dest_mod_id: int = 0,
+        dest_host_id: int = 0,
+        timeout: float = -1,
+    ):
+        await self._send(signal_type, None, dest_mod_id, dest_host_id, timeout)
+
+    @requires_connection
+    async def send_message(
+        self,
+        msg_data: MessageData,
+        dest_mod_id: int = 0,
+        dest_host_id: int = 0,
+        timeout: float = -1,
+    ):
+        await self._send(msg_data.type_id, msg_data, dest_mod_id, dest_host_id, timeout)
+
+    async def _send(
+        self,
+        msg_type: int,
+        msg_data: Optional[MessageData],
+        dest_mod_id: int,
+        dest_host_id: int,
+        timeout: float,
+    ):
+        # Verify that the module & host ids are valid
+        if dest_mod_id < 0 or dest_mod_id > MAX_MODULES:
+            raise InvalidDestinationModule(f"Invalid dest_mod_id of [{dest_mod_id}]")
+
+        if dest_host_id < 0 or dest_host_id > MAX_HOSTS:
+            raise InvalidDestinationHost(f"Invalid dest_host_id of [{dest_host_id}]")
+
+        header = self._header_cls()
+        header.msg_type = msg_type
+        header.msg_count = self._msg_count
+        header.send_time = time.time()
+        header.recv_time = 0.0
+        header.src_host_id = self._host_id
+        header.src_mod_id = self._module_id
+        header.dest_host_id = dest_host_id
+        header.dest_mod_id = dest_mod_id
+        header.num_data_bytes = 0 if msg_data is None else ctypes.sizeof(msg_data)
+
+        try:
+            if timeout >= 0:
+                await asyncio.wait_for(self._protocol.drain(), timeout)
+            else:
+                await self._protocol.drain()
+        except asyncio.TimeoutError:
+            # Transport buffer did not drain in time. Drop the packet.
+            print("x", end="")
+            return
+        except ConnectionLost:
+            self._connected = False
+            raise
+
+        # The transport may hold on to the data, so it gets its own copy
+        if msg_data is None:
+            self._transport.write(bytes(header))
+        else:
+            self._transport.write(b"".join((header, msg_data)))
+        self._msg_count = (self._msg_count + 1) & MSG_COUNT_MASK
+
+    @requires_connection
+    async def read_message(
+        self, timeout: Union[int, float] = -1, ack=False
+    ) -> Optional[Message]:
+        """Wait up to timeout seconds (-1 waits forever) for the next message.
+        Returns None on timeout.
+        """
+        messages = self._protocol.messages
+        try:
+            if timeout == 0:
+                msg = messages.get_nowait()
+            elif timeout < 0:
+                msg = await messages.get()
+            else:
+                msg = await asyncio.wait_for(messages.get(), timeout)
+        except (asyncio.QueueEmpty, asyncio.TimeoutError):
+            return None
+
+        if msg is None:
+            # Keep the marker for later reads
+            messages.put_nowait(None)
+            self._connected = False
+            raise ConnectionLost
+
+        self._protocol.message_taken()
+        return msg
+
+    async def wait_for_acknowledgement(self, timeout: float = 3) -> Message:
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout == -1 else loop.time() + timeout
+        while True:
+            time_remaining = -1 if deadline is None else deadline - loop.time()
+            if deadline is not None and time_remaining <= 0:
+                raise AcknowledgementTimeout(
+                    "Failed to receive Acknowlegement from MessageManager"
+                )
+            msg = await self.read_message(timeout=time_remaining, ack=True)
+            if msg is not None and msg.header.msg_type == MT_ACKNOWLEDGE:
+                return msg
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Message:
+        try:
+            return await self.read_message()
+        except (NotConnectedError, ConnectionLost):
+            raise StopAsyncIteration
+
+    def __str__(self) -> str:
+        return f"AsyncClient(module_id={self.module_id}, server={self.server}, connected={self.connected})."
+
+
+def new_event_loop() -> asyncio.AbstractEventLoop:
+    """Event loop for the manager, uvloop if it is installed."""
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.new_event_loop()
+    return uvloop.new_event_loop()
+
+
+@dataclass(eq=False)
+class AsyncModule(Module):
+    """Module connected through an asyncio transport.
+    The transport buffers whatever the socket does not accept, so its write
+    buffer is the outbound queue, bounded by max_queued_bytes for loggers too.
+    """
+
+    def send_message(
+        self,
+        frame: memoryview,
+        snapshot: Callable[[memoryview], memoryview] = freeze,
+    ) -> bool:
+        queued = self.conn.get_write_buffer_size()
+        if queued and queued + frame.nbytes > self.max_queued_bytes:
+            return False
+
+        # The transport may hold on to the data, so it gets the shared snapshot
+        self.conn.write(snapshot(frame))
+        self.queued_bytes = self.conn.get_write_buffer_size()
+        self.writable = not self.queued_bytes
+        return True
+
+    def flush(self) -> bool:
+        self.queued_bytes = self.conn.get_write_buffer_size()
+        self.writable = not self.queued_bytes
+        return self.writable
+
+
+class _ModuleProtocol(asyncio.Protocol):
+    """Connection from a module to the AsyncMessageManager."""
+
+    def __init__(self, manager: "AsyncMessageManager"):
+        self.manager = manager
+        self.module = None
+        self.buffer = bytearray()
+
+    def connection_made(self, transport: asyncio.Transport):
+        self.module = self.manager.accept_transport(transport)
+
+    def data_received(self, data: bytes):
+        self.buffer += data
+        self.manager.receive(self.module, self.buffer)
+
+    def connection_lost(self, exc: Optional[Exception]):
+        self.manager.connection_lost(self.module, exc)
+
+    def pause_writing(self):
+        self.manager.pause_writing(self.module)
+
+    def resume_writing(self):
+        self.manager.flush_module(self.module)
+
+
+class AsyncMessageManager(MessageManager):
+    """MessageManager engine running on an asyncio event loop (uvloop when
+    installed). Every connection has its own buffered transport, so a slow
+    module never blocks routing for the others. Routing itself is the same
+    as MessageManager. Like the select engine waits for a logger that falls
+    behind, reading from all modules is paused while a logger is above the
+    high water mark.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Sockets are watched by the event loop instead
+        self.selector.close()
+        self.stalled_loggers: Set[AsyncModule] = set()
+
+    def accept_transport(self, transport: asyncio.Transport) -> AsyncModule:
+        address = transport.get_extra_info("peername")
+        if not isinstance(address, tuple):
+            address = ("unix", self.unix_path)
+        self.logger.info(f"New connection accepted from {address[0]}:{address[1]}")
+
+        module = AsyncModule(
+            transport, address, self.header_cls, max_queued_bytes=self.send_queue_size
+        )
+        # resume_writing fires once the buffer is back under the high water mark
+        transport.set_write_buffer_limits(high=self.send_queue_high_water)
+        self.modules[transport] = module
+        if self.stalled_loggers:
+            transport.pause_reading()
+        return module
+
+    def receive(self, module: AsyncModule, buffer: bytearray):
+        """Process every complete message in a connection's receive buffer."""
+        header_size = self.header_size
+        offset = 0
+        with memoryview(buffer) as view:
+            while len(buffer) - offset >= header_size:
+                self.header_view[:] = view[offset : offset + header_size]
+                frame_size = header_size + self.header.num_data_bytes
+                if len(buffer) - offset < frame_size:
+                    break
+
+                self.reserve_frame(frame_size - header_size)
+                self.frame_view[:frame_size] = view[offset : offset + frame_size]
+                offset += frame_size
+
+                self.process_message(module)
+                if self.modules.get(module.conn) is not module:
+                    # Disconnected while processing
+                    break
+        del buffer[:offset]
+
+    def connection_lost(self, module: AsyncModule, exc: Optional[Exception]):
+        if self.modules.get(module.conn) is not module:
+            return
+        if exc is None:
+            self.logger.warning(f"DROPPING - {module!s} - Connection closed.")
+        else:
+            self.logger.error(
+                f"Connection Error on read, disconnecting  {module!s} - {exc!s}"
+            )
+        self.disconnect_module(module)
+
+    def close_connection(self, module: Module):
+        module.close()
+        self.resume_logger(module)
+
+    def flush_module(self, module: Module):
+        module.flush()
+        if module.queued_bytes <= self.send_queue_high_water:
+            self.congested_modules.discard(module)
+            self.resume_logger(module)
+
+    def pause_writing(self, module: AsyncModule):
+        """A transport went above the high water mark, pause reading if it is a logger's."""
+        if module.is_logger and module not in self.stalled_loggers:
+            self.stalled_loggers.add(module)
+            if len(self.stalled_loggers) == 1:
+                self.logger.warning(f"PAUSED - waiting for logger {module!s}")
+                self.set_reading(False)
+
+    def resume_logger(self, module: Module):
+        if module in self.stalled_loggers:
+            self.stalled_loggers.discard(module)
+            if not self.stalled_loggers:
+                self.set_reading(True)
+
+    def set_reading(self, reading: bool):
+        for module in self.modules.values():
+            if not isinstance(module, AsyncModule) or module.conn.is_closing():
+                continue
+            if reading and not module.conn.is_reading():
+                module.conn.resume_reading()
+            elif not reading and module.conn.is_reading():
+                module.conn.pause_reading()
+
+    def send_to_loggers(self, header: MessageHeader, frame: memoryview):
+        # Reading is paused while a logger is behind, messages that would
+        # still overflow its queue are dropped and reported like for others
+        for module in self.logger_modules:
+            if not self.send_to_module(module, frame):
+                print("x", end="", flush=True)
+                self.logger.warning(
+                    f"DROPPING - msg_type:{header.msg_type} - {module!s} queue is full"
+                )
+                self.send_failed_message(module, header, time.time())
+
+    def watch_writable(self, module: Module):
+        # Transports flush on their own and report back with resume_writing
+        pass
+
+    def connect_shared_memory(self, src_module: Module, msg: Message):
+        # Refused right away so the client does not wait for a timeout
+        self.logger.info(
+            f"SHM_CONNECT - {src_module!s} - not supported, staying on TCP"
+        )
+        self.send_signal(src_module, MT_SHM_CONNECT_CANCEL)
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        servers = [
+            await loop.create_server(
+                lambda: _ModuleProtocol(self), sock=self.listen_socket
+            )
+        ]
+        for listen_socket in self.listen_sockets[1:]:
+            servers.append(
+                await loop.create_unix_server(
+                    lambda: _ModuleProtocol(self), sock=listen_socket
+                )
+            )
+        try:
+            while self._keep_running:
+                await asyncio.sleep(self.read_timeout)
+        finally:
+            for server in servers:
+                server.close()
+
+    def run(self):
+        loop = new_event_loop()
+        try:
+            loop.run_until_complete(self.serve())
+        except KeyboardInterrupt:
+            self.logger.info("Stopping Message Manager")
+        finally:
+            for mod in list(self.modules.values()):
+                mod.close()
+            self.close_listen_sockets()
+            loop.run_until_complete(asyncio.sleep(0))  # let transports close
+            loop.close()
@@ -3,12 +3,29 @@ import select
 import time
 import os
 import ctypes
+import queue
+import struct
+import threading
 
 from ._core import *
 from .constants import *
+from ._io import sendmsg
+from .shm import ShmChannel, DEFAULT_SHM_RING_SIZE
 
+from contextlib import nullcontext
+from dataclasses import dataclass
 from functools import wraps
-from typing import List, Optional, Tuple, Type, Union, Dict
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
 
 __all__ = [
     "ClientError",
@@ -18,6 +35,8 @@ __all__ = [
     "AcknowledgementTimeout",
     "InvalidDestinationModule",
     "InvalidDestinationHost",
+    "SendStats",
+    "DispatchStats",
     "Client",
 ]
 
@@ -64,10 +83,46 @@ class InvalidDestinationHost(ClientError):
     pass
 
 
+@dataclass
+class SendStats:
+    """Messages and bytes written by a batched send."""
+
+    num_messages: int = 0
+    num_bytes: int = 0
+
+
+@dataclass
+class DispatchStats:
+    """Handler calls made by the dispatcher. Latencies are seconds from the
+    receipt of a message to the start of its handler, including any wait in
+    the main thread queue.
+    """
+
+    num_dispatched: int = 0
+    num_unhandled: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+    max_backlog: int = 0
+
+    @property
+    def mean_latency(self) -> float:
+        return self.total_latency / self.num_dispatched if self.num_dispatched else 0.0
+
+
+def record_latency(stats: DispatchStats, msg: Message):
+    """Count a handler call for msg, received at header.recv_time."""
+    latency = time.time() - msg.header.recv_time
+    stats.num_dispatched += 1
+    stats.total_latency += latency
+    if latency > stats.max_latency:
+        stats.max_latency = latency
+
+
 def requires_connection(func):
     @wraps(func)
     def wrapper(self, *args, **kwargs):
-        if not self.connected:
+        # Attribute rather than property, this runs on every send and read
+        if not self._connected:
             raise NotConnectedError
         else:
             return func(self, *args, **kwargs)
@@ -75,20 +130,109 @@ def requires_connection(func):
     return wrapper
 
 
+# Receive buffers in the ring used by zero-copy clients
+RECV_RING_SIZE = 4
+
+# Seconds to wait for the manager to accept a shared memory transport
+SHM_CONNECT_TIMEOUT = 1.0
+
+# Server names starting with this are Unix domain socket paths
+UNIX_PREFIX = "unix:"
+
+# Messages waiting for the main thread before the dispatcher blocks
+DEFAULT_DISPATCH_QUEUE_SIZE = 1024
+
+# Prebuilt headers kept per (msg type, destination, size), dropped together
+# when there are more, e.g. for a module sending to many destinations
+MAX_HEADER_TEMPLATES = 1024
+
+# msg_count is a C int in the header, it wraps to 0 instead of overflowing
+MSG_COUNT_MASK = 0x7FFFFFFF
+
+
+def parse_server_name(server_name: str) -> Tuple[str, int]:
+    """Split "host:port" into (host, port), "unix:path" gives (path, -1)."""
+    if server_name.startswith(UNIX_PREFIX):
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("Unix domain sockets are not supported on this platform.")
+        return server_name[len(UNIX_PREFIX) :], -1
+    addr, port = server_name.split(":")
+    return addr, int(port)
+
+
 class Client(object):
     def __init__(
         self,
         module_id: int = 0,
         host_id: int = 0,
         timecode: bool = False,
+        read_ahead: bool = True,
+        zero_copy: bool = False,
+        lazy_decode: bool = False,
     ):
         self._module_id = module_id
         self._host_id = host_id
         self._msg_count = 0
         self._server = ("", -1)
         self._connected = False
+        self._shared_memory = False
         self._header_cls = get_header_cls(timecode)
+        self._header_size = ctypes.sizeof(self._header_cls)
+        self._batch_buffer = bytearray()
+
+        # Received bytes are buffered in _recv_buffer[_recv_start:_recv_end]. With
+        # read_ahead every recv_into takes all available data, so several
+        # messages can be parsed per syscall.
+        self._read_ahead = read_ahead
         self._recv_buffer = bytearray(1024**2)
+        self._recv_view = memoryview(self._recv_buffer)
+        self._recv_start = 0
+        self._recv_end = 0
+
+        # In zero_copy mode messages are views into the receive buffer. Instead
+        # of compacting in place, partial messages move on to the next buffer
+        # of a ring, so views stay valid at least until the next read call.
+        self._zero_copy = zero_copy
+        self._recv_ring = [self._recv_buffer]
+        if zero_copy:
+            self._recv_ring += [bytearray(1024**2) for _ in range(RECV_RING_SIZE - 1)]
+        self._recv_ring_index = 0
+        self._recv_rotations = 0
+
+        # Read messages decode their payload on first access of data
+        self._lazy_decode = lazy_decode
+
+        # Frames of dropped types are skipped before anything is decoded
+        self._dropped_types = bytearray(MAX_MESSAGE_TYPES)
+        self._drop_unknown = False
+        self._dropping = False
+
+        self._num_data_bytes_offset = self._header_cls.num_data_bytes.offset
+        self._num_data_bytes_struct = struct.Struct("=i")
+        # remaining_bytes, is_dynamic, reserved (and utc_seconds, utc_fraction)
+        self._header_zeros = (0,) * (5 if timecode else 3)
+
+        # Headers of repeated sends are reused, only msg_count and send_time
+        # (adjacent fields) are packed per send
+        self._header_templates: Dict[Tuple[int, int, int, int], bytearray] = {}
+        self._msg_count_offset = self._header_cls.msg_count.offset
+        self._count_time_struct = struct.Struct("=id")
+        assert self._header_cls.send_time.offset == self._msg_count_offset + 4
+
+        # Handlers by msg_type as (handler, main_thread) tuples, the default
+        # handler takes every message type without one
+        self._handlers = [None] * MAX_MESSAGE_TYPES
+        self._default_handler: Optional[Tuple[Callable, bool]] = None
+        self._dispatcher = None
+        self._dispatcher_stop = None
+        self._dispatcher_error: Optional[Exception] = None
+        self._dispatch_queue = None
+        # Handlers on the dispatcher thread may send, sends take this lock
+        # once a dispatcher was started
+        self._send_lock = nullcontext()
+        # Counted separately by the reader and main threads, without a lock
+        self._reader_stats = DispatchStats()
+        self._main_stats = DispatchStats()
 
     def __del__(self):
         if self._connected:
@@ -103,30 +247,48 @@ class Client(object):
         server_name: str = "localhost:7111",
         logger_status: bool = False,
         daemon_status: bool = False,
+        shared_memory: bool = False,
+        shm_ring_size: int = DEFAULT_SHM_RING_SIZE,
     ):
+        """Connect to the message manager at server_name, "host:port" or
+        "unix:path" for a manager listening on a Unix domain socket.
+        With shared_memory, messages are exchanged through ring buffers in
+        shared memory instead of TCP if the manager runs on this host and
+        supports it, otherwise the client silently stays on TCP (see the
+        shared_memory property).
+        """
+        self._server = parse_server_name(server_name)
+        unix = self.port < 0
 
-        addr, port = server_name.split(":")
-        self._server = (addr, int(port))
+        # Discard anything buffered from a previous connection
+        self._recv_start = self._recv_end = 0
 
-        # Create the tcp socket
-        self._sock = socket.socket(
-            family=socket.AF_INET, type=socket.SOCK_STREAM, proto=socket.IPPROTO_TCP
-        )
+        # Create the tcp (or unix) socket
+        if unix:
+            self._sock = socket.socket(family=socket.AF_UNIX, type=socket.SOCK_STREAM)
+        else:
+            self._sock = socket.socket(
+                family=socket.AF_INET,
+                type=socket.SOCK_STREAM,
+                proto=socket.IPPROTO_TCP,
+            )
 
         # Connect to the message server
         try:
             self._connected = True
-            self._sock.connect(self._server)
-        except ConnectionRefusedError as e:
+            self._sock.connect(self.ip_addr if unix else self._server)
+        except (ConnectionRefusedError, FileNotFoundError) as e:
             self._connected = False
+            self._sock.close()
             raise MessageManagerNotFound(
-                f"No message manager server responding at {self.ip_addr}:{self.port}"
+                f"No message manager server responding at {server_name}"
             ) from e
 
-        # Disable Nagle Algorithm
-        self._sock.setsockopt(socket.getprotobyname("tcp"), socket.TCP_NODELAY, 1)
+        if not unix:
+            # Disable Nagle Algorithm
+            self._sock.setsockopt(socket.getprotobyname("tcp"), socket.TCP_NODELAY, 1)
 
-        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
         msg = CONNECT()
         msg.logger_status = int(logger_status)
@@ -138,9 +300,75 @@ class Client(object):
         # save own module ID from ACK if asked to be assigned dynamic ID
         if self._module_id == 0:
             self._module_id = ack_msg.header.dest_mod_id
+            self._header_templates.clear()
+
+        if shared_memory:
+            self._connect_shared_memory(shm_ring_size)
+
+    def _connect_shared_memory(self, ring_size: int):
+        """Offer the manager a shared memory channel, switching to it once
+        acknowledged and confirmed.
+        """
+        try:
+            channel = ShmChannel.create(self._sock, ring_size)
+        except (ImportError, OSError):
+            return  # No shared memory on this system or Python version
+        msg = SHM_CONNECT()
+        msg.name = channel.name.encode()
+        msg.ring_size = ring_size
+        msg.nonce[:] = channel.nonce
+        self.send_message(msg)
+        reply = self._wait_for_shm_reply()
+        if reply != MT_ACKNOWLEDGE:
+            if reply is None:
+                # Manager that does not know about shared memory at all
+                self._cancel_shared_memory()
+            channel.release()
+            return
+
+        # The manager switches on the confirmation, its acknowledgement is
+        # the last message over TCP
+        self.send_signal(MT_SHM_CONNECT_CONFIRM)
+        self.wait_for_acknowledgement()
+        self._sock = channel
+        self._shared_memory = True
+
+    def _wait_for_shm_reply(self) -> Optional[int]:
+        """Wait for the manager to acknowledge or refuse a shared memory channel.
+        Returns MT_ACKNOWLEDGE, MT_SHM_CONNECT_CANCEL or None on timeout.
+        """
+        deadline = time.perf_counter() + SHM_CONNECT_TIMEOUT
+        while True:
+            time_remaining = deadline - time.perf_counter()
+            if time_remaining <= 0:
+                return None
+            msg = self.read_message(timeout=time_remaining, ack=True)
+            if msg is not None and msg.header.msg_type in (
+                MT_ACKNOWLEDGE,
+                MT_SHM_CONNECT_CANCEL,
+            ):
+                return msg.header.msg_type
+
+    def _cancel_shared_memory(self):
+        """Tell the manager to drop the channel and discard messages up to its
+        echo of the cancel, which includes an acknowledgement that came too late.
+        """
+        self.send_signal(MT_SHM_CONNECT_CANCEL)
+        deadline = time.perf_counter() + SHM_CONNECT_TIMEOUT
+        while True:
+            time_remaining = deadline - time.perf_counter()
+            if time_remaining <= 0:
+                return  # The manager does not know about shared memory at all
+            msg = self.read_message(timeout=time_remaining, ack=True)
+            if msg is not None and msg.header.msg_type == MT_SHM_CONNECT_CANCEL:
+                return
 
     def disconnect(self):
+        """Stop the dispatcher and leave the manager. An exception that ended
+        the dispatcher is not raised here, stop_dispatcher() still raises it.
+        """
         try:
+            self._stop_dispatcher_thread()
             if self._connected:
                 self.send_signal(MT_DISCONNECT)
                 ack_msg = self.wait_for_acknowledgement(timeout=0.5)
@@ -149,6 +377,7 @@ class Client(object):
         finally:
             self._sock.close()
             self._connected = False
+            self._shared_memory = False
 
     @property
     def server(self) -> Tuple[str, int]:
@@ -166,6 +395,11 @@ class Client(object):
     def connected(self) -> bool:
         return self._connected
 
+    @property
+    def shared_memory(self) -> bool:
+        """True if messages go through shared memory instead of TCP."""
+        return self._shared_memory
+
     @property
     def msg_count(self) -> int:
         return self._msg_count
@@ -189,19 +423,18 @@ class Client(object):
             msg_list = [msg_list]
 
         if ctrl_msg == "Subscribe":
-            msg = SUBSCRIBE()
+            msg_cls = SUBSCRIBE
         elif ctrl_msg == "Unsubscribe":
-            msg = UNSUBSCRIBE()
+            msg_cls = UNSUBSCRIBE
         elif ctrl_msg == "PauseSubscription":
-            msg = PAUSE_SUBSCRIPTION()
+            msg_cls = PAUSE_SUBSCRIPTION
         elif ctrl_msg == "ResumeSubscription":
-            msg = RESUME_SUBSCRIPTION()
+            msg_cls = RESUME_SUBSCRIPTION
         else:
             raise TypeError("Unknown control message type.")
 
         for msg_type in msg_list:
-            msg.msg_type = msg_type
-            self.send_message(msg)
+            self.send_values(msg_cls, msg_type)
 
     @requires_connection
     def subscribe(self, msg_list: List[int]):
@@ -219,6 +452,40 @@ class Client(object):
     def resume_subscription(self, msg_list: List[int]):
         self._subscription_control(msg_list, "ResumeSubscription")
 
+    def _new_header_template(
+        self, msg_type: int, dest_mod_id: int, dest_host_id: int, data_size: int
+    ) -> bytearray:
+        """Header for repeated sends of a type to a destination, with msg_count
+        and send_time left to be packed on each send.
+        """
+        # Verify that the module & host ids are valid
+        if dest_mod_id < 0 or dest_mod_id > MAX_MODULES:
+            raise InvalidDestinationModule(f"Invalid dest_mod_id of [{dest_mod_id}]")
+
+        if dest_host_id < 0 or dest_host_id > MAX_HOSTS:
+            raise InvalidDestinationHost(f"Invalid dest_host_id of [{dest_host_id}]")
+
+        if len(self._header_templates) >= MAX_HEADER_TEMPLATES:
+            self._header_templates.clear()
+        header = bytearray(self._header_size)
+        self._header_cls.header_struct.pack_into(
+            header,
+            0,
+            msg_type,
+            0,
+            0.0,
+            0.0,
+            self._host_id,
+            self._module_id,
+            dest_host_id,
+            dest_mod_id,
+            data_size,
+            *self._header_zeros,
+        )
+        key = (msg_type, dest_mod_id, dest_host_id, data_size)
+        self._header_templates[key] = header
+        return header
+
     @requires_connection
     def send_signal(
         self,
@@ -227,41 +494,25 @@ class Client(object):
         dest_host_id: int = 0,
         timeout: float = -1,
     ):
-
-        # Verify that the module & host ids are valid
-        if dest_mod_id < 0 or dest_mod_id > MAX_MODULES:
-            raise InvalidDestinationModule(f"Invalid dest_mod_id  of [{dest_mod_id}]")
-
-        if dest_host_id < 0 or dest_host_id > MAX_HOSTS:
-            raise InvalidDestinationHost(f"Invalid dest_host_id of [{dest_host_id}]")
-
-        # Assume that msg_type, num_data_bytes, data - have been filled in
-        header = self._header_cls()
-        header.msg_type = signal_type
-        header.msg_count = self._msg_count
-        header.send_time = time.time()
-        header.recv_time = 0.0
-        header.src_host_id = self._host_id
-        header.src_mod_id = self._module_id
-        header.dest_host_id = dest_host_id
-        header.dest_mod_id = dest_mod_id
-        header.num_data_bytes = 0
-
-        if timeout >= 0:
-            readfds, writefds, exceptfds = select.select([], [self._sock], [], timeout)
-        else:
-            readfds, writefds, exceptfds = select.select(
-                [], [self._sock], []
-            )  # blocking
-
-        if writefds:
-            self._sendall(header)
-
-            self._msg_count += 1
-
-        else:
-            # Socket was not ready to receive data. Drop the packet.
-            print("x", end="")
+        with self._send_lock:
+            header = self._header_templates.get(
+                (signal_type, dest_mod_id, dest_host_id, 0)
+            )
+            if header is None:
+                header = self._new_header_template(
+                    signal_type, dest_mod_id, dest_host_id, 0
+                )
+
+            if timeout >= 0 and not self._wait_writable(timeout):
+                # Socket was not ready to receive data. Drop the packet.
+                print("x", end="")
+                return
+
+            self._count_time_struct.pack_into(
+                header, self._msg_count_offset, self._msg_count, time.time()
+            )
+            self._sendall((header,), self._header_size)
+            self._msg_count = (self._msg_count + 1) & MSG_COUNT_MASK
 
     @requires_connection
     def send_message(
@@ -271,6 +522,79 @@ class Client(object):
         dest_host_id: int = 0,
         timeout: float = -1,
     ):
+        data_size = ctypes.sizeof(msg_data)
+        key = (msg_data.type_id, dest_mod_id, dest_host_id, data_size)
+        with self._send_lock:
+            header = self._header_templates.get(key)
+            if header is None:
+                header = self._new_header_template(*key)
+
+            if timeout >= 0 and not self._wait_writable(timeout):
+                # Socket was not ready to receive data. Drop the packet.
+                print("x", end="")
+                return
+
+            self._count_time_struct.pack_into(
+                header, self._msg_count_offset, self._msg_count, time.time()
+            )
+            # Header and payload go out together in one syscall
+            self._sendall((header, msg_data), self._header_size + data_size)
+            self._msg_count = (self._msg_count + 1) & MSG_COUNT_MASK
+
+    @requires_connection
+    def send_values(
+        self,
+        msg_cls: Type[MessageData],
+        *values,
+        dest_mod_id: int = 0,
+        dest_host_id: int = 0,
+        timeout: float = -1,
+    ):
+        """Send a message of msg_cls packed from its field values with
+        msg_cls.data_struct, without creating a ctypes object.
+        """
+        data_struct = msg_cls.data_struct
+        if data_struct is None:
+            raise TypeError(f"{msg_cls.__name__} has no data_struct")
+
+        key = (msg_cls.type_id, dest_mod_id, dest_host_id, data_struct.size)
+        with self._send_lock:
+            header = self._header_templates.get(key)
+            if header is None:
+                header = self._new_header_template(*key)
+
+            if len(self._batch_buffer) < data_struct.size:
+                self._batch_buffer = bytearray(data_struct.size)
+            data_struct.pack_into(self._batch_buffer, 0, *values)
+
+            if timeout >= 0 and not self._wait_writable(timeout):
+                # Socket was not ready to receive data. Drop the packet.
+                print("x", end="")
+                return
+
+            self._count_time_struct.pack_into(
+                header, self._msg_count_offset, self._msg_count, time.time()
+            )
+            with memoryview(self._batch_buffer) as view:
+                self._sendall(
+                    (header, view[: data_struct.size]),
+                    self._header_size + data_struct.size,
+                )
+            self._msg_count = (self._msg_count + 1) & MSG_COUNT_MASK
+
+    @requires_connection
+    def send_messages(
+        self,
+        messages: Iterable[MessageData],
+        dest_mod_id: int = 0,
+        dest_host_id: int = 0,
+        timeout: float = -1,
+    ) -> SendStats:
+        """Send a batch of messages to the same destination.
+        All headers are packed into one reusable buffer and get consecutive
+        msg_count values, then the batch is written with as few sendmsg calls
+        as possible.
+        """
         # Verify that the module & host ids are valid
         if dest_mod_id < 0 or dest_mod_id > MAX_MODULES:
             raise InvalidDestinationModule(f"Invalid dest_mod_id of [{dest_mod_id}]")
@@ -278,91 +602,306 @@ class Client(object):
         if dest_host_id < 0 or dest_host_id > MAX_HOSTS:
             raise InvalidDestinationHost(f"Invalid dest_host_id of [{dest_host_id}]")
 
-        # Assume that msg_type, num_data_bytes, data - have been filled in
-        header = self._header_cls()
-        header.msg_type = msg_data.type_id
-        header.msg_count = self._msg_count
-        header.send_time = time.time()
-        header.recv_time = 0.0
-        header.src_host_id = self._host_id
-        header.src_mod_id = self._module_id
-        header.dest_host_id = dest_host_id
-        header.dest_mod_id = dest_mod_id
-        header.num_data_bytes = ctypes.sizeof(msg_data)
-
-        if timeout >= 0:
-            readfds, writefds, exceptfds = select.select([], [self._sock], [], timeout)
-        else:
-            readfds, writefds, exceptfds = select.select(
-                [], [self._sock], []
-            )  # blocking
-
-        if writefds:
-            self._sendall(header)
-            if header.num_data_bytes > 0:
-                self._sendall(msg_data)
+        messages = list(messages)
+        if not messages:
+            return SendStats()
+
+        with self._send_lock:
+            header_size = self._header_size
+            if len(self._batch_buffer) < len(messages) * header_size:
+                self._batch_buffer = bytearray(len(messages) * header_size)
+            header_view = memoryview(self._batch_buffer)
+
+            pack_into = self._header_cls.header_struct.pack_into
+            zeros = self._header_zeros
+            send_time = time.time()
+
+            buffers = []
+            nbytes = 0
+            for n, msg_data in enumerate(messages):
+                offset = n * header_size
+                data_size = ctypes.sizeof(msg_data)
+                pack_into(
+                    self._batch_buffer,
+                    offset,
+                    msg_data.type_id,
+                    (self._msg_count + n) & MSG_COUNT_MASK,
+                    send_time,
+                    0.0,
+                    self._host_id,
+                    self._module_id,
+                    dest_host_id,
+                    dest_mod_id,
+                    data_size,
+                    *zeros,
+                )
+                buffers.append(header_view[offset : offset + header_size])
+                if data_size:
+                    buffers.append(msg_data)
+                nbytes += header_size + data_size
+
+            if timeout >= 0 and not self._wait_writable(timeout):
+                # Socket was not ready to receive data. Drop the batch.
+                print("x", end="")
+                return SendStats()
+
+            self._sendall(buffers, nbytes)
+            self._msg_count = (self._msg_count + len(messages)) & MSG_COUNT_MASK
+        return SendStats(len(messages), nbytes)
 
-            self._msg_count += 1
+    @requires_connection
+    def send_frames(self, buffers: Sequence, nbytes: int):
+        """Send nbytes of complete message frames from buffers as they are,
+        e.g. recorded ones. Headers are not restamped and msg_count is unchanged.
+        """
+        with self._send_lock:
+            self._sendall(buffers, nbytes)
 
-        else:
-            # Socket was not ready to receive data. Drop the packet.
-            print("x", end="")
+    def _wait_writable(self, timeout: float) -> bool:
+        if self._shared_memory:
+            return self._sock.wait_writable(timeout)
+        readfds, writefds, exceptfds = select.select([], [self._sock], [], timeout)
+        return bool(writefds)
 
-    def _sendall(self, buffer: bytearray):
+    def _sendall(self, buffers: Sequence, nbytes: int):
+        """Write nbytes from buffers to the socket with as few sendmsg calls as possible."""
         try:
-            self._sock.sendall(buffer)
+            sent = sendmsg(self._sock, buffers)
+            if sent == nbytes:
+                return
+
+            # Short write, only happens with large messages on a blocking socket
+            views = [memoryview(buffer).cast("B") for buffer in buffers]
+            while views:
+                n = 0
+                while n < len(views) and sent >= views[n].nbytes:
+                    sent -= views[n].nbytes
+                    n += 1
+                del views[:n]
+                if views:
+                    views[0] = views[0][sent:]
+                    sent = sendmsg(self._sock, views)
         except ConnectionError as e:
             self._connected = False
             raise ConnectionLost from e
 
+    def drop_types(self, msg_types: Iterable[int] = (), unknown: bool = False):
+        """Skip received messages of msg_types, and of types without a
+        definition if unknown, without building any object for them.
+        Replaces the previously dropped types.
+        """
+        self._dropped_types[:] = bytes(MAX_MESSAGE_TYPES)
+        for msg_type in msg_types:
+            self._dropped_types[msg_type] = 1
+        self._drop_unknown = unknown
+        self._dropping = unknown or any(self._dropped_types)
+
     @requires_connection
     def read_message(
         self, timeout: Union[int, float] = -1, ack=False
     ) -> Optional[Message]:
+        """Read the next message, waiting up to timeout seconds (-1 blocks).
+        For zero_copy clients the header and data are views into the receive
+        buffer, only valid until the next read. Use Message.copy() to keep them.
+        """
+        deadline = time.monotonic() + timeout if timeout > 0 else None
+        while True:
+            # Messages already buffered by an earlier read do not need a syscall
+            if not self._frame_available():
+                if deadline is not None:
+                    timeout = max(deadline - time.monotonic(), 0)
+                if not self._wait_readable(timeout):
+                    return None
+
+                # Socket is readable, block until a complete message is buffered
+                while not self._frame_available():
+                    self._fill_recv_buffer()
+
+            msg = self._pop_message()
+            if msg is not None:
+                return msg
+
+    @requires_connection
+    def read_messages(
+        self, max_count: Optional[int] = None, timeout: Union[int, float] = 0
+    ) -> List[Message]:
+        """Read every complete message available, up to max_count.
+        Waits up to timeout seconds (-1 blocks) for the first message, the rest
+        is drained from the receive buffer with bulk reads. Returns an empty
+        list on timeout.
+        """
+        messages = []
+        if max_count == 0:
+            return messages
+
+        if not self._frame_available() and not self._wait_readable(timeout):
+            return messages
+
+        first_rotation = self._recv_rotations
+        popped = 0  # including dropped messages
+        while max_count is None or len(messages) < max_count:
+            if self._frame_available():
+                msg = self._pop_message()
+                popped += 1
+                if msg is not None:
+                    messages.append(msg)
+            elif popped and not self._wait_readable(0):
+                # Nothing more to read without blocking, keep partial messages for later
+                break
+            elif (
+                self._zero_copy
+                and messages
+                and self._recv_rotations - first_rotation >= len(self._recv_ring) - 1
+            ):
+                # Going around the ring again would overwrite views in this batch,
+                # copied messages can span any number of fills
+                break
+            else:
+                self._fill_recv_buffer()
+
+        return messages
+
+    def wait_readable(self, timeout: Union[int, float] = -1) -> bool:
+        """Wait up to timeout seconds (-1 blocks) for data from the manager.
+        Messages already in the receive buffer are not counted.
+        """
+        return self._wait_readable(timeout)
+
+    def recv_frames_into(self, view: memoryview, nbytes: int) -> int:
+        """Receive up to nbytes of raw message frames into view, bypassing
+        the receive buffer. Only for clients that never read messages, like
+        QuickLogger. Raises ConnectionLost once the manager closed.
+        """
+        try:
+            received = self._sock.recv_into(view, nbytes)
+        except ConnectionError as e:
+            self._connected = False
+            raise ConnectionLost from e
+        if received == 0:
+            self._connected = False
+            raise ConnectionLost
+        return received
+
+    def set_recv_buffer_size(self, size: int):
+        """Ask for a socket receive buffer of size bytes, best effort. Shared
+        memory channels keep their ring size.
+        """
+        if isinstance(self._sock, socket.socket):
+            try:
+                self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, size)
+            except OSError:
+                pass
+
+    def _wait_readable(self, timeout: Union[int, float]) -> bool:
+        if self._shared_memory:
+            return self._sock.wait_readable(timeout)
         if timeout >= 0:
             readfds, writefds, exceptfds = select.select([self._sock], [], [], timeout)
         else:
             readfds, writefds, exceptfds = select.select(
                 [self._sock], [], []
             )  # blocking
+        return bool(readfds)
+
+    def _frame_size(self) -> int:
+        """Size of the next message in the receive buffer, 0 if its header is incomplete."""
+        if self._recv_end - self._recv_start < self._header_size:
+            return 0
+        (num_data_bytes,) = self._num_data_bytes_struct.unpack_from(
+            self._recv_buffer, self._recv_start + self._num_data_bytes_offset
+        )
+        return self._header_size + num_data_bytes
 
-        # Read LSB Header Section
-        if readfds:
-            header = self._header_cls()
-            try:
-                nbytes = self._sock.recv_into(header, header.size, socket.MSG_WAITALL)
-                """
-                Note:
-                MSG_WAITALL Flag:
-                The receive request will complete only when one of the following events occurs:
-                The buffer supplied by the caller is completely full.
-                The connection has been closed.
-                The request has been canceled or an error occurred.
-                """
-
-                if nbytes != header.size:
-                    self._connected = False
-                    raise ConnectionLost
-
-                header.recv_time = time.time()
-            except ConnectionError:
-                raise ConnectionLost
+    def _frame_available(self) -> bool:
+        frame_size = self._frame_size()
+        return 0 < frame_size <= self._recv_end - self._recv_start
+
+    def _fill_recv_buffer(self):
+        """Receive more data into the receive buffer with a single recv_into.
+        In read-ahead mode this takes as much as the socket has buffered,
+        otherwise only the rest of the current message.
+        """
+        buffered = self._recv_end - self._recv_start
+        needed = (self._frame_size() or self._header_size) - buffered
+
+        if len(self._recv_buffer) - self._recv_end < needed:
+            # Move the partial message to the front of the next ring buffer (the
+            # same buffer unless zero_copy), growing it for large messages
+            self._recv_ring_index = (self._recv_ring_index + 1) % len(self._recv_ring)
+            self._recv_rotations += 1
+            recv_buffer = self._recv_ring[self._recv_ring_index]
+            if len(recv_buffer) < buffered + needed:
+                recv_buffer = bytearray(max(buffered + needed, 2 * len(recv_buffer)))
+                self._recv_ring[self._recv_ring_index] = recv_buffer
+            # memoryview assignment copies without a temporary, also when overlapping
+            recv_view = memoryview(recv_buffer)
+            recv_view[:buffered] = self._recv_view[self._recv_start : self._recv_end]
+            self._recv_buffer = recv_buffer
+            self._recv_view = recv_view
+            self._recv_start = 0
+            self._recv_end = buffered
+
+        if self._read_ahead:
+            nbytes = len(self._recv_buffer) - self._recv_end
         else:
+            nbytes = needed
+
+        try:
+            received = self._sock.recv_into(
+                self._recv_view[self._recv_end : self._recv_end + nbytes], nbytes
+            )
+        except ConnectionError as e:
+            self._connected = False
+            raise ConnectionLost from e
+
+        if received == 0:
+            self._connected = False
+            raise ConnectionLost
+
+        self._recv_end += received
+
+    def _pop_message(self) -> Optional[Message]:
+        """Build a Message from the complete frame at the front of the receive
+        buffer, None if its type is dropped.
+        """
+        offset = self._recv_start
+        # msg_type is the first header field
+        (msg_type,) = self._num_data_bytes_struct.unpack_from(self._recv_buffer, offset)
+        entry = msg_registry[msg_type] if 0 <= msg_type < MAX_MESSAGE_TYPES else None
+        if entry is None:
+            entry = resolve_entry(msg_type)
+
+        if self._dropping and (
+            (self._drop_unknown and entry.msg_cls is None)
+            or (0 <= msg_type < MAX_MESSAGE_TYPES and self._dropped_types[msg_type])
+        ):
+            self._recv_start = offset + self._frame_size()
+            if self._recv_start == self._recv_end and not self._zero_copy:
+                self._recv_start = self._recv_end = 0
             return None
 
-        # Read Data Section
-        data = header.get_data()
-        if header.num_data_bytes:
-            try:
-                nbytes = self._sock.recv_into(data, data.size, socket.MSG_WAITALL)
+        if self._zero_copy:
+            header = self._header_cls.from_buffer(self._recv_buffer, offset)
+        else:
+            header = self._header_cls.from_buffer_copy(self._recv_buffer, offset)
+        header.recv_time = time.time()
+        offset += self._header_size
+
+        data_size = header.num_data_bytes
+        if self._lazy_decode:
+            payload = self._recv_view[offset : offset + data_size]
+            if not self._zero_copy:
+                payload = bytes(payload)
+            msg = LazyMessage(header, payload, entry, self._zero_copy)
+        else:
+            data = entry.decode(self._recv_buffer, offset, data_size, self._zero_copy)
+            msg = Message(header, data)
 
-                if nbytes != data.size:
-                    self._connected = False
-                    raise ConnectionLost
-            except ConnectionError:
-                raise ConnectionLost
+        self._recv_start = offset + data_size
+        if self._recv_start == self._recv_end and not self._zero_copy:
+            self._recv_start = self._recv_end = 0
 
-        return Message(header, data)
+        return msg
 
     def wait_for_acknowledgement(self, timeout: float = 3):
         ret = 0
@@ -397,15 +936,181 @@ class Client(object):
         """Read and discard messages in socket buffer up to timeout.
         Returns: True if all messages available have been read.
         """
-        msg = 1
-        time_remaining = timeout
         start_time = time.perf_counter()
-        while msg is not None and time_remaining > 0:
-            msg = self.read_message(timeout=0)
-            time_now = time.perf_counter()
-            time_waited = time_now - start_time
-            time_remaining = timeout - time_waited
-        return not msg
+        while time.perf_counter() - start_time < timeout:
+            if not self.read_messages(timeout=0):
+                return True
+        return False
+
+    def on(
+        self,
+        msg_type: Union[int, Type[MessageData], None],
+        handler: Optional[Callable[[Message], None]],
+        main_thread: bool = False,
+    ):
+        """Call handler(msg) from the dispatcher for every message of msg_type,
+        an id or a message class. With msg_type None, handler takes every
+        type that has no handler of its own. With main_thread, messages are
+        queued for dispatch_pending() instead of handled on the reader thread.
+        A handler of None removes the current one.
+        """
+        if msg_type is not None and not isinstance(msg_type, int):
+            msg_type = msg_type.type_id
+        entry = None if handler is None else (handler, main_thread)
+        if msg_type is None:
+            self._default_handler = entry
+        else:
+            self._handlers[msg_type] = entry
+
+    @requires_connection
+    def start_dispatcher(
+        self,
+        queue_size: int = DEFAULT_DISPATCH_QUEUE_SIZE,
+        read_timeout: float = 0.1,
+    ):
+        """Read messages on a background thread and call their handlers (see on).
+        Up to queue_size messages wait for dispatch_pending(), beyond that
+        the reader blocks. While it runs, no other thread should read messages.
+        Sends are serialized with a lock from then on, handlers may send.
+        """
+        if self._dispatcher is not None:
+            raise ClientError("Dispatcher already running.")
+        if self._dispatch_queue is None or self._dispatch_queue.maxsize != queue_size:
+            self._dispatch_queue = queue.Queue(maxsize=queue_size)
+        self._reader_stats = DispatchStats()
+        self._main_stats = DispatchStats()
+        if isinstance(self._send_lock, nullcontext):
+            self._send_lock = threading.Lock()
+        self._dispatcher_stop = threading.Event()
+        self._dispatcher_error = None
+        self._dispatcher = threading.Thread(
+            target=self._dispatch_loop,
+            args=(read_timeout,),
+            name=f"pylsb-dispatcher-{self._module_id}",
+            daemon=True,
+        )
+        self._dispatcher.start()
+
+    def stop_dispatcher(self, timeout: Optional[float] = None):
+        """Stop the dispatcher thread, re-raising the exception that ended it
+        early, from a handler or e.g. ConnectionLost, also after disconnect().
+        Messages already queued for the main thread stay available to
+        dispatch_pending().
+        """
+        self._stop_dispatcher_thread(timeout)
+        error, self._dispatcher_error = self._dispatcher_error, None
+        if error is not None:
+            raise error
+
+    def _stop_dispatcher_thread(self, timeout: Optional[float] = None):
+        dispatcher = self._dispatcher
+        if dispatcher is None:
+            return
+        self._dispatcher_stop.set()
+        # A handler may stop the dispatcher, e.g. by disconnecting on EXIT
+        if dispatcher is not threading.current_thread():
+            dispatcher.join(timeout)
+        self._dispatcher = None
+
+    @property
+    def dispatcher_running(self) -> bool:
+        return self._dispatcher is not None and self._dispatcher.is_alive()
+
+    @property
+    def dispatch_stats(self) -> DispatchStats:
+        """Counters of the current (or last) dispatcher so far."""
+        reader, main = self._reader_stats, self._main_stats
+        return DispatchStats(
+            num_dispatched=reader.num_dispatched + main.num_dispatched,
+            num_unhandled=reader.num_unhandled,
+            total_latency=reader.total_latency + main.total_latency,
+            max_latency=max(reader.max_latency, main.max_latency),
+            max_backlog=reader.max_backlog,
+        )
+
+    @property
+    def dispatch_backlog(self) -> int:
+        """Messages queued for the main thread and not yet dispatched."""
+        return 0 if self._dispatch_queue is None else self._dispatch_queue.qsize()
+
+    def dispatch_pending(
+        self, max_count: Optional[int] = None, timeout: Union[int, float] = 0
+    ) -> int:
+        """Call the main_thread handlers of queued messages on this thread, up
+        to max_count. Waits up to timeout seconds (-1 blocks) for the first
+        message. Returns the number of handlers called.
+        """
+        dispatch_queue = self._dispatch_queue
+        if dispatch_queue is None:
+            return 0
+        count = 0
+        while max_count is None or count < max_count:
+            try:
+                if count or timeout == 0:
+                    handler, msg = dispatch_queue.get_nowait()
+                else:
+                    handler, msg = dispatch_queue.get(
+                        timeout=None if timeout < 0 else timeout
+                    )
+            except queue.Empty:
+                break
+            record_latency(self._main_stats, msg)
+            handler(msg)
+            count += 1
+        return count
+
+    def _dispatch_loop(self, read_timeout: float):
+        try:
+            stop = self._dispatcher_stop
+            while not stop.is_set():
+                for msg in self.read_messages(timeout=read_timeout):
+                    # A handler may have stopped the dispatcher or disconnected
+                    if stop.is_set():
+                        return
+                    self._dispatch(msg, read_timeout)
+        except Exception as e:
+            self._dispatcher_error = e
+
+    def _dispatch(self, msg: Message, read_timeout: float):
+        msg_type = msg.header.msg_type
+        entry = self._handlers[msg_type] if 0 <= msg_type < MAX_MESSAGE_TYPES else None
+        if entry is None:
+            entry = self._default_handler
+            if entry is None:
+                self._reader_stats.num_unhandled += 1
+                return
+
+        handler, main_thread = entry
+        if main_thread:
+            self._queue_for_main_thread(handler, msg, read_timeout)
+        else:
+            # record_latency inlined, this runs for every message
+            latency = time.time() - msg.header.recv_time
+            stats = self._reader_stats
+            stats.num_dispatched += 1
+            stats.total_latency += latency
+            if latency > stats.max_latency:
+                stats.max_latency = latency
+            handler(msg)
+
+    def _queue_for_main_thread(
+        self, handler: Callable[[Message], None], msg: Message, read_timeout: float
+    ):
+        # Views into the receive buffer do not outlive the next read
+        if self._zero_copy:
+            msg = msg.copy()
+        dispatch_queue = self._dispatch_queue
+        while True:
+            try:
+                dispatch_queue.put((handler, msg), timeout=read_timeout)
+                break
+            except queue.Full:
+                if self._dispatcher_stop.is_set():
+                    return
+        stats = self._reader_stats
+        backlog = dispatch_queue.qsize()
+        if backlog > stats.max_backlog:
+            stats.max_backlog = backlog
 
     def __str__(self) -> str:
         # TODO: Make this better.
@@ -1,8 +1,17 @@
-from io import TextIOWrapper
+import ctypes
+import functools
+import hashlib
+import importlib.util
+import os
 import re
+import struct
+import sys
+
+from types import ModuleType
 from typing import List, Dict, Optional
 
-from ._core import ctypes_map
+from . import __version__, constants
+from ._core import ctypes_map, user_msg_defs
 
 
 def camelcase(name):
@@ -154,13 +163,80 @@ def generate_constant(name, value):
     return f"{name} = {value}"
 
 
+def evaluate(expression: str, values: Dict) -> Optional[int]:
+    """Value of a constant expression at compile time, None if it uses
+    names that are not known yet.
+    """
+    try:
+        value = eval(expression, {"__builtins__": {}}, values)
+    except Exception:
+        return None
+    if not isinstance(value, (int, float)):
+        return None
+    return int(value) if re.search(r"/", expression) else value
+
+
+def ctype_format(ctype) -> str:
+    """struct code of a ctypes simple type, standard size ("=") matching ctypes.sizeof."""
+    code = ctype._type_
+    size = ctypes.sizeof(ctype)
+    if struct.calcsize("=" + code) != size:
+        code = {1: "b", 2: "h", 4: "i", 8: "q"}[size]
+        if ctype._type_.isupper():
+            code = code.upper()
+    return code
+
+
+def field_format(ftyp: str, flen: Optional[str], values: Dict, formats: Dict):
+    """struct format of a field, None if its type or length can not be resolved."""
+    if ftyp.startswith("ctypes."):
+        ctype = getattr(ctypes, ftyp[len("ctypes.") :], None)
+        if ctype is None:
+            return None
+        fmt = ctype_format(ctype)
+    else:
+        fmt = formats.get(ftyp)
+        if fmt is None:
+            return None
+
+    if not flen:
+        return fmt
+    length = evaluate(flen, values)
+    if not isinstance(length, int) or length < 0:
+        return None
+    if fmt == "c":
+        # char arrays are one bytes value
+        return f"{length}s"
+    if len(fmt) == 1:
+        return f"{length}{fmt}"
+    return fmt * length
+
+
+def struct_format(fields, values: Dict, formats: Dict) -> Optional[str]:
+    """struct format of a packed struct, nested structs and arrays flattened."""
+    fmts = [field_format(ftyp, flen, values, formats) for _, ftyp, flen in fields]
+    if None in fmts:
+        return None
+    return "".join(fmts)
+
+
+def array_length(flen: Optional[str]) -> Optional[str]:
+    """Array length expression for a ctypes field, C int division and one
+    dimension for compound expressions (c_int * A * B would nest arrays).
+    """
+    if flen and re.search(r"/", flen):
+        return "int(" + flen + ")"
+    if flen and not re.fullmatch(r"\w+", flen.strip()):
+        return "(" + flen + ")"
+    return flen
+
+
 def generate_struct(name: str, fields):
     assert not name.startswith("MDF_")
     f = []
     fnum = len(fields)
     for i, (fname, ftyp, flen) in enumerate(fields, start=1):
-        if flen and re.search(r"/", flen):
-            flen = "int(" + flen + ")"
+        flen = array_length(flen)
         nl = ",\n" if i < fnum else ""
         f.append(f"        (\"{fname}\", {ftyp}{' * ' + flen if flen else ''}){nl}")
 
@@ -177,21 +253,23 @@ class {name}(ctypes.Structure):
     return template
 
 
-def generate_msg_def(name: str, fields):
+def generate_msg_def(name: str, fields, data_format: Optional[str] = None):
     assert name.startswith("MDF_")
 
     basename = name[4:]
     f = []
     fnum = len(fields)
     for i, (fname, ftyp, flen) in enumerate(fields, start=1):
-        if flen and re.search(r"/", flen):
-            flen = "int(" + flen + ")"
+        flen = array_length(flen)
         nl = ",\n" if i < fnum else ""
         f.append(f"        (\"{fname}\", {ftyp}{' * ' + flen if flen else ''}){nl}")
 
     fstr = "".join(f)
 
     msg_id = "MT_" + basename
+    data_struct = ""
+    if data_format is not None:
+        data_struct = f'\n    data_struct = struct.Struct("={data_format}")'
     template = f"""
 @pylsb.msg_def
 class {name}(pylsb.MessageData):
@@ -200,7 +278,7 @@ class {name}(pylsb.MessageData):
 {fstr}
     ]
     type_id = {msg_id}
-    type_name = \"{basename}\"
+    type_name = \"{basename}\"{data_struct}
 
 
 """
@@ -225,87 +303,270 @@ class {name}(pylsb.MessageData):
     return template
 
 
-def print_content(
-    content: str = "", end: str = "\n", out_file: Optional[TextIOWrapper] = None
-):
-    """Print content to the console and optionally write to file"""
-    print(content, end=end)
-    if out_file and not out_file.closed:
-        out_file.write(f"{content}{end}")
-
-
-def parse_file(filename, seq: int = 1, out_filename: Optional[str] = None):
-    """Parse a C header file for message definitions.
+def generate_lazy_def(
+    name: str, fields, structs: Dict, data_format: Optional[str] = None
+) -> str:
+    """Definition kept as source until first use, with the generated
+    structs its fields depend on. See lazy_definitions.
+    """
+    if name.startswith("MDF_"):
+        if fields is None:
+            source = generate_sig_def(name)
+        else:
+            source = generate_msg_def(name, fields, data_format)
+        type_id = "MT_" + name[4:]
+    else:
+        source = generate_struct(name, fields)
+        type_id = None
+    deps = sorted({ftyp for _, ftyp, _ in fields or () if ftyp in structs})
+    return f"_definitions[{name!r}] = ({deps!r}, {type_id}, {source.strip()!r})\n"
+
+
+def generate_file(
+    filename,
+    seq: int = 1,
+    lazy: bool = False,
+    values: Optional[Dict] = None,
+    formats: Optional[Dict] = None,
+) -> str:
+    """Python source with the definitions of a C header file.
+    values and formats collect the constants and struct formats of the
+    files compiled so far, for headers that use definitions of earlier ones.
     Notes:
         * Does not follow other #includes
         * Parsing order: #defines, typedefs, typedef struct
     """
+    if values is None:
+        values = {k: v for k, v in vars(constants).items() if not k.startswith("_")}
+    if formats is None:
+        formats = {}
 
     with open(filename, "r") as f:
         text = f.read()
 
-    out_file = None
+    lines = []
+
+    def emit(content: str = "", end: str = "\n"):
+        lines.append(f"{content}{end}")
+
+    text = preprocess(text)
+    defines = parse_defines(text)
+    typedefs = parse_typedefs(text)
+    structs = parse_structs(defines["MT"], text)
+
+    for name, value in defines["constants"].items():
+        values[name] = evaluate(value, values)
+    for name, ctype in typedefs.items():
+        formats[name] = field_format(ctype, None, values, formats)
+    for name, fields in structs.items():
+        if fields is not None:
+            formats[name] = struct_format(fields, values, formats)
+
+    if seq == 1:
+        emit("import ctypes")
+        emit("import struct")
+        emit("import pylsb")
+        emit("from pylsb.constants import *")
+        if lazy:
+            emit()
+            emit("# Message classes are built on first use by name or by type id")
+            emit("_definitions = {}")
+        emit()
+
+    emit(f"# User Constants: {filename}")
+    for name, value in defines["constants"].items():
+        emit(generate_constant(name, value))
+
+    emit()
+    emit(f"# User Message IDs: {filename}")
+    for name, value in defines["MT"].items():
+        emit(generate_constant(name, value))
+
+    emit()
+    emit(f"# User Module IDs: {filename}")
+    for name, value in defines["MID"].items():
+        emit(generate_constant(name, value))
+
+    emit()
+    emit(f"# User Type Definitions: {filename}")
+    for name, value in typedefs.items():
+        emit(generate_constant(name, value))
+
+    ctypes_map.update(typedefs)
+
+    emit()
+    emit(f"# User Message Definitions: {filename}", end="\n\n")
+
+    for name, fields in structs.items():
+        if lazy:
+            emit(generate_lazy_def(name, fields, structs, formats.get(name)), end="")
+        elif name.startswith("MDF_"):
+            if fields is not None:
+                emit(generate_msg_def(name, fields, formats[name]), end="")
+            else:
+                emit(generate_sig_def(name), end="")
+        else:
+            emit(generate_struct(name, fields), end="")
+
+    return "".join(lines)
+
+
+def generate(include_files: List, lazy: bool = False) -> str:
+    """Python module source with the definitions of all include files."""
+    values = {k: v for k, v in vars(constants).items() if not k.startswith("_")}
+    formats = {}
+    content = "".join(
+        generate_file(f, seq=n, lazy=lazy, values=values, formats=formats)
+        for n, f in enumerate(include_files, start=1)
+    )
+    if lazy:
+        content += (
+            "\nimport pylsb.compile\n\npylsb.compile.lazy_definitions(globals())\n"
+        )
+    return content
+
+
+def parse_file(filename, seq: int = 1, out_filename: Optional[str] = None):
+    """Parse a C header file for message definitions, writing the generated
+    source to out_filename (appending unless seq is 1) or to stdout.
+    """
+    content = generate_file(filename, seq)
     if out_filename:
-        mode = "w" if seq == 1 else "a"
-        out_file = open(out_filename, mode=mode)
+        with open(out_filename, mode="w" if seq == 1 else "a") as out_file:
+            out_file.write(content)
+    else:
+        print(content, end="")
 
-    try:
-        text = preprocess(text)
-        defines = parse_defines(text)
-        typedefs = parse_typedefs(text)
-        structs = parse_structs(defines["MT"], text)
-
-        if seq == 1:
-            print_content("import ctypes", out_file=out_file)
-            print_content("import pylsb", out_file=out_file)
-            print_content("from pylsb.constants import *", out_file=out_file)
-            print_content(out_file=out_file)
-
-        print_content(f"# User Constants: {filename}", out_file=out_file)
-        for name, value in defines["constants"].items():
-            print_content(generate_constant(name, value), out_file=out_file)
-
-        print_content(out_file=out_file)
-        print_content(f"# User Message IDs: {filename}", out_file=out_file)
-        for name, value in defines["MT"].items():
-            print_content(generate_constant(name, value), out_file=out_file)
-
-        print_content(out_file=out_file)
-        print_content(f"# User Module IDs: {filename}", out_file=out_file)
-        for name, value in defines["MID"].items():
-            print_content(generate_constant(name, value), out_file=out_file)
-
-        print_content(out_file=out_file)
-        print_content(f"# User Type Definitions: {filename}", out_file=out_file)
-        for name, value in typedefs.items():
-            print_content(generate_constant(name, value), out_file=out_file)
-
-        ctypes_map.update(typedefs)
-
-        print_content()
-        print_content(
-            f"# User Message Definitions: {filename}", end="\n\n", out_file=out_file
+
+def compile(include_files: List, out_filename: Optional[str], lazy: bool = False):
+    content = generate(include_files, lazy=lazy)
+    if out_filename:
+        with open(out_filename, mode="w") as out_file:
+            out_file.write(content)
+    else:
+        print(content, end="")
+
+
+def build_definition(namespace: Dict, name: str):
+    """Build a lazy definition of a generated module, and the ones it depends on."""
+    if name in namespace:
+        return namespace[name]
+    definitions = namespace["_definitions"]
+    if name not in definitions:
+        raise AttributeError(
+            f"module {namespace['__name__']!r} has no attribute {name!r}"
         )
+    deps, type_id, source = definitions[name]
+    for dep in deps:
+        build_definition(namespace, dep)
+    exec(source, namespace)
+    return namespace[name]
+
+
+def lazy_definitions(namespace: Dict):
+    """Called at the end of a module generated with lazy=True. Message
+    types are registered with a factory, so the class is only built when
+    msg_defs looks it up or the module attribute is used. A star import
+    only takes the constants and the classes built so far.
+    """
+    namespace["__getattr__"] = functools.partial(build_definition, namespace)
+    for name, (deps, type_id, source) in namespace["_definitions"].items():
+        if type_id is not None:
+            user_msg_defs.add_lazy(
+                type_id, functools.partial(build_definition, namespace, name)
+            )
 
-        for name, fields in structs.items():
-            if name.startswith("MDF_"):
-                if fields is not None:
-                    print_content(
-                        generate_msg_def(name, fields), end="", out_file=out_file
-                    )
-                else:
-                    print_content(generate_sig_def(name), end="", out_file=out_file)
-            else:
-                print_content(generate_struct(name, fields), end="", out_file=out_file)
 
-    finally:
-        if out_file and not out_file.closed:
-            out_file.close()
+def default_cache_dir() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.environ.get("PYLSB_CACHE_DIR") or os.path.join(cache_home, "pylsb")
 
 
-def compile(include_files: List, out_filename: Optional[str]):
-    for n, f in enumerate(include_files, start=1):
-        parse_file(f, seq=n, out_filename=out_filename)
+def cached_module_path(
+    include_files: List, lazy: bool = True, cache_dir: Optional[str] = None
+) -> str:
+    """Path of the generated module for include_files, compiling it only if
+    no module exists yet for this pylsb version and header content.
+    """
+    digest = hashlib.sha256(f"{__version__} lazy={lazy}".encode())
+    # Generated code also changes with the compiler in development installs
+    with open(__file__, "rb") as f:
+        digest.update(f.read())
+    for filename in include_files:
+        with open(filename, "rb") as f:
+            content = f.read()
+        digest.update(len(content).to_bytes(8, "little"))
+        digest.update(content)
+
+    cache_dir = cache_dir or default_cache_dir()
+    path = os.path.join(cache_dir, f"msg_defs_{digest.hexdigest()[:32]}.py")
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        content = generate(include_files, lazy=lazy)
+        # Concurrent starts may compile at the same time, publish atomically
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    return path
+
+
+def load(
+    include_files: List,
+    module_name: Optional[str] = None,
+    lazy: bool = True,
+    cache_dir: Optional[str] = None,
+) -> ModuleType:
+    """Import the definitions of include_files from the compile cache."""
+    path = cached_module_path(include_files, lazy=lazy, cache_dir=cache_dir)
+    module_name = module_name or os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class MessageDefinitionFinder:
+    """Import hook (a sys.meta_path finder) resolving module_name to the
+    cached compiled definitions of include_files.
+    """
+
+    def __init__(
+        self,
+        module_name: str,
+        include_files: List,
+        lazy: bool = True,
+        cache_dir: Optional[str] = None,
+    ):
+        self.module_name = module_name
+        self.include_files = list(include_files)
+        self.lazy = lazy
+        self.cache_dir = cache_dir
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname != self.module_name:
+            return None
+        return importlib.util.spec_from_file_location(
+            fullname,
+            cached_module_path(self.include_files, self.lazy, self.cache_dir),
+        )
+
+
+def install_import_hook(
+    module_name: str,
+    include_files: List,
+    lazy: bool = True,
+    cache_dir: Optional[str] = None,
+) -> MessageDefinitionFinder:
+    """Make `import module_name` load the compiled definitions of include_files,
+    e.g. install_import_hook("rnel_msg_defs", ["climber_config.h"]).
+    """
+    finder = MessageDefinitionFinder(module_name, include_files, lazy, cache_dir)
+    sys.meta_path.insert(0, finder)
+    return finder
 
 
 if __name__ == "__main__":
@@ -324,7 +585,12 @@ if __name__ == "__main__":
     parser.add_argument(
         "-o, -O",
         dest="output_file",
-        help="Output python file",
+        help="Output python file, stdout if not given",
+    )
+    parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="Build message classes on first use instead of at import",
     )
     args = parser.parse_args()
-    compile(args.include_files, args.output_file)
+    compile(args.include_files, args.output_file, lazy=args.lazy)
@@ -10,6 +10,8 @@ MAX_INTERNAL_TIMERS = 20
 MAX_LSB_MSG_TYPE = 99
 MAX_LSB_MODULE_ID = 9
 MAX_LOGGER_FILENAME_LENGTH = 256
+MAX_SHM_NAME_LENGTH = 64
+SHM_NONCE_LENGTH = 16
 MAX_CONTIGUOUS_MESSAGE_DATA = 9000
 MID_MESSAGE_MANAGER = 0
 MID_COMMAND_MODULE = 1
@@ -56,6 +58,12 @@ MT_FORCE_DISCONNECT = 82
 MT_MODULE_READY = 26
 MT_TIMING_MESSAGE = 80
 
+# Shared memory handshake, pylsb only. Core ids run up to MAX_LSB_MSG_TYPE,
+# 87-89 are unused by Dragonfly and user message types start above 99.
+MT_SHM_CONNECT = 87
+MT_SHM_CONNECT_CONFIRM = 88
+MT_SHM_CONNECT_CANCEL = 89
+
 # Internal typedefs
 MODULE_ID = ctypes.c_short
 HOST_ID = ctypes.c_short
@@ -0,0 +1,376 @@
+import argparse
+import ctypes
+import mmap
+import os
+import struct
+import time
+
+from array import array
+from typing import Dict
+
+from ._core import *
+from .constants import *
+from .client import Client, ClientError, ConnectionLost
+
+__all__ = [
+    "QuickLogger",
+    "LOG_MAGIC",
+    "LOG_VERSION",
+    "LOG_FILE_HEADER",
+    "LOG_DATA_OFFSET",
+    "LOG_TYPE_ENTRY",
+]
+
+# Binary message log layout, in native byte order like the frames:
+#   file header (LOG_FILE_HEADER) padded to LOG_DATA_OFFSET
+#   frames, each a message header followed by its payload, in arrival order
+#   index at index_offset (0 while the log is still being written):
+#     num_frames int64 file offsets and num_frames float64 recv_times of
+#     the frames in arrival order, the time index
+#     num_types LOG_TYPE_ENTRY (msg_type, first, count) sorted by msg_type
+#     num_frames int64 frame numbers grouped by type, the type index
+LOG_MAGIC = b"PYLSBLOG"
+LOG_VERSION = 1
+# magic, version, message header size, data offset, data size, frames, types, index offset
+LOG_FILE_HEADER = struct.Struct("=8sIIqqqqq")
+LOG_DATA_OFFSET = 4096
+LOG_TYPE_ENTRY = struct.Struct("=iiqq")
+
+DEFAULT_LOG_PREALLOC_SIZE = 256 * 1024**2
+
+# Largest single recv_into the log file, also requested as socket receive buffer
+LOG_RECV_SIZE = 4 * 1024**2
+
+
+class QuickLogger:
+    """Logger module recording every message routed by the manager.
+    Frames are received straight into a preallocated, memory-mapped log file
+    and indexed by type and arrival time in place, without building message
+    objects. Answers SAVE_MESSAGE_LOG (writes an indexed copy of the log and
+    replies MESSAGE_LOG_SAVED), PAUSE/RESUME_MESSAGE_LOGGING,
+    RESET_MESSAGE_LOG (discards everything logged so far) and
+    DUMP_MESSAGE_LOG (writes the index into the log file itself).
+    """
+
+    def __init__(
+        self,
+        path: str = "quicklogger.bin",
+        module_id: int = MID_QUICKLOGGER,
+        timecode: bool = False,
+        prealloc_size: int = DEFAULT_LOG_PREALLOC_SIZE,
+    ):
+        self.path = path
+        self.client = Client(module_id=module_id, timecode=timecode, read_ahead=False)
+        header_cls = self.client.header_cls
+        self.header_size = ctypes.sizeof(header_cls)
+        # msg_type and num_data_bytes with one unpack
+        self.frame_struct = struct.Struct(f"=i{header_cls.num_data_bytes.offset - 4}xi")
+        self.recv_time_offset = header_cls.recv_time.offset
+        self.recv_time_struct = struct.Struct("=d")
+
+        self.paused = False
+        self._keep_running = True
+
+        # Bytes [LOG_DATA_OFFSET:data_end] hold logged frames,
+        # [scan_pos:write_pos] received bytes not yet indexed
+        self.data_end = LOG_DATA_OFFSET
+        self.scan_pos = LOG_DATA_OFFSET
+        self.write_pos = LOG_DATA_OFFSET
+        self.index_written = False
+
+        self.frame_offsets = array("q")
+        self.frame_times = array("d")
+        self.type_frames: Dict[int, array] = {}
+
+        self.file = open(path, "w+b")
+        self.size = max(prealloc_size, 2 * LOG_DATA_OFFSET)
+        self._allocate(self.size)
+        self.mm = mmap.mmap(self.file.fileno(), self.size)
+        self._write_file_header(0)
+
+    @property
+    def num_frames(self) -> int:
+        return len(self.frame_offsets)
+
+    @property
+    def data_size(self) -> int:
+        return self.data_end - LOG_DATA_OFFSET
+
+    def _allocate(self, size: int):
+        if hasattr(os, "posix_fallocate"):
+            # Reserve the blocks now, not on first touch while logging
+            os.posix_fallocate(self.file.fileno(), 0, size)
+        else:
+            self.file.truncate(size)
+
+    def _reserve(self, end: int):
+        """Grow the file to at least end bytes, at least doubling it."""
+        if end <= self.size:
+            return
+        size = self.size
+        while size < end:
+            size *= 2
+        self.mm.close()
+        self._allocate(size)
+        self.size = size
+        self.mm = mmap.mmap(self.file.fileno(), size)
+
+    def _write_file_header(self, index_offset: int):
+        LOG_FILE_HEADER.pack_into(
+            self.mm,
+            0,
+            LOG_MAGIC,
+            LOG_VERSION,
+            self.header_size,
+            LOG_DATA_OFFSET,
+            self.data_size,
+            self.num_frames,
+            len(self.type_frames),
+            index_offset,
+        )
+
+    def connect(self, server_name: str = "localhost:7111", shared_memory: bool = False):
+        self.client.connect(
+            server_name=server_name, logger_status=True, shared_memory=shared_memory
+        )
+        self.client.set_recv_buffer_size(LOG_RECV_SIZE)
+
+    def disconnect(self):
+        self.client.disconnect()
+
+    def stop(self):
+        self._keep_running = False
+
+    def run(self, timeout: float = 0.1):
+        """Log until stop() is called or the connection to the manager is lost."""
+        self._keep_running = True
+        try:
+            while self._keep_running:
+                self.read(timeout)
+        except (ConnectionLost, KeyboardInterrupt):
+            pass
+
+    def read(self, timeout: float = 0) -> int:
+        """Receive whatever is available (waiting up to timeout seconds) and
+        index every complete frame. Returns the number of bytes received.
+        """
+        if not self.client.wait_readable(timeout):
+            return 0
+
+        # Room for the rest of the current frame, or a full read
+        pending = self.write_pos - self.scan_pos
+        frame_size = self._next_frame_size()
+        needed = max(frame_size - pending, LOG_RECV_SIZE)
+        self._reserve(self.write_pos + needed)
+
+        with memoryview(self.mm) as view:
+            received = self.client.recv_frames_into(
+                view[self.write_pos : self.write_pos + needed], needed
+            )
+        self.write_pos += received
+
+        self._index_frames(time.time())
+        return received
+
+    def _next_frame_size(self) -> int:
+        if self.write_pos - self.scan_pos < self.header_size:
+            return self.header_size
+        msg_type, num_data_bytes = self.frame_struct.unpack_from(self.mm, self.scan_pos)
+        return self.header_size + num_data_bytes
+
+    def _index_frames(self, recv_time: float):
+        """Stamp, index and keep (or drop, while paused) each complete frame."""
+        mm = self.mm
+        header_size = self.header_size
+        unpack_from = self.frame_struct.unpack_from
+        pack_recv_time = self.recv_time_struct.pack_into
+        recv_time_offset = self.recv_time_offset
+        frame_offsets = self.frame_offsets
+        frame_times = self.frame_times
+        type_frames = self.type_frames
+
+        pos = self.scan_pos
+        end = self.write_pos
+        while end - pos >= header_size:
+            msg_type, num_data_bytes = unpack_from(mm, pos)
+            frame_end = pos + header_size + num_data_bytes
+            if frame_end > end:
+                break
+
+            control = MT_SAVE_MESSAGE_LOG <= msg_type <= MT_DUMP_MESSAGE_LOG
+            frame_start = pos
+            if not self.paused or msg_type == MT_RESUME_MESSAGE_LOGGING:
+                if self.index_written:
+                    # This frame overwrites the index of the last dump
+                    self.index_written = False
+                    self._write_file_header(0)
+                frame_start = self.data_end
+                if frame_start != pos:
+                    # Earlier frames were dropped, close the gap
+                    mm.move(frame_start, pos, frame_end - pos)
+                pack_recv_time(mm, frame_start + recv_time_offset, recv_time)
+                frames = type_frames.get(msg_type)
+                if frames is None:
+                    frames = type_frames[msg_type] = array("q")
+                frames.append(len(frame_offsets))
+                frame_offsets.append(frame_start)
+                frame_times.append(recv_time)
+                self.data_end = frame_start + frame_end - pos
+            pos = frame_end
+
+            if control:
+                # Handlers may move unindexed bytes or remap the file
+                self.scan_pos = pos
+                self.write_pos = end
+                self._handle_control(msg_type, frame_start)
+                mm = self.mm
+                pos = self.scan_pos
+                end = self.write_pos
+
+        if self.data_end != pos:
+            # Move the partial frame after the kept ones
+            mm.move(self.data_end, pos, end - pos)
+            end = self.data_end + end - pos
+            pos = self.data_end
+        self.scan_pos = pos
+        self.write_pos = end
+
+    def _handle_control(self, msg_type: int, offset: int):
+        if msg_type == MT_SAVE_MESSAGE_LOG:
+            msg = SAVE_MESSAGE_LOG.from_buffer_copy(self.mm, offset + self.header_size)
+            pathname = msg.pathname[: msg.pathname_length or None].decode()
+            self.save(pathname)
+            self.client.send_signal(MT_MESSAGE_LOG_SAVED)
+        elif msg_type == MT_PAUSE_MESSAGE_LOGGING:
+            self.pause()
+        elif msg_type == MT_RESUME_MESSAGE_LOGGING:
+            self.resume()
+        elif msg_type == MT_RESET_MESSAGE_LOG:
+            self.reset()
+        elif msg_type == MT_DUMP_MESSAGE_LOG:
+            self.dump()
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def reset(self):
+        """Discard every frame logged so far."""
+        self.data_end = LOG_DATA_OFFSET
+        del self.frame_offsets[:]
+        del self.frame_times[:]
+        self.type_frames.clear()
+        self.index_written = False
+        self._write_file_header(0)
+
+    def index_bytes(self) -> bytes:
+        """Time index, type directory and type index of the logged frames."""
+        type_entries = bytearray()
+        type_index = array("q")
+        for msg_type in sorted(self.type_frames):
+            frames = self.type_frames[msg_type]
+            type_entries += LOG_TYPE_ENTRY.pack(
+                msg_type, 0, len(type_index), len(frames)
+            )
+            type_index.extend(frames)
+
+        return b"".join(
+            (
+                self.frame_offsets.tobytes(),
+                self.frame_times.tobytes(),
+                type_entries,
+                type_index.tobytes(),
+            )
+        )
+
+    def save(self, pathname: str):
+        """Write the logged frames and their index to an indexed log file at pathname."""
+        if os.path.abspath(pathname) == os.path.abspath(self.path):
+            self.dump()
+            return
+        index = self.index_bytes()
+        header = bytearray(LOG_DATA_OFFSET)
+        LOG_FILE_HEADER.pack_into(
+            header,
+            0,
+            LOG_MAGIC,
+            LOG_VERSION,
+            self.header_size,
+            LOG_DATA_OFFSET,
+            self.data_size,
+            self.num_frames,
+            len(self.type_frames),
+            self.data_end,
+        )
+        with open(pathname, "wb") as f:
+            f.write(header)
+            with memoryview(self.mm) as view:
+                f.write(view[LOG_DATA_OFFSET : self.data_end])
+            f.write(index)
+
+    def dump(self):
+        """Write the index after the logged frames in the log file itself,
+        making it a complete log until more frames arrive.
+        """
+        index = self.index_bytes()
+        # Unindexed bytes move behind the index, later frames are written over it
+        pending = self.write_pos - self.scan_pos
+        self._reserve(self.data_end + len(index) + pending)
+        if pending:
+            self.mm.move(self.data_end + len(index), self.scan_pos, pending)
+        self.scan_pos = self.data_end + len(index)
+        self.write_pos = self.scan_pos + pending
+        self.mm[self.data_end : self.scan_pos] = index
+        self._write_file_header(self.data_end)
+        self.mm.flush()
+        self.index_written = True
+
+    def close(self):
+        """Finish the log file with its index and trim the preallocated tail."""
+        if self.client.connected:
+            try:
+                self.disconnect()
+            except ClientError:
+                pass
+        if self.mm.closed:
+            return
+        index = self.index_bytes()
+        end = self.data_end + len(index)
+        self._reserve(end)
+        self.mm[self.data_end : end] = index
+        self._write_file_header(self.data_end)
+        self.mm.flush()
+        self.mm.close()
+        self.file.truncate(end)
+        self.file.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Log every message to a binary file")
+    parser.add_argument(
+        "-s",
+        "--server",
+        default="127.0.0.1:7111",
+        help="Message manager address, ip:port or unix:/path. Default is 127.0.0.1:7111.",
+    )
+    parser.add_argument(
+        "-o", "--output", default="quicklogger.bin", help="Log file path."
+    )
+    parser.add_argument(
+        "-t", "--timecode", action="store_true", help="Use timecode in message header"
+    )
+    parser.add_argument(
+        "--shared_memory",
+        action="store_true",
+        help="Receive through shared memory if the manager supports it.",
+    )
+    args = parser.parse_args()
+
+    quick_logger = QuickLogger(args.output, timecode=args.timecode)
+    quick_logger.connect(args.server, shared_memory=args.shared_memory)
+    try:
+        quick_logger.run()
+    finally:
+        quick_logger.close()
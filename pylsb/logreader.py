@@ -0,0 +1,209 @@
+import ctypes
+import mmap
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Type
+
+import numpy as np
+
+from ._core import *
+from .constants import *
+from .logger import (
+    LOG_MAGIC,
+    LOG_VERSION,
+    LOG_FILE_HEADER,
+    LOG_TYPE_ENTRY,
+)
+
+__all__ = ["LogMessages", "LogReader"]
+
+
+@dataclass
+class LogMessages:
+    """All logged messages of one type. header and data are structured
+    arrays with one element per message, the header field properties are
+    views into header.
+    """
+
+    msg_type: int
+    header: np.ndarray
+    data: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def send_time(self) -> np.ndarray:
+        return self.header["send_time"]
+
+    @property
+    def recv_time(self) -> np.ndarray:
+        return self.header["recv_time"]
+
+    @property
+    def src_mod_id(self) -> np.ndarray:
+        return self.header["src_mod_id"]
+
+    @property
+    def msg_count(self) -> np.ndarray:
+        return self.header["msg_count"]
+
+
+class LogReader:
+    """Memory-mapped reader for the binary message logs written by QuickLogger.
+    Messages of a type are located through the log index. When they are
+    evenly spaced in the file (e.g. a log of one high-rate type) the
+    returned arrays are strided views of the file, otherwise they are
+    gathered with one vectorized copy.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Every array is built on this view, which pins the mapping while in use
+        self.buffer = np.frombuffer(self.mm, np.uint8)
+
+        (
+            magic,
+            version,
+            self.header_size,
+            self.data_offset,
+            self.data_size,
+            self.num_frames,
+            num_types,
+            index_offset,
+        ) = LOG_FILE_HEADER.unpack_from(self.mm)
+        if magic != LOG_MAGIC or version != LOG_VERSION:
+            raise ValueError(f"{path} is not a version {LOG_VERSION} message log")
+        if index_offset == 0:
+            raise ValueError(
+                f"{path} has no index yet, dump or close the logger that writes it"
+            )
+
+        for timecode in (False, True):
+            if ctypes.sizeof(get_header_cls(timecode)) == self.header_size:
+                self.header_cls = get_header_cls(timecode)
+                break
+        else:
+            raise ValueError(f"Unknown message header size {self.header_size}")
+        self.header_dtype = ctypes_dtype(self.header_cls)
+
+        # Time index: file offsets and recv_times in arrival order
+        self.frame_offsets = np.ndarray(
+            self.num_frames, np.int64, self.buffer, index_offset
+        )
+        self.frame_times = np.ndarray(
+            self.num_frames, np.float64, self.buffer, index_offset + 8 * self.num_frames
+        )
+
+        # Type directory and type index, frame numbers grouped by type
+        type_offset = index_offset + 16 * self.num_frames
+        self.types: Dict[int, Tuple[int, int]] = {}
+        for n in range(num_types):
+            msg_type, _, first, count = LOG_TYPE_ENTRY.unpack_from(
+                self.mm, type_offset + n * LOG_TYPE_ENTRY.size
+            )
+            self.types[msg_type] = (first, count)
+        self.type_index = np.ndarray(
+            self.num_frames,
+            np.int64,
+            self.buffer,
+            type_offset + num_types * LOG_TYPE_ENTRY.size,
+        )
+
+    def __enter__(self) -> "LogReader":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.buffer = self.frame_offsets = self.frame_times = self.type_index = None
+        # Arrays returned earlier that still view the file keep the mapping alive
+        try:
+            self.mm.close()
+        except BufferError:
+            pass
+
+    @property
+    def msg_types(self) -> List[int]:
+        return list(self.types)
+
+    def count(self, msg_type: int) -> int:
+        return self.types.get(msg_type, (0, 0))[1]
+
+    def frames(
+        self,
+        msg_type: int,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
+    ) -> np.ndarray:
+        """Frame numbers of a type in arrival order, optionally only those
+        received in [start_time, end_time).
+        """
+        first, count = self.types.get(msg_type, (0, 0))
+        frames = self.type_index[first : first + count]
+        if start_time is not None or end_time is not None:
+            # recv_time grows with the frame number
+            times = self.frame_times[frames]
+            lo = 0 if start_time is None else np.searchsorted(times, start_time)
+            hi = len(frames) if end_time is None else np.searchsorted(times, end_time)
+            frames = frames[lo:hi]
+        return frames
+
+    def read(
+        self,
+        msg_type: int,
+        msg_cls: Optional[Type[MessageData]] = None,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
+    ) -> LogMessages:
+        """Headers and payloads of every logged message of a type as structured
+        arrays, optionally only those received in [start_time, end_time).
+        msg_cls defaults to the registered definition of msg_type.
+        """
+        if msg_cls is None:
+            msg_cls = msg_defs[msg_type]
+        data_dtype = msg_cls.numpy_dtype()
+        frame_dtype = np.dtype(
+            {
+                "names": ["header", "data"],
+                "formats": [self.header_dtype, data_dtype],
+                "offsets": [0, self.header_size],
+                "itemsize": self.header_size + data_dtype.itemsize,
+            }
+        )
+
+        offsets = self.frame_offsets[self.frames(msg_type, start_time, end_time)]
+        if len(offsets) == 0:
+            records = np.empty(0, frame_dtype)
+        else:
+            stride = int(offsets[1] - offsets[0]) if len(offsets) > 1 else 0
+            if len(offsets) == 1 or (
+                stride >= frame_dtype.itemsize and np.all(np.diff(offsets) == stride)
+            ):
+                records = np.ndarray(
+                    len(offsets),
+                    frame_dtype,
+                    self.buffer,
+                    int(offsets[0]),
+                    (stride,),
+                )
+            else:
+                # A record starting at every byte, gathered at the frame offsets
+                all_records = np.ndarray(
+                    len(self.buffer) - frame_dtype.itemsize + 1,
+                    frame_dtype,
+                    self.buffer,
+                    0,
+                    (1,),
+                )
+                records = all_records[offsets]
+
+        header = records["header"]
+        if np.any(header["num_data_bytes"] != data_dtype.itemsize):
+            raise ValueError(
+                f"Logged messages of type {msg_type} do not match the size of {msg_cls.__name__}"
+            )
+        return LogMessages(msg_type, header, records["data"])
@@ -1,21 +1,46 @@
 import socket
 import select
+import selectors
 import argparse
 import logging
 import time
 import random
 import ctypes
 import os
+import stat
 
 from ._core import *
 from .constants import *
+from ._io import IOV_MAX, sendmsg
+from .shm import SHM_POLL_INTERVAL, ShmChannel, is_local_peer
 
-from typing import Dict, List, Tuple, Set, Type, Union, Optional
-from dataclasses import dataclass
-from collections import defaultdict, Counter
+from typing import Callable, Deque, Dict, List, Tuple, Set, Type, Union, Optional
+from dataclasses import dataclass, field
+from collections import deque, Counter
+from itertools import islice
 
+DEFAULT_SEND_QUEUE_SIZE = 8 * 1024**2
+DEFAULT_SEND_QUEUE_HIGH_WATER = 1024**2
 
-@dataclass
+# Messages read from a shared memory module before other modules get a turn
+SHM_READ_BATCH = 64
+
+
+def encode_frame(
+    header: MessageHeader, data: Optional[MessageData] = None
+) -> memoryview:
+    """Header and payload as one immutable frame."""
+    if data is None:
+        return memoryview(bytes(header))
+    return memoryview(bytes(header) + bytes(data))
+
+
+def freeze(frame: memoryview) -> memoryview:
+    """Immutable version of frame, safe to keep after its source buffer is reused."""
+    return frame if isinstance(frame.obj, bytes) else memoryview(bytes(frame))
+
+
+@dataclass(eq=False)
 class Module:
 
     conn: socket.socket
@@ -25,10 +50,68 @@ class Module:
     pid: int = 0
     connected: bool = False
     is_logger: bool = False
+    writable: bool = True
+    subscriptions: Set[int] = field(default_factory=set)
+    send_queue: Deque[memoryview] = field(default_factory=deque)
+    queued_bytes: int = 0
+    max_queued_bytes: int = DEFAULT_SEND_QUEUE_SIZE
+    shm_pending: Optional[ShmChannel] = None
+
+    def send_message(
+        self,
+        frame: memoryview,
+        snapshot: Callable[[memoryview], memoryview] = freeze,
+    ) -> bool:
+        """Write a message frame (header and payload) to the (non-blocking) module socket.
+        Whatever the socket does not accept right away is queued from
+        snapshot(frame), an immutable copy the manager shares between all
+        recipients of a message. `flush` drains the queue once the socket is writable.
+        Returns False if the message was dropped because the queue is full.
+        """
+        nbytes = frame.nbytes
+
+        if self.send_queue:
+            # An empty queue always takes the message, so oversized messages still go out
+            if self.queued_bytes + nbytes > self.max_queued_bytes:
+                return False
+            sent = 0
+        else:
+            try:
+                sent = self.conn.send(frame)
+            except BlockingIOError:
+                sent = 0
+            if sent == nbytes:
+                return True
+
+        self.send_queue.append(snapshot(frame)[sent:])
+        self.queued_bytes += nbytes - sent
+        self.writable = False
+        return True
 
-    def send_message(self, header: MessageHeader, payload: Union[bytes, MessageData]):
-        self.conn.sendall(header)
-        self.conn.sendall(payload)
+    def flush(self) -> bool:
+        """Send as much of the outbound queue as the socket accepts, several
+        queued buffers per sendmsg call. Returns True once the queue is empty.
+        """
+        while self.send_queue:
+            buffers = list(islice(self.send_queue, IOV_MAX))
+            try:
+                sent = sendmsg(self.conn, buffers)
+            except BlockingIOError:
+                break
+            self.queued_bytes -= sent
+            partial = sent < sum(view.nbytes for view in buffers)
+            while sent:
+                head = self.send_queue[0]
+                if sent >= head.nbytes:
+                    self.send_queue.popleft()
+                    sent -= head.nbytes
+                else:
+                    self.send_queue[0] = head[sent:]
+                    sent = 0
+            if partial:
+                break
+        self.writable = not self.send_queue
+        return self.writable
 
     def send_ack(self):
         # Just send a header
@@ -39,7 +122,18 @@ class Module:
         header.dest_mod_id = self.id
         header.num_data_bytes = 0
 
-        self.conn.sendall(header)
+        self.send_message(encode_frame(header))
+
+    @property
+    def shared_memory(self) -> bool:
+        return isinstance(self.conn, ShmChannel)
+
+    def wait_writable(self):
+        """Block until the connection can take more bytes."""
+        if self.shared_memory:
+            self.conn.wait_writable()
+        else:
+            select.select([], [self.conn], [], None)
 
     def close(self):
         self.conn.close()
@@ -47,9 +141,6 @@ class Module:
     def __str__(self):
         return f"Module ID: {self.id} @ {self.address[0]}:{self.address[1]}"
 
-    def __hash__(self):
-        return self.conn.__hash__()
-
 
 class MessageManager:
 
@@ -62,18 +153,35 @@ class MessageManager:
         timecode=False,
         debug=False,
         send_msg_timing=True,
+        send_queue_size: int = DEFAULT_SEND_QUEUE_SIZE,
+        send_queue_high_water: int = DEFAULT_SEND_QUEUE_HIGH_WATER,
+        unix_path: Optional[str] = None,
     ):
 
         self.ip_address = ip_address
         self.port = port
+        self.unix_path = unix_path
+
+        # Per module outbound queue limits (bytes). Messages are dropped once
+        # a queue would exceed send_queue_size, a warning is logged when it
+        # grows past send_queue_high_water.
+        self.send_queue_size = send_queue_size
+        self.send_queue_high_water = send_queue_high_water
+        self.congested_modules: Set[Module] = set()
 
         self.header_cls = get_header_cls(timecode)
         self.header_size = ctypes.sizeof(self.header_cls)
-        self.header_buffer = bytearray(self.header_size)
-        self.header_view = memoryview(self.header_buffer)
+
+        # Incoming messages are read into one contiguous frame (header then
+        # payload), so they can be forwarded with a single write per recipient.
+        self.frame_buffer = bytearray(self.header_size + 1024**2)
+        self.frame_view = memoryview(self.frame_buffer)
+        self.header_view = self.frame_view[: self.header_size]
+        self.data_view = self.frame_view[self.header_size :]
+        self._snapshot_source = None
+        self._snapshot = None
 
         self.read_timeout = 0.200
-        self.write_timeout = 0  # c++ message manager uses timeout = 0 for all modules except logger modules, which uses -1 (blocking)
         self._debug = debug
         self.b_send_msg_timing = send_msg_timing
         self.logger = logging.getLogger(f"MessageManager@{ip_address}:{port}")
@@ -84,17 +192,25 @@ class MessageManager:
         if ip_address == socket.INADDR_ANY:
             ip_address = ""  # bind and Module require a string input, '' is treated as INADDR_ANY by bind
 
-        # Create the tcp listening socket
-        self.listen_socket = socket.socket(
-            family=socket.AF_INET, type=socket.SOCK_STREAM, proto=socket.IPPROTO_TCP
-        )
-        self.listen_socket.bind((ip_address, port))
-        self.listen_socket.listen(socket.SOMAXCONN)
+        # Create the tcp listening socket, and a unix one for local modules
+        self.listen_socket = self.create_listen_socket(ip_address, port)
+        self.listen_sockets = [self.listen_socket]
+        if unix_path is not None:
+            self.listen_sockets.append(self.create_unix_listen_socket(unix_path))
         self.modules: Dict[socket.socket, Module] = {}
         self.logger_modules: Set[Module] = set()
         self.next_dynamic_mod_id_offset = 0
 
-        self.subscriptions: Dict[int, Set[Module]] = defaultdict(set)
+        # Modules on shared memory channels, and those with frames left unread
+        # after their batch, which will not ring a doorbell for them again
+        self.shm_modules: Set[Module] = set()
+        self.shm_backlog: Set[Module] = set()
+        self.t_last_shm_sweep = time.perf_counter()
+
+        # Routing tables indexed by message type and module id. Subscriber
+        # tuples are replaced, never mutated, so forwarding only iterates.
+        self.subscriptions: List[Tuple[Module, ...]] = [()] * MAX_MESSAGE_TYPES
+        self.module_by_id: List[Optional[Module]] = [None] * MAX_MODULES
         self.sockets = [self.listen_socket]
         self.start_time = time.time()
 
@@ -120,9 +236,13 @@ class MessageManager:
         )
 
         self.modules[self.listen_socket] = mm_module
+        self.module_by_id[mm_module.id] = mm_module
 
-        self.data_buffer = bytearray(1024**2)
-        self.data_view = memoryview(self.data_buffer)
+        # Sockets are registered once (on accept) and only watched for
+        # writability while a module has pending outbound bytes.
+        self.selector = selectors.DefaultSelector()
+        for listen_socket in self.listen_sockets:
+            self.selector.register(listen_socket, selectors.EVENT_READ, mm_module)
 
         # Address Reuse allowed for testing
         if debug:
@@ -131,6 +251,51 @@ class MessageManager:
         self._configure_logging()
         self.logger.info("Message Manager Initialized.")
 
+    def create_listen_socket(self, ip_address: str, port: int) -> socket.socket:
+        listen_socket = socket.socket(
+            family=socket.AF_INET, type=socket.SOCK_STREAM, proto=socket.IPPROTO_TCP
+        )
+        listen_socket.bind((ip_address, port))
+        listen_socket.listen(socket.SOMAXCONN)
+        return listen_socket
+
+    def create_unix_listen_socket(self, path: str) -> socket.socket:
+        if not hasattr(socket, "AF_UNIX"):
+            raise RuntimeError(
+                "Unix domain sockets are not supported on this platform."
+            )
+
+        listen_socket = socket.socket(family=socket.AF_UNIX, type=socket.SOCK_STREAM)
+        if os.path.exists(path):
+            # Replace the socket file of a manager that is no longer running,
+            # never some other file the path points at by mistake
+            if not stat.S_ISSOCK(os.stat(path).st_mode):
+                listen_socket.close()
+                raise OSError(f"{path} exists and is not a socket")
+            try:
+                listen_socket.connect(path)
+            except ConnectionRefusedError:
+                os.unlink(path)
+            else:
+                listen_socket.close()
+                raise OSError(f"A message manager is already listening on {path}")
+            listen_socket.close()
+            listen_socket = socket.socket(
+                family=socket.AF_UNIX, type=socket.SOCK_STREAM
+            )
+        listen_socket.bind(path)
+        listen_socket.listen(socket.SOMAXCONN)
+        return listen_socket
+
+    def close_listen_sockets(self):
+        for listen_socket in self.listen_sockets:
+            listen_socket.close()
+        if self.unix_path is not None:
+            try:
+                os.unlink(self.unix_path)
+            except FileNotFoundError:
+                pass
+
     def _configure_logging(self) -> None:
         # Logging Configuration
         self.logger.propagate = False
@@ -146,8 +311,6 @@ class MessageManager:
         self.logger.addHandler(console)
 
     def assign_module_id(self) -> int:
-        current_ids = [mod.id for mod in self.modules.values()]
-
         MAX_DYN_IDS = MAX_MODULES - DYN_MOD_ID_START
         for i in range(0, MAX_DYN_IDS):
 
@@ -157,7 +320,7 @@ class MessageManager:
                 self.next_dynamic_mod_id_offset = 0
 
             # check if mod id is already used, if it is, continue looping until we find an unused one
-            if mod_id not in current_ids:
+            if not self.module_id_in_use(mod_id):
                 return mod_id
 
         # if we exit loop without returning, we failed to find a valid id
@@ -167,6 +330,9 @@ class MessageManager:
 
         raise RuntimeError("Exceeded maximum limit of allowed modules.")
 
+    def module_id_in_use(self, mod_id: int) -> bool:
+        return self.module_by_id[mod_id] is not None
+
     @property
     def header(self) -> MessageHeader:
         return self.header_cls.from_buffer(self.header_view)
@@ -178,8 +344,15 @@ class MessageManager:
         if src_mod_id == 0:
             src_module.id = self.assign_module_id()
         else:
-            current_ids = [mod.id for mod in self.modules.values()]
-            if src_mod_id in current_ids:  # cannot have multiple modules with same ID
+            if not 0 < src_mod_id < MAX_MODULES:
+                self.logger.error(
+                    f"MessageManager::connect_module: Invalid module ID {src_mod_id}, connection refused."
+                )
+                self.remove_module(src_module)
+                return False
+            if self.module_id_in_use(
+                src_mod_id
+            ):  # cannot have multiple modules with same ID
                 self.logger.info(f"CONNECT - {src_module!s}")
                 self.logger.error(
                     f"MessageManager::connect_module: Module ID {src_module!s} already in use, connection refused."
@@ -191,36 +364,63 @@ class MessageManager:
         # Convert the data blob into the correct msg struct
         src_module.is_logger = msg.data.logger_status == 1
         src_module.connected = True
+        self.module_by_id[src_module.id] = src_module
         if src_module.is_logger:
             self.logger_modules.add(src_module)
         return True
 
     def remove_module(self, module: Module):
         # Drop all subscriptions for this module
-        for msg_type, subscriber_set in self.subscriptions.items():
-            subscriber_set.discard(module)
+        for msg_type in list(module.subscriptions):
+            self.unsubscribe_module(module, msg_type)
+        if self.module_by_id[module.id] is module:
+            self.module_by_id[module.id] = None
 
         # Discard from logger module set if needed
         self.logger_modules.discard(module)
+        self.congested_modules.discard(module)
+        self.shm_modules.discard(module)
+        self.shm_backlog.discard(module)
+        if module.shm_pending is not None:
+            module.shm_pending.release()
+            module.shm_pending = None
 
         # Drop from our module mapping
-        module.close()
+        self.close_connection(module)
         del self.modules[module.conn]
 
+    def close_connection(self, module: Module):
+        self.selector.unregister(module.conn)
+        module.close()
+
     def disconnect_module(self, src_module: Module):
         # src_module.send_ack() # moved to process_message
         self.remove_module(src_module)
 
     def add_subscription(self, src_module: Module, msg: Message):
-        sub = SUBSCRIBE.from_buffer(msg.data)
-        self.subscriptions[sub.msg_type].add(src_module)
-        self.logger.info(f"SUBSCRIBE- {src_module!s} to MT:{sub.msg_type}")
+        (msg_type,) = SUBSCRIBE.unpack_from(msg.data)
+        if not 0 <= msg_type < MAX_MESSAGE_TYPES:
+            self.logger.error(
+                f"MessageManager::add_subscription: Invalid message type {msg_type} from {src_module!s}"
+            )
+            return
+        if msg_type not in src_module.subscriptions:
+            src_module.subscriptions.add(msg_type)
+            self.subscriptions[msg_type] += (src_module,)
+        self.logger.info(f"SUBSCRIBE- {src_module!s} to MT:{msg_type}")
 
     def remove_subscription(self, src_module: Module, msg: Message):
-        sub = UNSUBSCRIBE.from_buffer(msg.data)
+        (msg_type,) = UNSUBSCRIBE.unpack_from(msg.data)
         # Silently let modules unsubscribe from messages that they are not subscribed to.
-        self.subscriptions[sub.msg_type].discard(src_module)
-        self.logger.info(f"UNSUBSCRIBE- {src_module!s} to MT:{sub.msg_type}")
+        self.unsubscribe_module(src_module, msg_type)
+        self.logger.info(f"UNSUBSCRIBE- {src_module!s} to MT:{msg_type}")
+
+    def unsubscribe_module(self, module: Module, msg_type: int):
+        if msg_type in module.subscriptions:
+            module.subscriptions.discard(msg_type)
+            self.subscriptions[msg_type] = tuple(
+                mod for mod in self.subscriptions[msg_type] if mod is not module
+            )
 
     def resume_subscription(self, src_module: Module, msg: Message):
         self.add_subscription(src_module, msg)
@@ -229,14 +429,130 @@ class MessageManager:
         self.remove_subscription(src_module, msg)
 
     def register_module_ready(self, src_module: Module, msg: Message):
-        mr = MODULE_READY.from_buffer(msg.data)
-        src_module.pid = mr.pid
+        (src_module.pid,) = MODULE_READY.unpack_from(msg.data)
+
+    def connect_shared_memory(self, src_module: Module, msg: Message):
+        """Attach to the shared memory channel a module offered and acknowledge it.
+        The module stays on TCP until it confirms, a refusal is answered with
+        MT_SHM_CONNECT_CANCEL and the client stays on TCP for good. Only local
+        peers that prove they created the segment, by sending the nonce written
+        into it, are accepted.
+        """
+        request = SHM_CONNECT.from_buffer(msg.data)
+        sock = src_module.conn
+        if (
+            not src_module.connected
+            or src_module.shared_memory
+            or src_module.shm_pending is not None
+        ):
+            return
+        if not is_local_peer(sock):
+            self.logger.warning(
+                f"SHM_CONNECT - {src_module!s} - not a local peer, staying on TCP"
+            )
+            self.send_signal(src_module, MT_SHM_CONNECT_CANCEL)
+            return
+        try:
+            channel = ShmChannel.attach(
+                sock, request.name.decode(), request.ring_size, bytes(request.nonce)
+            )
+        except (OSError, ValueError) as err:
+            self.logger.warning(
+                f"SHM_CONNECT - {src_module!s} - staying on TCP - {err!s}"
+            )
+            self.send_signal(src_module, MT_SHM_CONNECT_CANCEL)
+            return
+
+        src_module.shm_pending = channel
+        self.send_ack(src_module)
+
+    def confirm_shared_memory(self, src_module: Module, msg: Message):
+        """Move a module to the shared memory channel it confirmed.
+        The acknowledgement still goes over TCP, everything after it through
+        shared memory.
+        """
+        channel = src_module.shm_pending
+        if channel is None:
+            return
+        src_module.shm_pending = None
+        sock = src_module.conn
+
+        # Anything queued for TCP has to arrive before the switch
+        self.send_ack(src_module)
+        try:
+            while not src_module.flush():
+                src_module.wait_writable()
+        except ConnectionError as err:
+            channel.release()
+            self.logger.error(
+                f"Connection Error on write, disconnecting {src_module!s} - {err!s}"
+            )
+            self.disconnect_module(src_module)
+            return
+
+        self.selector.unregister(sock)
+        del self.modules[sock]
+        src_module.conn = channel
+        self.modules[channel] = src_module
+        self.shm_modules.add(src_module)
+        self.selector.register(channel, selectors.EVENT_READ, src_module)
+        # Its doorbell is not armed yet, read whatever arrived in the meantime
+        self.shm_backlog.add(src_module)
+        self.logger.info(f"SHM_CONNECT - {src_module!s}")
+
+    def cancel_shared_memory(self, src_module: Module, msg: Message):
+        """Drop the channel of a module that gave up waiting for the acknowledgement.
+        The cancel is echoed, the module discards everything up to it,
+        including an acknowledgement that arrived too late.
+        """
+        if src_module.shm_pending is not None:
+            src_module.shm_pending.release()
+            src_module.shm_pending = None
+            self.logger.info(f"SHM_CONNECT - {src_module!s} - cancelled")
+        self.send_signal(src_module, MT_SHM_CONNECT_CANCEL)
+
+    def recv_into_all(self, sock: socket.socket, view: memoryview, nbytes: int) -> int:
+        """Equivalent of recv_into with MSG_WAITALL for non-blocking sockets.
+        Returns the number of bytes received, which is only short of nbytes
+        if the connection was closed.
+        """
+        received = 0
+        while received < nbytes:
+            try:
+                n = sock.recv_into(view[received:nbytes])
+            except BlockingIOError:
+                # Rest of the message is still in flight, wait on this socket only
+                select.select([sock], [], [], self.read_timeout)
+                continue
+            if n == 0:
+                break
+            received += n
+        return received
+
+    def reserve_frame(self, data_size: int):
+        """Grow the frame buffer to fit a payload of data_size bytes, keeping the header."""
+        if data_size <= len(self.data_view):
+            return
+        frame_buffer = bytearray(self.header_size + data_size)
+        frame_buffer[: self.header_size] = self.header_view
+        self.frame_buffer = frame_buffer
+        self.frame_view = memoryview(frame_buffer)
+        self.header_view = self.frame_view[: self.header_size]
+        self.data_view = self.frame_view[self.header_size :]
+
+    def snapshot(self, frame: memoryview) -> memoryview:
+        """Immutable copy of a frame for outbound queues.
+        Made at most once per message and shared by all its recipients, so
+        queued bytes survive the next read into the frame buffer.
+        """
+        if frame is not self._snapshot_source:
+            self._snapshot_source = frame
+            self._snapshot = freeze(frame)
+        return self._snapshot
 
     def read_message(self, sock: socket.socket) -> bool:
         # Read LSB Header Section
-        nbytes = sock.recv_into(
-            self.header_buffer, self.header_size, socket.MSG_WAITALL
-        )
+        nbytes = self.recv_into_all(sock, self.header_view, self.header_size)
 
         if nbytes != self.header_size:
             mod = self.modules[sock]
@@ -249,7 +565,8 @@ class MessageManager:
         # Read Data Section
         data_size = self.header.num_data_bytes
         if data_size:
-            nbytes = sock.recv_into(self.data_buffer, data_size, socket.MSG_WAITALL)
+            self.reserve_frame(data_size)
+            nbytes = self.recv_into_all(sock, self.data_view, data_size)
 
             if nbytes != data_size:
                 mod = self.modules[sock]
@@ -261,19 +578,65 @@ class MessageManager:
 
         return True
 
-    def forward_message(
-        self,
-        header: MessageHeader,
-        data: Union[bytes, MessageData],
-        wlist: List[socket.socket],
-    ):
+    def send_to_module(self, module: Module, frame: memoryview) -> bool:
+        """Send or queue a message frame (header and payload) for a module.
+        Returns False if the message was dropped because the module's outbound queue is full.
+        """
+        was_writable = module.writable
+        if not module.send_message(frame, self.snapshot):
+            return False
+
+        if was_writable and not module.writable:
+            self.watch_writable(module)
+
+        if module.queued_bytes > self.send_queue_high_water:
+            if module not in self.congested_modules:
+                self.congested_modules.add(module)
+                self.logger.warning(
+                    f"CONGESTED - {module!s} - {module.queued_bytes} bytes queued"
+                )
+        return True
+
+    def watch_writable(self, module: Module):
+        """Watch for writability until the outbound queue is drained.
+        Shared memory modules ring a doorbell (a read event) when there is room.
+        """
+        if module.shared_memory:
+            return
+        self.selector.modify(
+            module.conn, selectors.EVENT_READ | selectors.EVENT_WRITE, module
+        )
+
+    def flush_module(self, module: Module):
+        try:
+            drained = module.flush()
+        except ConnectionError as err:
+            self.logger.error(
+                f"Connection Error on write, disconnecting {module!s} - {err!s}"
+            )
+            self.disconnect_module(module)
+            return
+
+        if module.queued_bytes <= self.send_queue_high_water:
+            self.congested_modules.discard(module)
+
+        if drained and not module.shared_memory:
+            self.selector.modify(module.conn, selectors.EVENT_READ, module)
+
+    def forward_message(self, header: MessageHeader, frame: memoryview):
         """Forward a message from other modules
+        frame holds the encoded header and payload and is written as is to
+        every recipient, header is only used for routing.
         The given message will be forwarded to:
             - all subscribed logger modules (ALWAYS)
             - if the message has a destination address, and it is subscribed to by that destination it will be forwarded only there
             - if the message has no destination address, it will be forwarded to all subscribed modules
         """
+        # Always forward to logger modules
+        self.send_to_loggers(header, frame)
+        self.send_to_subscribers(header, frame)
 
+    def send_to_subscribers(self, header: MessageHeader, frame: memoryview):
         dest_mod_id = header.dest_mod_id
         dest_host_id = header.dest_host_id
 
@@ -288,115 +651,125 @@ class MessageManager:
                 f"MessageManager::forward_message: Got invalid dest_host_id [{dest_host_id}]"
             )
 
-        # Always forward to logger modules
-        self.send_to_loggers(header, data, wlist)
-
-        # Subscriber set for this message type
-        subscribers = self.subscriptions[header.msg_type]
+        msg_type = header.msg_type
 
         # Send to a specific destination if it is subscribed
         if dest_mod_id > 0:
-            for module in subscribers:
-                if module.id == dest_mod_id:
-                    if module.conn in wlist:
-                        try:
-                            module.send_message(header, data)
-                        except ConnectionError as err:
-                            self.logger.error(
-                                f"Connection Error on write to {module!s} - {err!s}"
-                            )
-                            print("x", end="", flush=True)
-                            self.send_failed_message(module, header, time.time(), wlist)
-                        return
-                    else:
-                        print("x", end="", flush=True)
-                        self.send_failed_message(module, header, time.time(), wlist)
-                        return
-            return  # if specified dest_mod_id is not in subscribers, do not send message (other than to loggers)
-
-        # Send to all subscribed modules
-        for module in subscribers:
-            if module.conn in wlist:
+            if dest_mod_id < MAX_MODULES:
+                module = self.module_by_id[dest_mod_id]
+            else:
+                module = None
+            if module is not None and msg_type in module.subscriptions:
                 try:
-                    module.send_message(header, data)
+                    sent = self.send_to_module(module, frame)
                 except ConnectionError as err:
                     self.logger.error(
                         f"Connection Error on write to {module!s} - {err!s}"
                     )
+                    sent = False
+                if not sent:
                     print("x", end="", flush=True)
-                    self.send_failed_message(module, header, time.time(), wlist)
-            else:
+                    self.send_failed_message(module, header, time.time())
+            return  # if specified dest_mod_id is not in subscribers, do not send message (other than to loggers)
+
+        # Send to all subscribed modules
+        if 0 <= msg_type < MAX_MESSAGE_TYPES:
+            subscribers = self.subscriptions[msg_type]
+        else:
+            subscribers = ()
+        for module in subscribers:
+            try:
+                sent = self.send_to_module(module, frame)
+            except ConnectionError as err:
+                self.logger.error(f"Connection Error on write to {module!s} - {err!s}")
+                sent = False
+            if not sent:
                 print("x", end="", flush=True)
-                self.send_failed_message(module, header, time.time(), wlist)
+                self.send_failed_message(module, header, time.time())
 
-    def send_to_loggers(
-        self, header: MessageHeader, payload, wlist: List[socket.socket]
-    ):
+    def send_to_loggers(self, header: MessageHeader, frame: memoryview):
         for module in self.logger_modules:
-            if module.conn not in wlist:
-                # Block until logger is ready
-                select.select([], [module.conn], [], None)
             try:
-                module.send_message(header, payload)
+                if not self.send_to_module(module, frame):
+                    # Logger queue is full, block until the logger catches up
+                    while not module.flush():
+                        module.wait_writable()
+                    self.send_to_module(module, frame)
             except ConnectionError as err:
                 self.logger.error(f"Connection Error on write to {module!s} - {err!s}")
                 print("x", end="", flush=True)
                 self.send_failed_message(
-                    module, header, time.time(), wlist
+                    module, header, time.time()
                 )  # this could result in inifite recursion, this is prevented by send_failed_message returning if failed message type is failed_message.
 
-    def send_ack(self, src_module: Module, wlist: List[socket.socket]):
+    def send_ack(self, src_module: Module):
         # src_module.send_ack()
+        self.send_signal(src_module, MT_ACKNOWLEDGE)
 
+    def send_signal(self, src_module: Module, msg_type: int):
+        """Send a message without data from the manager to a module."""
         header = self.header_cls()
-        header.msg_type = MT_ACKNOWLEDGE
+        header.msg_type = msg_type
         header.send_time = time.time()
         header.src_mod_id = MID_MESSAGE_MANAGER
         header.dest_mod_id = src_module.id
         header.num_data_bytes = 0
+        frame = encode_frame(header)
 
         try:
-            src_module.send_message(header, b"")
+            sent = self.send_to_module(src_module, frame)
         except ConnectionError as err:
             self.logger.error(f"Connection Error on write to {src_module!s} - {err!s}")
+            sent = False
+        if not sent:
             print("x", end="", flush=True)
-            self.send_failed_message(src_module, header, time.time(), wlist)
+            self.send_failed_message(src_module, header, time.time())
 
         # Always forward to logger modules
-        self.send_to_loggers(header, b"", wlist)
+        self.send_to_loggers(header, frame)
 
     def send_failed_message(
         self,
         dest_module: Module,
         header: MessageHeader,
         time_of_failure: float,
-        wlist: List[socket.socket],
     ):
+        self.send_failed_message_for_id(dest_module.id, header, time_of_failure)
 
-        header = self.header_cls()
+    def send_failed_message_for_id(
+        self,
+        dest_mod_id: int,
+        header: MessageHeader,
+        time_of_failure: float,
+    ):
+        """Report that a message was not delivered to module dest_mod_id."""
+        if header.msg_type == MT_FAILED_MESSAGE:  # avoid unlikely infinite recursion
+            return
+
+        failed_header = self.header_cls()
         data = FAILED_MESSAGE()
 
-        header.msg_type = MT_FAILED_MESSAGE
-        header.send_time = time.time()
-        header.src_mod_id = MID_MESSAGE_MANAGER
-        header.num_data_bytes = ctypes.sizeof(data)
+        failed_header.msg_type = MT_FAILED_MESSAGE
+        failed_header.send_time = time.time()
+        failed_header.src_mod_id = MID_MESSAGE_MANAGER
+        failed_header.num_data_bytes = ctypes.sizeof(data)
 
-        data.dest_mod_id = dest_module.id
+        data.dest_mod_id = dest_mod_id
         data.time_of_failure = time_of_failure
-        data.msg_header = header
-
-        if (
-            data.msg_header.msg_type == MT_FAILED_MESSAGE
-        ):  # avoid unlikely infinite recursion
-            return
+        # The header of the message that was not delivered
+        ctypes.memmove(
+            ctypes.addressof(data.msg_header),
+            ctypes.addressof(header),
+            min(ctypes.sizeof(header), ctypes.sizeof(data.msg_header)),
+        )
 
         # send to logger modules AND modules subscribed to FAILED_MESSAGE
-        self.forward_message(header, data, wlist)
+        self.forward_message(failed_header, encode_frame(failed_header, data))
 
         # add to message count
-        self.message_counts[header.msg_type] += 1
+        self.message_counts[failed_header.msg_type] += 1
 
-    def send_timing_message(self, wlist: List[socket.socket]):
+    def send_timing_message(self):
 
         header = self.header_cls()
         data = TIMING_MESSAGE()
@@ -408,119 +781,192 @@ class MessageManager:
 
         data.send_time = time.time()
 
-        for (mt, count) in self.message_counts.items():
+        for mt, count in self.message_counts.items():
             data.timing[mt] = count
         self.message_counts.clear()
 
         for mod in self.modules.values():
             data.ModulePID[mod.id] = mod.pid
 
-        self.forward_message(header, data, wlist)
+        self.forward_message(header, encode_frame(header, data))
 
     @property
     def message(self) -> Message:
         hdr = self.header
-        return Message(hdr, hdr.get_data.from_buffer(self.data_buffer))
+        entry = message_entry(hdr.msg_type)
+        return Message(hdr, entry.decode(self.data_view, 0, hdr.num_data_bytes, True))
 
-    def process_message(self, src_module: Module, wlist: List[socket.socket]):
+    def process_message(self, src_module: Module):
         hdr = self.header
         msg_type = hdr.msg_type
 
         if msg_type == MT_CONNECT:
             if self.connect_module(src_module, self.message):
-                self.send_ack(src_module, wlist)
+                self.send_ack(src_module)
                 self.logger.info(f"CONNECT - {src_module!s}")
         elif msg_type == MT_DISCONNECT:
-            self.send_ack(src_module, wlist)
+            self.send_ack(src_module)
             self.disconnect_module(src_module)
             self.logger.info(f"DISCONNECT - {src_module!s}")
         elif msg_type == MT_SUBSCRIBE:
             self.add_subscription(src_module, self.message)
-            self.send_ack(src_module, wlist)
+            self.send_ack(src_module)
         elif msg_type == MT_UNSUBSCRIBE:
             self.remove_subscription(src_module, self.message)
-            self.send_ack(src_module, wlist)
+            self.send_ack(src_module)
         elif msg_type == MT_PAUSE_SUBSCRIPTION:
             self.pause_subscription(src_module, self.message)
-            self.send_ack(src_module, wlist)
+            self.send_ack(src_module)
         elif msg_type == MT_RESUME_SUBSCRIPTION:
             self.resume_subscription(src_module, self.message)
-            self.send_ack(src_module, wlist)
+            self.send_ack(src_module)
         elif msg_type == MT_MODULE_READY:
             # used to store module pids
             self.register_module_ready(src_module, self.message)
+        elif msg_type == MT_SHM_CONNECT:
+            self.connect_shared_memory(src_module, self.message)
+        elif msg_type == MT_SHM_CONNECT_CONFIRM:
+            self.confirm_shared_memory(src_module, self.message)
+        elif msg_type == MT_SHM_CONNECT_CANCEL:
+            self.cancel_shared_memory(src_module, self.message)
         else:
             self.logger.debug(f"FORWARD - msg_type:{hdr.msg_type} from {src_module!s}")
-            data = self.data_view[: hdr.num_data_bytes]
-            self.forward_message(hdr, data, wlist)
+            frame = self.frame_view[: self.header_size + hdr.num_data_bytes]
+            self.forward_message(hdr, frame)
 
         # message counts
         self.message_counts[hdr.msg_type] += 1
-        if (
-            self.b_send_msg_timing
-            and (time.time() - self.t_last_message_count)
-            > self.min_timing_message_period
-        ):
-            self.send_timing_message(wlist)
+        if self.b_send_msg_timing:
+            self.check_timing()
+
+    def check_timing(self):
+        """Send a timing message if the last one is older than min_timing_message_period."""
+        if (time.time() - self.t_last_message_count) > self.min_timing_message_period:
+            self.send_timing_message()
             self.t_last_message_count = time.time()
 
+    def run_timers(self):
+        """Called once per event loop iteration, at least every read_timeout."""
+        pass
+
+    def accept_module(self, listen_socket: socket.socket):
+        conn, address = listen_socket.accept()
+        if listen_socket is self.listen_socket:
+            # Disable Nagle Algorithm
+            conn.setsockopt(socket.getprotobyname("tcp"), socket.TCP_NODELAY, 1)
+        else:
+            address = ("unix", self.unix_path)
+        self.logger.info(f"New connection accepted from {address[0]}:{address[1]}")
+        conn.setblocking(False)
+
+        module = Module(
+            conn, address, self.header_cls, max_queued_bytes=self.send_queue_size
+        )
+        self.sockets.append(conn)
+        self.modules[conn] = module
+        self.selector.register(conn, selectors.EVENT_READ, module)
+
     def close(self):
         self._keep_running = False
 
+    def handle_event(self, key: selectors.SelectorKey, mask: int):
+        client_socket = key.fileobj
+        src = key.data
+
+        # Check for an incoming connection request
+        if client_socket in self.listen_sockets:
+            self.accept_module(client_socket)
+            return
+
+        # Module may have been dropped while handling an earlier event
+        if self.modules.get(client_socket) is not src:
+            return
+
+        if mask & selectors.EVENT_WRITE or (src.shared_memory and src.send_queue):
+            self.flush_module(src)
+            if self.modules.get(client_socket) is not src:
+                return
+
+        if mask & selectors.EVENT_READ:
+            self.read_module(src)
+
+    def read_module(self, module: Module):
+        """Read and process the next message from a module.
+        A shared memory channel only rings its doorbell when the ring was
+        empty, so up to SHM_READ_BATCH messages are read and the module is
+        left in shm_backlog if there are more.
+        """
+        conn = module.conn
+        batch = SHM_READ_BATCH if module.shared_memory else 1
+        for _ in range(batch):
+            try:
+                if module.shared_memory and not conn.poll():
+                    return
+                got_msg = self.read_message(conn)
+            except ConnectionError as err:
+                self.logger.error(
+                    f"Connection Error on read, disconnecting  {module!s} - {err!s}"
+                )
+                self.disconnect_module(module)
+                return
+
+            if not got_msg:
+                return
+            self.process_message(module)
+            if self.modules.get(conn) is not module:
+                return
+
+        if module.shared_memory and conn.pending():
+            self.shm_backlog.add(module)
+
+    def read_shm_backlog(self):
+        """Continue with shared memory modules that have unread frames or room for queued ones."""
+        backlog = list(self.shm_backlog)
+        self.shm_backlog.clear()
+        for module in backlog:
+            if self.modules.get(module.conn) is not module:
+                continue
+            if module.send_queue:
+                self.flush_module(module)
+                if self.modules.get(module.conn) is not module:
+                    continue
+            self.read_module(module)
+
     def run(self):
         try:
             while self._keep_running:
-                rlist, _, _ = select.select(
-                    self.modules.keys(), [], [], self.read_timeout
-                )
-
-                # Check for an incoming connection request
-                if len(rlist) > 0:
-                    try:
-                        rlist.remove(self.listen_socket)
-                        (conn, address) = self.listen_socket.accept()
-                        self.logger.info(
-                            f"New connection accepted from {address[0]}:{address[1]}"
-                        )
-
-                        # Disable Nagle Algorithm
-                        conn.setsockopt(
-                            socket.getprotobyname("tcp"), socket.TCP_NODELAY, 1
-                        )
-
-                        self.sockets.append(conn)
-                        self.modules[conn] = Module(conn, address, self.header_cls)
-                    except ValueError:
-                        pass
-
-                    # Randomly select the order of sockets with data.
-                    random.shuffle(rlist)
-
-                    # Check whichs clients are ready to receive data
-                    if rlist:
-                        _, wlist, _ = select.select(
-                            [], self.modules.keys(), [], self.write_timeout
-                        )
-
-                    for client_socket in rlist:
-                        src = self.modules[client_socket]
-                        try:
-                            got_msg = self.read_message(client_socket)
-                        except ConnectionError as err:
-                            self.logger.error(
-                                f"Connection Error on read, disconnecting  {src!s} - {err!s}"
-                            )
-                            self.disconnect_module(src)
-                            continue
-
-                        if got_msg:
-                            self.process_message(src, wlist)
+                if self.shm_backlog:
+                    timeout = 0
+                elif self.shm_modules:
+                    timeout = SHM_POLL_INTERVAL
+                else:
+                    timeout = self.read_timeout
+                events = self.selector.select(timeout)
+
+                # Randomly select the order of sockets with events.
+                random.shuffle(events)
+
+                for key, mask in events:
+                    self.handle_event(key, mask)
+
+                # Doorbells can be missed (see SHM_POLL_INTERVAL), check every
+                # channel on a timer however busy the other sockets are
+                now = time.perf_counter()
+                if now - self.t_last_shm_sweep >= SHM_POLL_INTERVAL:
+                    self.shm_backlog.update(self.shm_modules)
+                    self.t_last_shm_sweep = now
+                if self.shm_backlog:
+                    self.read_shm_backlog()
+
+                self.run_timers()
 
         except KeyboardInterrupt:
             self.logger.info("Stopping Message Manager")
         finally:
             for mod in self.modules:
                 mod.close()
+            self.close_listen_sockets()
+            self.selector.close()
 
 
 if __name__ == "__main__":
@@ -536,6 +982,13 @@ if __name__ == "__main__":
     parser.add_argument(
         "-p", "--port", type=int, default=7111, help="Listener port. Default is 7111."
     )
+    parser.add_argument(
+        "-u",
+        "--unix_path",
+        type=str,
+        default=None,
+        help="Also listen on this Unix domain socket path, for clients connecting to 'unix:<path>'.",
+    )
     parser.add_argument("-d", "--debug", action="store_true", help="Debug mode")
     parser.add_argument(
         "-t", "--timecode", action="store_true", help="Use timecode in message header"
@@ -546,6 +999,31 @@ if __name__ == "__main__":
         action="store_true",
         help="Disable sending of TIMING_MESSAGE",
     )
+    parser.add_argument(
+        "--queue_size",
+        type=int,
+        default=DEFAULT_SEND_QUEUE_SIZE,
+        help=f"Outbound queue size per module in bytes. Default is {DEFAULT_SEND_QUEUE_SIZE}.",
+    )
+    parser.add_argument(
+        "--queue_high_water",
+        type=int,
+        default=DEFAULT_SEND_QUEUE_HIGH_WATER,
+        help=f"Outbound queue size in bytes above which a module is reported as congested. Default is {DEFAULT_SEND_QUEUE_HIGH_WATER}.",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["select", "asyncio"],
+        default="select",
+        help="Event loop engine. 'asyncio' uses uvloop when it is installed. Default is 'select'.",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes sharing the connections (select engine, needs SO_REUSEPORT and x86-64, one process otherwise). Default is 1.",
+    )
     args = parser.parse_args()
 
     if args.addr:  # a non-empty host address was passed in.
@@ -553,12 +1031,32 @@ if __name__ == "__main__":
     else:
         ip_addr = socket.INADDR_ANY
 
-    msg_mgr = MessageManager(
+    kwargs = {}
+    if args.engine == "asyncio":
+        from .aio import AsyncMessageManager as manager_cls
+    else:
+        manager_cls = MessageManager
+    if args.workers > 1:
+        from .shard import ShardedMessageManager, check_sharding_supported
+
+        try:
+            check_sharding_supported()
+        except RuntimeError as err:
+            logging.getLogger(__name__).warning(f"{err!s} Running one process.")
+        else:
+            manager_cls = ShardedMessageManager
+            kwargs["num_workers"] = args.workers
+
+    msg_mgr = manager_cls(
         ip_address=ip_addr,
         port=args.port,
         timecode=args.timecode,
         debug=args.debug,
         send_msg_timing=(not args.disable_timing_msg),
+        send_queue_size=args.queue_size,
+        send_queue_high_water=args.queue_high_water,
+        unix_path=args.unix_path,
+        **kwargs,
     )
 
     msg_mgr.run()
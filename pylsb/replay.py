@@ -0,0 +1,275 @@
+import argparse
+import ctypes
+import mmap
+import struct
+import time
+
+from array import array
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+from ._core import *
+from .constants import *
+from .client import Client, NotConnectedError
+from .logger import LOG_MAGIC, LOG_VERSION, LOG_FILE_HEADER
+
+__all__ = ["ReplayStats", "LogReplay"]
+
+# Frames due within this many seconds of each other go out in one sendmsg
+DEFAULT_BATCH_WINDOW = 0.001
+
+# Largest batch copied out of the log at once
+MAX_BATCH_BYTES = 4 * 1024**2
+
+
+@dataclass
+class ReplayStats:
+    """Outcome of a replay. Jitter is how late each batch went out relative
+    to its scheduled time, in seconds.
+    """
+
+    num_messages: int = 0
+    num_bytes: int = 0
+    duration: float = 0.0
+    target_duration: float = 0.0
+    jitter: List[float] = field(default_factory=list, repr=False)
+
+    @property
+    def rate(self) -> float:
+        return self.num_messages / self.duration if self.duration else 0.0
+
+    @property
+    def target_rate(self) -> float:
+        if not self.target_duration:
+            return float("inf")
+        return self.num_messages / self.target_duration
+
+    @property
+    def mean_jitter(self) -> float:
+        return sum(self.jitter) / len(self.jitter) if self.jitter else 0.0
+
+    @property
+    def max_jitter(self) -> float:
+        return max(self.jitter, default=0.0)
+
+    def jitter_percentile(self, percent: float) -> float:
+        if not self.jitter:
+            return 0.0
+        ordered = sorted(self.jitter)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+    def __str__(self) -> str:
+        return (
+            f"{self.num_messages} messages | {self.num_bytes / 1e6:0.1f} MB | "
+            f"{self.rate:0.0f} messages/sec (target {self.target_rate:0.0f}) | "
+            f"{self.duration:0.3f} sec (target {self.target_duration:0.3f}) | "
+            f"jitter mean {self.mean_jitter * 1e6:0.0f} usec, "
+            f"p99 {self.jitter_percentile(99) * 1e6:0.0f} usec, "
+            f"max {self.max_jitter * 1e6:0.0f} usec"
+        )
+
+
+class LogReplay:
+    """Republish the messages of a QuickLogger log through a connected Client.
+    Frames keep their recorded headers (send_time is restamped) and go out
+    in their recorded order, spaced by their recorded recv_times divided by
+    speed, or back to back if speed is 0. Frames due together are copied out
+    of the memory-mapped log and sent as one batch.
+    By default only user message types are replayed, not the core messages
+    (connects, subscriptions, acknowledgements) of the recorded session.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        msg_types: Optional[Iterable[int]] = None,
+        speed: float = 1.0,
+        batch_window: float = DEFAULT_BATCH_WINDOW,
+    ):
+        self.path = path
+        self.msg_types = None if msg_types is None else set(msg_types)
+        self.speed = speed
+        self.batch_window = batch_window
+
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self.mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            # Frames are read front to back, let the kernel read ahead
+            self.mm.madvise(mmap.MADV_SEQUENTIAL)  # novermin
+
+        (
+            magic,
+            version,
+            self.header_size,
+            data_offset,
+            data_size,
+            self.num_frames,
+            num_types,
+            index_offset,
+        ) = LOG_FILE_HEADER.unpack_from(self.mm)
+        if magic != LOG_MAGIC or version != LOG_VERSION:
+            raise ValueError(f"{path} is not a version {LOG_VERSION} message log")
+        if index_offset == 0:
+            raise ValueError(
+                f"{path} has no index yet, dump or close the logger that writes it"
+            )
+
+        for timecode in (False, True):
+            header_cls = get_header_cls(timecode)
+            if ctypes.sizeof(header_cls) == self.header_size:
+                break
+        else:
+            raise ValueError(f"Unknown message header size {self.header_size}")
+        # msg_type and num_data_bytes with one unpack
+        self.frame_struct = struct.Struct(f"=i{header_cls.num_data_bytes.offset - 4}xi")
+        self.send_time_offset = header_cls.send_time.offset
+        self.send_time_struct = struct.Struct("=d")
+
+        self.frame_offsets = array("q")
+        self.frame_offsets.frombytes(
+            self.mm[index_offset : index_offset + 8 * self.num_frames]
+        )
+        self.frame_times = array("d")
+        self.frame_times.frombytes(
+            self.mm[
+                index_offset + 8 * self.num_frames : index_offset + 16 * self.num_frames
+            ]
+        )
+        self.batch_buffer = bytearray(MAX_BATCH_BYTES)
+
+    def close(self):
+        self.mm.close()
+
+    def __enter__(self) -> "LogReplay":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def wanted(self, msg_type: int) -> bool:
+        if self.msg_types is None:
+            return msg_type > MAX_LSB_MSG_TYPE
+        return msg_type in self.msg_types
+
+    def run(self, client: Client) -> ReplayStats:
+        """Replay the whole log through client, blocking until the last frame is sent."""
+        if not client.connected:
+            raise NotConnectedError
+        if ctypes.sizeof(client.header_cls) != self.header_size:
+            raise ValueError("The client and the log use different message headers")
+
+        stats = ReplayStats()
+        mm = self.mm
+        unpack_from = self.frame_struct.unpack_from
+        header_size = self.header_size
+        offsets = self.frame_offsets
+        times = self.frame_times
+        speed = self.speed
+        num_frames = self.num_frames
+
+        # Skip to the first wanted frame, the schedule starts there
+        n = 0
+        while n < num_frames and not self.wanted(unpack_from(mm, offsets[n])[0]):
+            n += 1
+        if n == num_frames:
+            return stats
+        first_time = times[n]
+        last_time = first_time
+        start = time.perf_counter()
+
+        while n < num_frames:
+            # Scheduled time of the next frame and the frames due with it
+            due = (times[n] - first_time) / speed if speed else 0.0
+            window_end = due + self.batch_window
+            wait = start + due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+
+            runs = []  # (offset, size) of contiguous runs of wanted frames
+            batch_bytes = 0
+            while n < num_frames:
+                if speed and (times[n] - first_time) / speed > window_end:
+                    break
+                offset = offsets[n]
+                msg_type, num_data_bytes = unpack_from(mm, offset)
+                size = header_size + num_data_bytes
+                if batch_bytes and batch_bytes + size > MAX_BATCH_BYTES:
+                    break
+                n += 1
+                if not self.wanted(msg_type):
+                    continue
+                last_time = times[n - 1]
+                if runs and runs[-1][0] + runs[-1][1] == offset:
+                    runs[-1][1] += size
+                else:
+                    runs.append([offset, size])
+                batch_bytes += size
+                stats.num_messages += 1
+
+            if batch_bytes:
+                if speed:
+                    late = time.perf_counter() - start - due
+                    stats.jitter.append(max(late, 0.0))
+                self._send_batch(client, runs, batch_bytes)
+                stats.num_bytes += batch_bytes
+
+        stats.duration = time.perf_counter() - start
+        stats.target_duration = (last_time - first_time) / speed if speed else 0.0
+        return stats
+
+    def _send_batch(self, client: Client, runs: List[List[int]], nbytes: int):
+        """Copy the runs of frames out of the log, restamp them and send them together."""
+        if len(self.batch_buffer) < nbytes:
+            self.batch_buffer = bytearray(nbytes)
+        buffer = self.batch_buffer
+        pos = 0
+        for offset, size in runs:
+            buffer[pos : pos + size] = self.mm[offset : offset + size]
+            pos += size
+
+        send_time = time.time()
+        pack_into = self.send_time_struct.pack_into
+        unpack_from = self.frame_struct.unpack_from
+        header_size = self.header_size
+        pos = 0
+        while pos < nbytes:
+            pack_into(buffer, pos + self.send_time_offset, send_time)
+            pos += header_size + unpack_from(buffer, pos)[1]
+
+        with memoryview(buffer) as view:
+            client.send_frames((view[:nbytes],), nbytes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded message log")
+    parser.add_argument("path", help="Log file written by pylsb.logger.")
+    parser.add_argument(
+        "-s",
+        "--server",
+        default="127.0.0.1:7111",
+        help="Message manager address, ip:port or unix:/path. Default is 127.0.0.1:7111.",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Playback speed, 2 replays twice as fast, 0 as fast as possible. Default is 1.",
+    )
+    parser.add_argument(
+        "--types",
+        type=int,
+        nargs="*",
+        default=None,
+        help="Message types to replay. Default is every user message type.",
+    )
+    parser.add_argument(
+        "-t", "--timecode", action="store_true", help="Use timecode in message header"
+    )
+    args = parser.parse_args()
+
+    client = Client(timecode=args.timecode)
+    client.connect(server_name=args.server)
+    with LogReplay(args.path, msg_types=args.types, speed=args.speed) as replay:
+        stats = replay.run(client)
+    client.disconnect()
+    print(stats)
@@ -0,0 +1,517 @@
+import ctypes
+import logging
+import multiprocessing
+import os
+import selectors
+import socket
+import struct
+import time
+
+from ._core import *
+from .constants import *
+from .manager import Module, MessageManager, encode_frame
+from .shm import attach_shared_memory, check_memory_ordering, create_shared_memory
+
+from typing import Iterator, List, Optional, Tuple, Union
+
+__all__ = ["ShardedMessageManager", "check_sharding_supported"]
+
+DEFAULT_RING_SIZE = 8 * 1024**2
+
+# A relayed frame is for the loggers and/or the subscribers of the receiving shard
+RELAY_LOGGERS = 1
+RELAY_SUBSCRIBERS = 2
+
+
+def check_sharding_supported():
+    """Raise RuntimeError if ShardedMessageManager cannot run on this platform."""
+    if not hasattr(socket, "SO_REUSEPORT") or not hasattr(socket, "AF_UNIX"):
+        raise RuntimeError(
+            "ShardedMessageManager needs SO_REUSEPORT, use MessageManager on this platform."
+        )
+    # The rings between shards rely on x86-64 store ordering, like ShmChannel
+    try:
+        check_memory_ordering()
+    except OSError as err:
+        raise RuntimeError(
+            f"ShardedMessageManager is not supported on this CPU, use MessageManager. {err!s}"
+        ) from None
+
+
+def shared_tables_cls(num_shards: int) -> type:
+    class SharedTables(ctypes.Structure):
+        """Routing state shared by all shards of a ShardedMessageManager.
+        Every shard only writes its own entries, except for module ids which
+        are claimed under a lock.
+        """
+
+        _fields_ = [
+            ("running", ctypes.c_uint8),
+            # Shard + 1 hosting each module id, 0 if the id is free
+            ("module_shard", ctypes.c_uint8 * MAX_MODULES),
+            ("module_pid", ctypes.c_int * MAX_MODULES),
+            ("module_logger", ctypes.c_uint8 * MAX_MODULES),
+            # Subscribed flag per message type and module id, to report
+            # the modules that miss a message dropped on a full ring
+            ("module_subscribed", ctypes.c_uint8 * (MAX_MESSAGE_TYPES * MAX_MODULES)),
+            ("num_loggers", ctypes.c_uint16 * num_shards),
+            # Shards with subscribers, num_shards flags per message type
+            ("subscribed", ctypes.c_uint8 * (MAX_MESSAGE_TYPES * num_shards)),
+            # Messages processed per shard and type, wrapping counters
+            ("message_counts", (ctypes.c_uint32 * MAX_MESSAGE_TYPES) * num_shards),
+        ]
+
+    return SharedTables
+
+
+class ShmRing:
+    """Single producer, single consumer ring of frames in shared memory.
+    Entries are a length and relay kind followed by the frame, 8-byte
+    aligned. head and tail only grow and each is written by one side, on
+    separate cache lines. Entries are published by storing tail after the
+    frame, which relies on stores becoming visible in order. This holds on
+    x86-64 only, weakly ordered CPUs such as ARM64 are not supported.
+    """
+
+    HEAD_OFFSET = 0
+    TAIL_OFFSET = 64
+    DATA_OFFSET = 128
+    WRAP = 0xFFFFFFFF
+
+    position = struct.Struct("=Q")
+    entry = struct.Struct("=II")
+
+    def __init__(self, buf: memoryview):
+        self.buf = buf
+        self.data = buf[self.DATA_OFFSET :]
+        self.capacity = len(self.data) & ~7
+        (self.head,) = self.position.unpack_from(buf, self.HEAD_OFFSET)
+        (self.tail,) = self.position.unpack_from(buf, self.TAIL_OFFSET)
+
+    def push(self, kind: int, frame: memoryview) -> bool:
+        """Append a frame. Returns False if the ring is full."""
+        nbytes = frame.nbytes
+        size = (self.entry.size + nbytes + 7) & ~7
+        pos = self.tail % self.capacity
+        room = self.capacity - pos
+        skip = room if size > room else 0
+
+        (head,) = self.position.unpack_from(self.buf, self.HEAD_OFFSET)
+        if self.tail + skip + size - head > self.capacity:
+            return False
+
+        if skip:
+            # Entries do not wrap, mark the rest of the ring as unused
+            self.entry.pack_into(self.data, pos, self.WRAP, 0)
+            pos = 0
+        self.entry.pack_into(self.data, pos, nbytes, kind)
+        start = pos + self.entry.size
+        self.data[start : start + nbytes] = frame
+
+        self.tail += skip + size
+        self.position.pack_into(self.buf, self.TAIL_OFFSET, self.tail)
+        return True
+
+    def pop(self) -> Iterator[Tuple[int, memoryview]]:
+        """Yield (kind, frame) for every queued entry. A frame is only valid
+        until the next one is requested, its space is released then.
+        """
+        (tail,) = self.position.unpack_from(self.buf, self.TAIL_OFFSET)
+        while self.head < tail:
+            pos = self.head % self.capacity
+            nbytes, kind = self.entry.unpack_from(self.data, pos)
+            if nbytes == self.WRAP:
+                self.head += self.capacity - pos
+            else:
+                start = pos + self.entry.size
+                yield kind, self.data[start : start + nbytes]
+                self.head += (self.entry.size + nbytes + 7) & ~7
+            self.position.pack_into(self.buf, self.HEAD_OFFSET, self.head)
+            if self.head == tail:
+                (tail,) = self.position.unpack_from(self.buf, self.TAIL_OFFSET)
+
+
+class SharedCounts:
+    """Counter-like access to one shard's message counts in shared memory."""
+
+    def __init__(self, counts: ctypes.Array):
+        self.counts = counts
+
+    def __getitem__(self, msg_type: int) -> int:
+        if 0 <= msg_type < MAX_MESSAGE_TYPES:
+            return self.counts[msg_type]
+        return 0
+
+    def __setitem__(self, msg_type: int, count: int):
+        if 0 <= msg_type < MAX_MESSAGE_TYPES:
+            self.counts[msg_type] = count
+
+
+class ShardWorker(MessageManager):
+    """MessageManager for the connections of one shard.
+    Local routing is unchanged. Messages for loggers or subscribers on other
+    shards are pushed to their rings, followed by a doorbell datagram that
+    wakes up their event loop.
+    """
+
+    def __init__(
+        self,
+        index: int,
+        num_shards: int,
+        tables_name: str,
+        rings_name: str,
+        ring_size: int,
+        doorbells: List[Tuple[socket.socket, socket.socket]],
+        id_lock,
+        ip_address: Union[str, int] = socket.INADDR_ANY,
+        port: int = 7111,
+        **kwargs,
+    ):
+        self.index = index
+        self.num_shards = num_shards
+        self.id_lock = id_lock
+
+        # Spawned workers share the resource tracker of the process that
+        # created the segments
+        self.tables_shm = attach_shared_memory(tables_name, shared_tracker=True)
+        self.tables = shared_tables_cls(num_shards).from_buffer(self.tables_shm.buf)
+
+        # Ring (i -> j) carries frames from shard i to shard j
+        self.rings_shm = attach_shared_memory(rings_name, shared_tracker=True)
+        rings = self.rings_shm.buf
+        self.out_rings: List[Optional[ShmRing]] = [None] * num_shards
+        self.in_rings: List[ShmRing] = []
+        for shard in range(num_shards):
+            if shard == index:
+                continue
+            offset = (index * num_shards + shard) * ring_size
+            self.out_rings[shard] = ShmRing(rings[offset : offset + ring_size])
+            offset = (shard * num_shards + index) * ring_size
+            self.in_rings.append(ShmRing(rings[offset : offset + ring_size]))
+
+        self.doorbell = doorbells[index][0]
+        self.doorbells = [ring_socket for doorbell, ring_socket in doorbells]
+        for sock in [self.doorbell] + self.doorbells:
+            sock.setblocking(False)
+
+        # Shard 0 reports timing for all shards from a timer, so it is sent
+        # whichever shards the traffic is on
+        self.send_timing = index == 0 and kwargs.get("send_msg_timing", True)
+        kwargs["send_msg_timing"] = False
+        if index != 0:
+            # Shard 0 is the only one on the Unix socket path, a path cannot
+            # be shared like a port
+            kwargs.pop("unix_path", None)
+        super().__init__(ip_address, port, **kwargs)
+
+        self.message_counts = SharedCounts(self.tables.message_counts[index])
+        self.last_counts = [[0] * MAX_MESSAGE_TYPES for _ in range(num_shards)]
+        self.selector.register(self.doorbell, selectors.EVENT_READ, None)
+
+    @property
+    def _keep_running(self) -> bool:
+        return bool(self.tables.running)
+
+    @_keep_running.setter
+    def _keep_running(self, keep_running: bool):
+        self.tables.running = int(keep_running)
+
+    def create_listen_socket(self, ip_address: str, port: int) -> socket.socket:
+        # All shards listen on the same port, the kernel spreads connections
+        listen_socket = socket.socket(
+            family=socket.AF_INET, type=socket.SOCK_STREAM, proto=socket.IPPROTO_TCP
+        )
+        listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        listen_socket.bind((ip_address, port))
+        listen_socket.listen(socket.SOMAXCONN)
+        return listen_socket
+
+    def module_id_in_use(self, mod_id: int) -> bool:
+        return self.tables.module_shard[mod_id] != 0
+
+    def connect_module(self, src_module: Module, msg: Message):
+        with self.id_lock:
+            if not super().connect_module(src_module, msg):
+                return False
+            self.tables.module_shard[src_module.id] = self.index + 1
+        if src_module.is_logger:
+            self.tables.module_logger[src_module.id] = 1
+            self.tables.num_loggers[self.index] += 1
+        return True
+
+    def remove_module(self, module: Module):
+        if self.module_by_id[module.id] is module:
+            self.tables.module_pid[module.id] = 0
+            self.tables.module_shard[module.id] = 0
+        if module in self.logger_modules:
+            self.tables.module_logger[module.id] = 0
+            self.tables.num_loggers[self.index] -= 1
+        super().remove_module(module)
+
+    def register_module_ready(self, src_module: Module, msg: Message):
+        super().register_module_ready(src_module, msg)
+        if self.module_by_id[src_module.id] is src_module:
+            self.tables.module_pid[src_module.id] = src_module.pid
+
+    def add_subscription(self, src_module: Module, msg: Message):
+        super().add_subscription(src_module, msg)
+        self.update_subscribed(src_module, SUBSCRIBE.unpack_from(msg.data)[0])
+
+    def unsubscribe_module(self, module: Module, msg_type: int):
+        super().unsubscribe_module(module, msg_type)
+        self.update_subscribed(module, msg_type)
+
+    def update_subscribed(self, module: Module, msg_type: int):
+        if 0 <= msg_type < MAX_MESSAGE_TYPES:
+            self.tables.subscribed[msg_type * self.num_shards + self.index] = int(
+                bool(self.subscriptions[msg_type])
+            )
+            if self.module_by_id[module.id] is module:
+                self.tables.module_subscribed[msg_type * MAX_MODULES + module.id] = int(
+                    msg_type in module.subscriptions
+                )
+
+    def forward_message(self, header: MessageHeader, frame: memoryview):
+        MessageManager.send_to_loggers(self, header, frame)
+        self.send_to_subscribers(header, frame)
+        self.relay(header, frame, RELAY_LOGGERS | RELAY_SUBSCRIBERS)
+
+    def send_to_loggers(self, header: MessageHeader, frame: memoryview):
+        super().send_to_loggers(header, frame)
+        self.relay(header, frame, RELAY_LOGGERS)
+
+    def relay(self, header: MessageHeader, frame: memoryview, kinds: int):
+        """Push a frame to the shards with loggers or subscribers for it."""
+        tables = self.tables
+        num_shards = self.num_shards
+
+        subscribed = [False] * num_shards
+        msg_type = header.msg_type
+        if kinds & RELAY_SUBSCRIBERS and 0 <= msg_type < MAX_MESSAGE_TYPES:
+            row = msg_type * num_shards
+            dest_mod_id = header.dest_mod_id
+            if dest_mod_id > 0:
+                if dest_mod_id < MAX_MODULES:
+                    shard = tables.module_shard[dest_mod_id] - 1
+                    if shard >= 0:
+                        subscribed[shard] = bool(tables.subscribed[row + shard])
+            else:
+                subscribed = tables.subscribed[row : row + num_shards]
+
+        for shard in range(num_shards):
+            if shard == self.index:
+                continue
+            kind = 0
+            if kinds & RELAY_LOGGERS and tables.num_loggers[shard]:
+                kind |= RELAY_LOGGERS
+            if subscribed[shard]:
+                kind |= RELAY_SUBSCRIBERS
+            if not kind:
+                continue
+
+            if not self.out_rings[shard].push(kind, frame):
+                print("x", end="", flush=True)
+                self.logger.warning(
+                    f"DROPPING - msg_type:{msg_type} - ring to shard {shard} is full"
+                )
+                # Like a full send queue, reported for every module that missed it
+                time_of_failure = time.time()
+                for mod_id in self.missed_by(header, shard, kind):
+                    self.send_failed_message_for_id(mod_id, header, time_of_failure)
+                continue
+            try:
+                self.doorbells[shard].send(b"\0")
+            except BlockingIOError:
+                pass  # Doorbells are already pending
+
+    def missed_by(self, header: MessageHeader, shard: int, kind: int) -> List[int]:
+        """Ids of the modules on a shard that a relayed frame was meant for."""
+        tables = self.tables
+        on_shard = [
+            mod_id
+            for mod_id in range(1, MAX_MODULES)
+            if tables.module_shard[mod_id] == shard + 1
+        ]
+        mod_ids = set()
+        if kind & RELAY_LOGGERS:
+            mod_ids.update(
+                mod_id for mod_id in on_shard if tables.module_logger[mod_id]
+            )
+        if kind & RELAY_SUBSCRIBERS:
+            # A message with a destination is only for that module
+            if header.dest_mod_id > 0:
+                on_shard = (
+                    [header.dest_mod_id] if header.dest_mod_id in on_shard else []
+                )
+            row = header.msg_type * MAX_MODULES
+            mod_ids.update(
+                mod_id for mod_id in on_shard if tables.module_subscribed[row + mod_id]
+            )
+        return sorted(mod_ids)
+
+    def handle_event(self, key: selectors.SelectorKey, mask: int):
+        if key.fileobj is self.doorbell:
+            self.process_relayed()
+        else:
+            super().handle_event(key, mask)
+
+    def process_relayed(self):
+        """Deliver the frames other shards pushed to this one."""
+        try:
+            while self.doorbell.recv(64):
+                pass
+        except BlockingIOError:
+            pass
+
+        for ring in self.in_rings:
+            for kind, frame in ring.pop():
+                header = self.header_cls.from_buffer_copy(frame)
+                if kind & RELAY_LOGGERS:
+                    MessageManager.send_to_loggers(self, header, frame)
+                if kind & RELAY_SUBSCRIBERS:
+                    self.send_to_subscribers(header, frame)
+        self._snapshot_source = None
+
+    def send_timing_message(self):
+        header = self.header_cls()
+        data = TIMING_MESSAGE()
+
+        header.msg_type = MT_TIMING_MESSAGE
+        header.send_time = time.time()
+        header.src_mod_id = MID_MESSAGE_MANAGER
+        header.num_data_bytes = ctypes.sizeof(data)
+
+        data.send_time = time.time()
+
+        # Counters are cumulative, report what changed since the last message
+        for shard in range(self.num_shards):
+            counts = self.tables.message_counts[shard][:]
+            last_counts = self.last_counts[shard]
+            for mt, count in enumerate(counts):
+                if count != last_counts[mt]:
+                    data.timing[mt] += (count - last_counts[mt]) & 0xFFFFFFFF
+            self.last_counts[shard] = counts
+
+        ctypes.memmove(
+            data.ModulePID, self.tables.module_pid, ctypes.sizeof(data.ModulePID)
+        )
+
+        self.forward_message(header, encode_frame(header, data))
+
+    def run_timers(self):
+        if self.send_timing:
+            self.check_timing()
+
+    def run(self):
+        try:
+            super().run()
+        finally:
+            self.detach()
+
+    def detach(self):
+        """Release every view of the shared memory, then close it."""
+        self._snapshot_source = self._snapshot = None
+        del self.message_counts
+        del self.tables
+        for ring in self.in_rings + self.out_rings:
+            if ring is not None:
+                ring.data.release()
+                ring.buf.release()
+        self.tables_shm.close()
+        self.rings_shm.close()
+
+
+def run_shard(*args, **kwargs):
+    worker = ShardWorker(*args, **kwargs)
+    worker.run()
+
+
+class ShardedMessageManager:
+    """MessageManager spread over num_workers processes.
+    Every worker accepts connections on the same port (SO_REUSEPORT) and
+    routes for its own modules. Subscriptions, module ids and logger counts
+    are shared through shared memory, messages for other shards go through
+    shared-memory rings. Routing semantics are the same as MessageManager.
+    """
+
+    def __init__(
+        self,
+        ip_address: Union[str, int] = socket.INADDR_ANY,
+        port: int = 7111,
+        num_workers: Optional[int] = None,
+        ring_size: int = DEFAULT_RING_SIZE,
+        **kwargs,
+    ):
+        check_sharding_supported()
+
+        self.ip_address = ip_address
+        self.port = port
+        self.num_workers = num_workers or os.cpu_count()
+        self.ring_size = ring_size
+        self.kwargs = kwargs
+        self.read_timeout = 0.200
+        self.logger = logging.getLogger(f"ShardedMessageManager@{ip_address}:{port}")
+        self._keep_running = True
+
+    def close(self):
+        self._keep_running = False
+
+    def run(self):
+        num_shards = self.num_workers
+        tables_cls = shared_tables_cls(num_shards)
+        tables_shm = create_shared_memory(ctypes.sizeof(tables_cls))
+        rings_shm = create_shared_memory(num_shards * num_shards * self.ring_size)
+        tables = tables_cls.from_buffer(tables_shm.buf)
+        tables.running = 1
+
+        context = multiprocessing.get_context("spawn")
+        id_lock = context.Lock()
+        doorbells = [
+            socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+            for _ in range(num_shards)
+        ]
+        workers = [
+            context.Process(
+                target=run_shard,
+                args=(
+                    index,
+                    num_shards,
+                    tables_shm.name,
+                    rings_shm.name,
+                    self.ring_size,
+                    doorbells,
+                    id_lock,
+                    self.ip_address,
+                    self.port,
+                ),
+                kwargs=self.kwargs,
+                daemon=True,
+            )
+            for index in range(num_shards)
+        ]
+
+        try:
+            for worker in workers:
+                worker.start()
+            while self._keep_running and tables.running:
+                if not all(worker.is_alive() for worker in workers):
+                    self.logger.error("Shard worker exited, stopping")
+                    break
+                time.sleep(self.read_timeout)
+        except KeyboardInterrupt:
+            self.logger.info("Stopping Message Manager")
+        finally:
+            tables.running = 0
+            for worker in workers:
+                if worker.pid is None:
+                    continue
+                worker.join(timeout=2)
+                if worker.is_alive():
+                    worker.terminate()
+            del tables
+            for doorbell, ring_socket in doorbells:
+                doorbell.close()
+                ring_socket.close()
+            for shm in (tables_shm, rings_shm):
+                shm.close()
+                shm.unlink()
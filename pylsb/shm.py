@@ -0,0 +1,431 @@
+import os
+import select
+import socket
+import struct
+import sys
+import time
+
+from typing import Optional, Sequence, TYPE_CHECKING
+
+from .constants import SHM_NONCE_LENGTH
+
+if TYPE_CHECKING:
+    from multiprocessing import shared_memory  # novermin
+
+__all__ = ["ShmChannel", "DEFAULT_SHM_RING_SIZE", "is_local_peer"]
+
+DEFAULT_SHM_RING_SIZE = 4 * 1024**2
+
+# Longest a side goes without checking its rings. A side stores its waiting
+# flag, then loads the peer's ring position, and the peer does the reverse.
+# x86-64 may reorder such a store and load, and Python cannot put a fence
+# between them, so a doorbell can be missed. Client waits and the manager's
+# sweep of its shared memory modules are bounded by this interval instead.
+SHM_POLL_INTERVAL = 0.005
+
+DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0)
+
+# The segment starts with a random nonce written by the client, the manager
+# only attaches if the SHM_CONNECT request carries the same one. The rings
+# follow on the next cache line.
+SHM_HEADER_SIZE = 64
+
+
+# The rings publish their positions with plain 8 byte stores and rely on the
+# CPU keeping stores in order, as x86-64 does. Other CPUs stay on TCP.
+SUPPORTED_MACHINES = ("x86_64", "amd64")
+
+
+def check_memory_ordering():
+    """Raise OSError unless this CPU is one the rings are safe on."""
+    import platform
+
+    machine = platform.machine()
+    if machine.lower() not in SUPPORTED_MACHINES:
+        raise OSError(f"Shared memory rings need x86-64, not {machine or 'unknown'}")
+
+
+# Segments created by this process, its resource tracker unlinks them on exit
+created_names = set()
+
+
+# multiprocessing is only imported once shared memory is used, it adds to
+# the startup of every module otherwise
+def create_shared_memory(size: int) -> "shared_memory.SharedMemory":
+    from multiprocessing import shared_memory  # novermin
+
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    created_names.add(shm.name)
+    return shm
+
+
+def attach_shared_memory(
+    name: str, shared_tracker: bool = False
+) -> "shared_memory.SharedMemory":
+    """Open an existing segment without handing it to this process' resource
+    tracker, which would otherwise unlink it when this process exits.
+    With shared_tracker, the creator's tracker is also this process' (e.g. a
+    multiprocessing parent) and keeps the registration. Unregistering it
+    here would drop the creator's registration as well.
+    """
+    from multiprocessing import resource_tracker, shared_memory  # novermin
+
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    shm = shared_memory.SharedMemory(name)
+    if sys.platform != "win32" and not shared_tracker and name not in created_names:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def is_local_peer(sock: socket.socket) -> bool:
+    """True if sock is connected over a Unix domain socket or from a loopback address."""
+    if sock.family == getattr(socket, "AF_UNIX", None):
+        return True
+    try:
+        host = sock.getpeername()[0]
+    except OSError:
+        return False
+    import ipaddress
+
+    try:
+        addr = ipaddress.ip_address(host.split("%")[0])
+    except ValueError:
+        return False
+    mapped = getattr(addr, "ipv4_mapped", None)
+    return (mapped or addr).is_loopback
+
+
+class ByteRing:
+    """Single producer, single consumer byte stream in shared memory.
+    head is written by the reader, tail by the writer, on separate cache
+    lines. Each side also owns a flag asking the other for a doorbell: the
+    reader when it waits for data, the writer when it waits for space.
+    Data is published by storing tail after the copy, which relies on
+    stores becoming visible in order. ShmChannel only uses it on x86-64.
+    """
+
+    HEAD_OFFSET = 0
+    READER_WAITING_OFFSET = 8
+    TAIL_OFFSET = 64
+    WRITER_WAITING_OFFSET = 72
+    DATA_OFFSET = 128
+
+    position = struct.Struct("=Q")
+
+    def __init__(self, buf: memoryview):
+        self.buf = buf
+        self.data = buf[self.DATA_OFFSET :]
+        self.capacity = len(self.data)
+
+    @property
+    def head(self) -> int:
+        return self.position.unpack_from(self.buf, self.HEAD_OFFSET)[0]
+
+    @property
+    def tail(self) -> int:
+        return self.position.unpack_from(self.buf, self.TAIL_OFFSET)[0]
+
+    @property
+    def reader_waiting(self) -> bool:
+        return bool(self.buf[self.READER_WAITING_OFFSET])
+
+    @reader_waiting.setter
+    def reader_waiting(self, waiting: bool):
+        self.buf[self.READER_WAITING_OFFSET] = int(waiting)
+
+    @property
+    def writer_waiting(self) -> bool:
+        return bool(self.buf[self.WRITER_WAITING_OFFSET])
+
+    @writer_waiting.setter
+    def writer_waiting(self, waiting: bool):
+        self.buf[self.WRITER_WAITING_OFFSET] = int(waiting)
+
+    def readable(self) -> int:
+        return self.tail - self.head
+
+    def writable(self) -> int:
+        return self.capacity - (self.tail - self.head)
+
+    def write(self, view: memoryview) -> int:
+        """Copy as much of view as fits. Returns the number of bytes written."""
+        tail = self.tail
+        nbytes = min(view.nbytes, self.capacity - (tail - self.head))
+        if nbytes <= 0:
+            return 0
+        pos = tail % self.capacity
+        first = min(nbytes, self.capacity - pos)
+        self.data[pos : pos + first] = view[:first]
+        if first < nbytes:
+            self.data[: nbytes - first] = view[first:nbytes]
+        self.position.pack_into(self.buf, self.TAIL_OFFSET, tail + nbytes)
+        return nbytes
+
+    def read_into(self, view: memoryview) -> int:
+        """Copy up to len(view) bytes out of the ring. Returns the number of bytes read."""
+        head = self.head
+        nbytes = min(view.nbytes, self.tail - head)
+        if nbytes <= 0:
+            return 0
+        pos = head % self.capacity
+        first = min(nbytes, self.capacity - pos)
+        view[:first] = self.data[pos : pos + first]
+        if first < nbytes:
+            view[first:nbytes] = self.data[: nbytes - first]
+        self.position.pack_into(self.buf, self.HEAD_OFFSET, head + nbytes)
+        return nbytes
+
+    def release(self):
+        self.data.release()
+        self.buf.release()
+
+
+class ShmChannel:
+    """Socket-like connection over two byte rings in shared memory.
+    The byte stream is the same as on the TCP connection it replaces, which
+    now only carries one-byte doorbells to wake up a waiting peer (and
+    reports when the peer goes away). Supports the subset of the socket API
+    used by Client and MessageManager.
+    """
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        shm: "shared_memory.SharedMemory",
+        ring_size: int,
+        creator: bool,
+    ):
+        self.sock = sock
+        self.shm = shm
+        self.ring_size = ring_size
+        self.creator = creator
+        self.blocking = sock.getblocking()
+        self.peer_closed = False
+
+        # The creator (Client) sends on the first ring and receives on the second
+        rings = [
+            ByteRing(shm.buf[offset : offset + ring_size])
+            for offset in (SHM_HEADER_SIZE, SHM_HEADER_SIZE + ring_size)
+        ]
+        if creator:
+            self.send_ring, self.recv_ring = rings
+        else:
+            self.recv_ring, self.send_ring = rings
+
+    @classmethod
+    def create(
+        cls, sock: socket.socket, ring_size: int = DEFAULT_SHM_RING_SIZE
+    ) -> "ShmChannel":
+        check_memory_ordering()
+        shm = create_shared_memory(SHM_HEADER_SIZE + 2 * ring_size)
+        shm.buf[:SHM_NONCE_LENGTH] = os.urandom(SHM_NONCE_LENGTH)
+        return cls(sock, shm, ring_size, creator=True)
+
+    @classmethod
+    def attach(
+        cls, sock: socket.socket, name: str, ring_size: int, nonce: bytes
+    ) -> "ShmChannel":
+        """Attach to the segment a client created, if it holds nonce. The
+        nonce is cleared, so it cannot be used to attach again.
+        """
+        check_memory_ordering()
+        if ring_size <= ByteRing.DATA_OFFSET:
+            raise ValueError(f"Invalid shared memory ring size {ring_size}")
+        if len(nonce) != SHM_NONCE_LENGTH or not any(nonce):
+            raise ValueError("Invalid shared memory nonce")
+        shm = attach_shared_memory(name)
+        if shm.size < SHM_HEADER_SIZE + 2 * ring_size:
+            shm.close()
+            raise ValueError(f"Shared memory {name} is smaller than two rings")
+        import hmac
+
+        if not hmac.compare_digest(bytes(shm.buf[:SHM_NONCE_LENGTH]), nonce):
+            shm.close()
+            raise ValueError(f"Shared memory {name} was not created by this client")
+        shm.buf[:SHM_NONCE_LENGTH] = bytes(SHM_NONCE_LENGTH)
+        return cls(sock, shm, ring_size, creator=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def nonce(self) -> bytes:
+        """Random bytes at the start of the segment, until the manager attached."""
+        return bytes(self.shm.buf[:SHM_NONCE_LENGTH])
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def getblocking(self) -> bool:
+        return self.blocking
+
+    def setblocking(self, flag: bool):
+        self.blocking = flag
+
+    def ring_doorbell(self):
+        try:
+            self.sock.send(b"\0", DONTWAIT)
+        except (BlockingIOError, InterruptedError):
+            pass  # The peer has doorbells pending already
+
+    def clear_doorbells(self):
+        """Consume pending doorbells without blocking, noting a closed peer."""
+        while not self.peer_closed:
+            if not DONTWAIT and not select.select([self.sock], [], [], 0)[0]:
+                return
+            try:
+                if not self.sock.recv(4096, DONTWAIT):
+                    self.peer_closed = True
+            except (BlockingIOError, InterruptedError):
+                return
+            except ConnectionError:
+                self.peer_closed = True
+
+    def poll(self) -> bool:
+        """True if a read would not block, because there is data or the peer
+        closed. Otherwise asks the peer for a doorbell with the next data.
+        """
+        ring = self.recv_ring
+        if ring.readable():
+            return True
+        self.clear_doorbells()
+        if self.peer_closed:
+            return True
+        ring.reader_waiting = True
+        if ring.readable():
+            ring.reader_waiting = False
+            return True
+        return False
+
+    def pending(self) -> bool:
+        """True if received bytes are waiting in the ring."""
+        return self.recv_ring.readable() > 0
+
+    def wait_readable(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the receive ring has data or the peer closed, -1 or None blocks."""
+        ring = self.recv_ring
+        deadline = (
+            None if timeout is None or timeout < 0 else time.perf_counter() + timeout
+        )
+        while True:
+            if ring.readable() or self.peer_closed:
+                return True
+            ring.reader_waiting = True
+            if ring.readable():
+                ring.reader_waiting = False
+                return True
+            wait = SHM_POLL_INTERVAL
+            if deadline is not None:
+                wait = min(wait, deadline - time.perf_counter())
+                if wait <= 0:
+                    ring.reader_waiting = False
+                    return False
+            select.select([self.sock], [], [], wait)
+            ring.reader_waiting = False
+            self.clear_doorbells()
+
+    def wait_writable(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the send ring has room, -1 or None blocks."""
+        ring = self.send_ring
+        deadline = (
+            None if timeout is None or timeout < 0 else time.perf_counter() + timeout
+        )
+        while True:
+            if ring.writable() or self.peer_closed:
+                return True
+            ring.writer_waiting = True
+            if ring.writable():
+                ring.writer_waiting = False
+                return True
+            wait = SHM_POLL_INTERVAL
+            if deadline is not None:
+                wait = min(wait, deadline - time.perf_counter())
+                if wait <= 0:
+                    ring.writer_waiting = False
+                    return False
+            select.select([self.sock], [], [], wait)
+            ring.writer_waiting = False
+            self.clear_doorbells()
+
+    def send(self, data, flags: int = 0) -> int:
+        return self.sendmsg([data])
+
+    def sendmsg(self, buffers: Sequence) -> int:
+        """Write buffers to the send ring. Non-blocking channels write what
+        fits and raise BlockingIOError if nothing does, blocking channels
+        wait until everything is written.
+        """
+        ring = self.send_ring
+        sent = 0
+        for buffer in buffers:
+            view = memoryview(buffer).cast("B")
+            while True:
+                if self.peer_closed:
+                    raise ConnectionResetError("Shared memory peer closed")
+                n = ring.write(view)
+                sent += n
+                if n == view.nbytes:
+                    break
+                view = view[n:]
+                if not self.blocking:
+                    # Ask for a doorbell once the reader made room
+                    ring.writer_waiting = True
+                    if not sent:
+                        raise BlockingIOError
+                    self.notify_reader()
+                    return sent
+                self.notify_reader()
+                self.wait_writable()
+        self.notify_reader()
+        return sent
+
+    def notify_reader(self):
+        ring = self.send_ring
+        if ring.reader_waiting:
+            ring.reader_waiting = False
+            self.ring_doorbell()
+
+    def recv_into(self, view, nbytes: int = 0) -> int:
+        """Read up to nbytes (all of view if 0) from the receive ring.
+        Returns 0 once the peer closed and the ring is empty.
+        """
+        view = memoryview(view).cast("B")
+        if nbytes:
+            view = view[:nbytes]
+        ring = self.recv_ring
+        while True:
+            received = ring.read_into(view)
+            if received:
+                if ring.writer_waiting:
+                    ring.writer_waiting = False
+                    self.ring_doorbell()
+                return received
+
+            self.clear_doorbells()
+            if self.peer_closed and not ring.readable():
+                return 0
+            if self.blocking:
+                self.wait_readable()
+                continue
+
+            # Ask for a doorbell before the caller goes back to select
+            ring.reader_waiting = True
+            if not ring.readable():
+                raise BlockingIOError
+            ring.reader_waiting = False
+
+    def release(self):
+        """Free the shared memory, leaving the socket open."""
+        self.send_ring.release()
+        self.recv_ring.release()
+        self.shm.close()
+        # Unlinked once, a client that disconnects twice closes it again
+        if self.creator and self.shm.name in created_names:
+            created_names.discard(self.shm.name)
+            self.shm.unlink()
+
+    def close(self):
+        self.release()
+        self.sock.close()
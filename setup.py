@@ -9,5 +9,6 @@ setup(
     author_email="dmw109@pitt.edu",
     license="MIT",
     packages=["pylsb"],
+    extras_require={"numpy": ["numpy"]},
     zip_safe=False,
 )
@@ -0,0 +1,121 @@
+import sys
+import ctypes
+import socket
+import threading
+import time
+import tracemalloc
+
+sys.path.append("../")
+
+from pylsb import *
+
+MT_ALLOC_TEST = 5020
+
+
+def create_test_msg(msg_size):
+    class ALLOC_TEST(MessageData):
+        _fields_ = [("data", ctypes.c_byte * msg_size)]
+        type_id = MT_ALLOC_TEST
+        type_name = "ALLOC_TEST"
+
+    return ALLOC_TEST
+
+
+def source_loop(listen_socket, msg_size, num_msgs):
+    """Fake message manager: acknowledge CONNECT, then stream messages."""
+    conn, _ = listen_socket.accept()
+    header = MessageHeader()
+    conn.recv(1024)
+    header.msg_type = MT_ACKNOWLEDGE
+    header.dest_mod_id = DYN_MOD_ID_START
+    conn.sendall(header)
+
+    header.msg_type = MT_ALLOC_TEST
+    header.num_data_bytes = msg_size
+    frame = bytes(header) + bytes(msg_size)
+    for n in range(num_msgs):
+        conn.sendall(frame)
+
+    # Acknowledge DISCONNECT
+    conn.recv(1024)
+    header.msg_type = MT_ACKNOWLEDGE
+    header.num_data_bytes = 0
+    conn.sendall(header)
+    conn.close()
+
+
+def connect(zero_copy, msg_size, num_msgs):
+    listen_socket = socket.socket()
+    listen_socket.bind(("127.0.0.1", 0))
+    listen_socket.listen()
+    source = threading.Thread(
+        target=source_loop,
+        args=(listen_socket, msg_size, num_msgs),
+        daemon=True,
+    )
+    source.start()
+
+    mod = Client(zero_copy=zero_copy)
+    mod.connect(server_name=f"127.0.0.1:{listen_socket.getsockname()[1]}")
+    return mod, source
+
+
+def bench(zero_copy, msg_size, num_msgs):
+    # Time per message
+    mod, source = connect(zero_copy, msg_size, num_msgs)
+    tic = time.perf_counter()
+    for n in range(num_msgs):
+        mod.read_message()
+    toc = time.perf_counter()
+    mod.disconnect()
+    source.join()
+
+    # Bytes allocated while reading one message. reset_peak needs Python 3.9,
+    # restarting the trace also resets the peak before that.
+    mod, source = connect(zero_copy, msg_size, num_msgs)
+    tracemalloc.start()
+    allocated = 0
+    for n in range(num_msgs):
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()  # novermin
+        else:
+            tracemalloc.stop()
+            tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        mod.read_message()
+        _, peak = tracemalloc.get_traced_memory()
+        allocated += peak - before
+    tracemalloc.stop()
+    mod.disconnect()
+    source.join()
+
+    return (toc - tic) / num_msgs, allocated / num_msgs
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Receive cost of copied vs zero-copy messages"
+    )
+    parser.add_argument(
+        "-ms",
+        nargs="*",
+        default=[100, 16384, 262144],
+        type=int,
+        dest="msg_sizes",
+        help="Message sizes in bytes.",
+    )
+    parser.add_argument(
+        "-n", default=10000, type=int, dest="num_msgs", help="Number of messages."
+    )
+    args = parser.parse_args()
+
+    for msg_size in args.msg_sizes:
+        AddMessage(MT_ALLOC_TEST, create_test_msg(msg_size))
+        for zero_copy in (False, True):
+            cost, allocated = bench(zero_copy, msg_size, args.num_msgs)
+            mode = "zero-copy" if zero_copy else "copy"
+            print(
+                f"{msg_size:7d} bytes | {mode:9s} | {cost * 1e6:8.2f} usec/message | {allocated:9.0f} bytes allocated/message"
+            )
@@ -7,28 +7,41 @@ sys.path.append("../")
 
 from pylsb import *
 
+MT_TEST = 5000
+MT_PUBLISHER_READY = 5001
+MT_PUBLISHER_DONE = 5002
+MT_SUBSCRIBER_READY = 5003
+MT_SUBSCRIBER_DONE = 5004
+
+
+def create_signal(name, type_id):
+    return type(name, (MessageData,), {"type_id": type_id, "type_name": name})
+
+
+def register_bench_messages(msg_size):
+    # Register user defined message types
+    AddMessage(MT_TEST, create_test_msg(msg_size))
+    AddMessage(MT_PUBLISHER_READY, create_signal("PUBLISHER_READY", MT_PUBLISHER_READY))
+    AddMessage(MT_PUBLISHER_DONE, create_signal("PUBLISHER_DONE", MT_PUBLISHER_DONE))
+    AddMessage(
+        MT_SUBSCRIBER_READY, create_signal("SUBSCRIBER_READY", MT_SUBSCRIBER_READY)
+    )
+    AddMessage(MT_SUBSCRIBER_DONE, create_signal("SUBSCRIBER_DONE", MT_SUBSCRIBER_DONE))
+
 
 def publisher_loop(
     pub_id=0, num_msgs=10000, msg_size=128, num_subscribers=1, server="127.0.0.1:7111"
 ):
-    # Register user defined message types
-    if msg_size > 0:
-        AddMessage(msg_name="TEST", msg_type=5000, msg_def=create_test_msg(msg_size))
-    else:
-        AddSignal(msg_name="TEST", msg_type=5000)
-
-    AddSignal(msg_name="PUBLISHER_READY", msg_type=5001)
-    AddSignal(msg_name="PUBLISHER_DONE", msg_type=5002)
-    AddSignal(msg_name="SUBSCRIBER_READY", msg_type=5003)
+    register_bench_messages(msg_size)
 
     # Setup Client
     mod = Client()
     mod.connect(server_name=server)
     mod.send_module_ready()
-    mod.subscribe("SUBSCRIBER_READY")
+    mod.subscribe(MT_SUBSCRIBER_READY)
 
     # Signal that publisher is ready
-    mod.send_signal("PUBLISHER_READY")
+    mod.send_signal(MT_PUBLISHER_READY)
 
     print(f"Publisher [{pub_id}] waiting for subscribers ")
 
@@ -37,11 +50,11 @@ def publisher_loop(
     while num_subscribers_ready < num_subscribers:
         msg = mod.read_message(timeout=-1)
         if msg is not None:
-            if msg.msg_name == "SUBSCRIBER_READY":
+            if msg.name == "SUBSCRIBER_READY":
                 num_subscribers_ready += 1
 
     # Create TEST message with dummy data
-    test_msg = create_test_msg(msg_size)()  # msg = pylsb.Message("TEST")
+    test_msg = msg_defs[MT_TEST]()
     if msg_size > 0:
         test_msg.data[:] = list(range(msg_size))
 
@@ -53,14 +66,16 @@ def publisher_loop(
         mod.send_message(test_msg)
     toc = time.perf_counter()
 
-    mod.send_signal("PUBLISHER_DONE")
+    mod.send_signal(MT_PUBLISHER_DONE)
 
     # Stats
     dur = toc - tic
     if num_msgs > 0:
         data_rate = (
-            ctypes.sizeof(mod.header_cls)
-            + ctypes.sizeof(test_msg) * num_msgs / 1e6 / dur
+            (ctypes.sizeof(mod.header_cls) + ctypes.sizeof(test_msg))
+            * num_msgs
+            / 1e6
+            / dur
         )
         print(
             f"Publisher [{pub_id}] -> {num_msgs} messages | {int(num_msgs/dur)} messages/sec | {data_rate:0.1f} MB/sec | {dur:0.6f} sec "
@@ -73,23 +88,16 @@ def publisher_loop(
 
 
 def subscriber_loop(sub_id=0, num_msgs=100000, msg_size=128, server="127.0.0.1:7111"):
-    # Register user defined message types
-    if msg_size > 0:
-        AddMessage(msg_name="TEST", msg_type=5000, msg_def=create_test_msg(msg_size))
-    else:
-        AddSignal(msg_name="TEST", msg_type=5000)
-
-    AddSignal(msg_name="SUBSCRIBER_READY", msg_type=5003)
-    AddSignal(msg_name="SUBSCRIBER_DONE", msg_type=5004)
+    register_bench_messages(msg_size)
 
     # Setup Client
     mod = Client()
     mod.connect(server_name=server)
     mod.send_module_ready()
-    mod.subscribe("TEST")
-    mod.subscribe("Exit")
+    mod.subscribe(MT_TEST)
+    mod.subscribe(MT_EXIT)
     print(f"Subscriber [{sub_id:d}] Ready")
-    mod.send_signal("SUBSCRIBER_READY")
+    mod.send_signal(MT_SUBSCRIBER_READY)
 
     # Read Loop (Start clock after first TEST msg received)
     msg_count = 0
@@ -105,13 +113,13 @@ def subscriber_loop(sub_id=0, num_msgs=100000, msg_size=128, server="127.0.0.1:7
                     tic = time.perf_counter()
                 toc = time.perf_counter()
                 msg_count += 1
-            elif msg.name == "Exit":
+            elif msg.name == "EXIT":
                 break
         if tic and (time.perf_counter() - toc) > 1:
             print(f"Subscriber [{sub_id:d}] breaking early.")
             break
 
-    mod.send_signal("SUBSCRIBER_DONE")
+    mod.send_signal(MT_SUBSCRIBER_DONE)
 
     # Stats
     dur = toc - tic
@@ -133,60 +141,28 @@ def subscriber_loop(sub_id=0, num_msgs=100000, msg_size=128, server="127.0.0.1:7
 
 
 def create_test_msg(msg_size):
-    class TEST(ctypes.Structure):
-        _fields_ = [("data", ctypes.c_byte * msg_size)]
+    class TEST(MessageData):
+        _fields_ = [("data", ctypes.c_byte * msg_size)] if msg_size > 0 else []
+        type_id = MT_TEST
+        type_name = "TEST"
 
     return TEST
 
 
-if __name__ == "__main__":
-    import argparse
-
-    # Configuration flags for bench utility
-    parser = argparse.ArgumentParser(description="lsbClient bench test utility")
-    parser.add_argument(
-        "-ms", default=128, type=int, dest="msg_size", help="Messge size in bytes."
-    )
-    parser.add_argument(
-        "-n", default=100000, type=int, dest="num_msgs", help="Number of messages."
-    )
-    parser.add_argument(
-        "-np",
-        default=1,
-        type=int,
-        dest="num_publishers",
-        help="Number of concurrent publishers.",
-    )
-    parser.add_argument(
-        "-ns",
-        default=1,
-        type=int,
-        dest="num_subscribers",
-        help="Number of concurrent subscribers.",
-    )
-    parser.add_argument(
-        "-s",
-        default="127.0.0.1:7111",
-        dest="server",
-        help="LSB message manager ip address (default: 127.0.0.1:7111)",
-    )
-    args = parser.parse_args()
-
+def run_bench(args, server):
     # Main Thread LSB client
     mod = Client()
-    mod.connect(server_name=args.server)
+    mod.connect(server_name=server)
     mod.send_module_ready()
 
-    AddSignal(msg_name="PUBLISHER_READY", msg_type=5001)
-    AddSignal(msg_name="PUBLISHER_DONE", msg_type=5002)
-    AddSignal(msg_name="SUBSCRIBER_READY", msg_type=5003)
-    AddSignal(msg_name="SUBSCRIBER_DONE", msg_type=5004)
+    register_bench_messages(args.msg_size)
 
-    mod.subscribe("PUBLISHER_READY")
-    mod.subscribe("PUBLISHER_DONE")
-    mod.subscribe("SUBSCRIBER_READY")
-    mod.subscribe("SUBSCRIBER_DONE")
+    mod.subscribe(MT_PUBLISHER_READY)
+    mod.subscribe(MT_PUBLISHER_DONE)
+    mod.subscribe(MT_SUBSCRIBER_READY)
+    mod.subscribe(MT_SUBSCRIBER_DONE)
 
+    sys.stdout.write(f"Server: {server}\n")
     sys.stdout.write(f"Packet size: {args.msg_size} bytes\n")
     sys.stdout.write(f"Sending {args.num_msgs} messages...\n")
     sys.stdout.flush()
@@ -202,7 +178,7 @@ if __name__ == "__main__":
                     "num_msgs": int(args.num_msgs / args.num_publishers),
                     "msg_size": args.msg_size,
                     "num_subscribers": args.num_subscribers,
-                    "server": args.server,
+                    "server": server,
                 },
             )
         )
@@ -213,7 +189,7 @@ if __name__ == "__main__":
     while publishers_ready < args.num_publishers:
         msg = mod.read_message(timeout=-1)
         if msg is not None:
-            if msg.msg_name == "PUBLISHER_READY":
+            if msg.name == "PUBLISHER_READY":
                 publishers_ready += 1
 
     # print('Waiting for subscriber processes...')
@@ -226,7 +202,7 @@ if __name__ == "__main__":
                     "sub_id": n + 1,
                     "num_msgs": args.num_msgs,
                     "msg_size": args.msg_size,
-                    "server": args.server,
+                    "server": server,
                 },
             )
         )
@@ -245,13 +221,13 @@ if __name__ == "__main__":
     ):
         msg = mod.read_message(timeout=0.100)
         if msg is not None:
-            if msg.msg_name == "SUBSCRIBER_DONE":
+            if msg.name == "SUBSCRIBER_DONE":
                 subscribers_done += 1
-            elif msg.msg_name == "PUBLISHER_DONE":
+            elif msg.name == "PUBLISHER_DONE":
                 publishers_done += 1
 
         if (time.perf_counter() - abort_start) > abort_timeout:
-            mod.send_signal("Exit")
+            mod.send_signal(MT_EXIT)
             sys.stdout.write("Test Timeout! Sending Exit Signal...\n")
             sys.stdout.flush()
 
@@ -263,3 +239,42 @@ if __name__ == "__main__":
 
     mod.disconnect()
     # print('Done!')
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # Configuration flags for bench utility
+    parser = argparse.ArgumentParser(description="lsbClient bench test utility")
+    parser.add_argument(
+        "-ms", default=128, type=int, dest="msg_size", help="Messge size in bytes."
+    )
+    parser.add_argument(
+        "-n", default=100000, type=int, dest="num_msgs", help="Number of messages."
+    )
+    parser.add_argument(
+        "-np",
+        default=1,
+        type=int,
+        dest="num_publishers",
+        help="Number of concurrent publishers.",
+    )
+    parser.add_argument(
+        "-ns",
+        default=1,
+        type=int,
+        dest="num_subscribers",
+        help="Number of concurrent subscribers.",
+    )
+    parser.add_argument(
+        "-s",
+        nargs="+",
+        default=["127.0.0.1:7111"],
+        dest="servers",
+        help="LSB message manager addresses, ip:port or unix:/path, each one is "
+        "benchmarked in turn to compare transports (default: 127.0.0.1:7111)",
+    )
+    args = parser.parse_args()
+
+    for server in args.servers:
+        run_bench(args, server)
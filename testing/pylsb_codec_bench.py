@@ -0,0 +1,81 @@
+import sys
+import ctypes
+import struct
+import timeit
+
+sys.path.append("../")
+
+from pylsb import *
+
+NUM_DIMS = 3
+
+
+# What pylsb.compile generates for a small, high-rate control message
+@msg_def
+class COMMAND(MessageData):
+    _pack_ = True
+    _fields_ = [
+        ("serial_no", ctypes.c_int),
+        ("sub_sample", ctypes.c_int),
+        ("source_timestamp", ctypes.c_double),
+        ("vel", ctypes.c_double * NUM_DIMS),
+        ("gain", ctypes.c_float),
+    ]
+    type_id = 5090
+    type_name = "COMMAND"
+    data_struct = struct.Struct(f"=iid{NUM_DIMS}df")
+
+
+BUFFER = bytearray(ctypes.sizeof(COMMAND))
+
+
+def ctypes_encode():
+    msg = COMMAND()
+    msg.serial_no = 1
+    msg.sub_sample = 2
+    msg.source_timestamp = 3.0
+    msg.vel[0] = 0.5
+    msg.vel[1] = -0.5
+    msg.vel[2] = 0.0
+    msg.gain = 2.0
+    return bytes(msg)
+
+
+def struct_encode():
+    COMMAND.pack_into(BUFFER, 0, 1, 2, 3.0, 0.5, -0.5, 0.0, 2.0)
+    return bytes(BUFFER)
+
+
+def ctypes_decode(raw):
+    msg = COMMAND.from_buffer_copy(raw)
+    return msg.serial_no, msg.source_timestamp, msg.vel[0], msg.gain
+
+
+def struct_decode(raw):
+    values = COMMAND.unpack_from(raw)
+    return values[0], values[2], values[3], values[6]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Encoding and decoding a control message: ctypes vs data_struct"
+    )
+    parser.add_argument(
+        "-n", default=100000, type=int, dest="num_calls", help="Calls per case."
+    )
+    args = parser.parse_args()
+
+    raw = ctypes_encode()
+    assert struct_encode() == raw
+    assert struct_decode(raw) == ctypes_decode(raw)
+
+    for name, func in (
+        ("encode, ctypes", ctypes_encode),
+        ("encode, data_struct", struct_encode),
+        ("decode, ctypes", lambda: ctypes_decode(raw)),
+        ("decode, data_struct", lambda: struct_decode(raw)),
+    ):
+        seconds = timeit.timeit(func, number=args.num_calls)
+        print(f"{name:20s} {seconds / args.num_calls * 1e6:7.2f} usec/call")
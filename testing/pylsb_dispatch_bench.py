@@ -0,0 +1,152 @@
+import sys
+import ctypes
+import socket
+import threading
+import time
+
+sys.path.append("../")
+
+from pylsb import *
+
+FIRST_TYPE = 5100
+
+
+def define_types(num_types):
+    """Small control messages, like the ones a module handles."""
+    classes = []
+    for n in range(num_types):
+        cls = type(
+            f"CONTROL_{n}",
+            (MessageData,),
+            {
+                "_fields_": [("pos", ctypes.c_double * 3)],
+                "type_id": FIRST_TYPE + n,
+                "type_name": f"CONTROL_{n}",
+            },
+        )
+        classes.append(msg_def(cls))
+    return classes
+
+
+def frames(classes, num_msgs):
+    """Received bytes of num_msgs messages, cycling through the types."""
+    chunks = []
+    for n in range(num_msgs):
+        data = classes[n % len(classes)]()
+        header = MessageHeader()
+        header.msg_type = data.type_id
+        header.num_data_bytes = ctypes.sizeof(data)
+        chunks += [bytes(header), bytes(data)]
+    return b"".join(chunks)
+
+
+def counter(counts, n):
+    def handler(msg):
+        counts[n] += 1
+
+    return handler
+
+
+def name_chain(handlers):
+    """Dispatch as the examples do, a chain of msg.name comparisons."""
+    lines = ["def dispatch(msg):", "    name = msg.name"]
+    for n in range(len(handlers)):
+        keyword = "elif" if n else "if"
+        lines += [
+            f"    {keyword} name == 'CONTROL_{n}':",
+            f"        handlers[{n}](msg)",
+        ]
+    namespace = {"handlers": handlers}
+    exec("\n".join(lines), namespace)
+    return namespace["dispatch"]
+
+
+def time_dispatch(dispatch, messages):
+    tic = time.perf_counter()
+    for msg in messages:
+        dispatch(msg)
+    return time.perf_counter() - tic
+
+
+def run_dispatcher(received, num_msgs, main_thread):
+    """Messages per second and stats of the reader thread, fed through a socket pair."""
+    client = Client()
+    sock, peer = socket.socketpair()
+    client._sock = sock
+    client._connected = True
+    handled = [0]
+
+    def handler(msg):
+        handled[0] += 1
+
+    client.on(None, handler, main_thread)
+    client.start_dispatcher()
+    tic = time.perf_counter()
+    # The main thread has to drain the queue while the frames are written
+    sender = threading.Thread(target=peer.sendall, args=(received,))
+    sender.start()
+    while handled[0] < num_msgs:
+        if main_thread:
+            client.dispatch_pending(timeout=0.1)
+        else:
+            time.sleep(0.001)
+    seconds = time.perf_counter() - tic
+    sender.join()
+    client.stop_dispatcher()
+    client._connected = False
+    peer.close()
+    sock.close()
+    return seconds, client.dispatch_stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Handler dispatch by msg.name chains vs the Client dispatcher"
+    )
+    parser.add_argument(
+        "-n",
+        default=10000,
+        type=int,
+        dest="num_msgs",
+        help="Messages per run, they fit the receive buffer.",
+    )
+    parser.add_argument(
+        "-t", default=8, type=int, dest="num_types", help="Handled message types."
+    )
+    parser.add_argument(
+        "-r", default=20, type=int, dest="repeats", help="Best of this many runs."
+    )
+    args = parser.parse_args()
+
+    classes = define_types(args.num_types)
+    received = frames(classes, args.num_msgs)
+    reader = Client()
+    reader._recv_buffer[: len(received)] = received
+    reader._recv_start, reader._recv_end = 0, len(received)
+    messages = [reader._pop_message() for _ in range(args.num_msgs)]
+
+    counts = [0] * args.num_types
+    handlers = [counter(counts, n) for n in range(args.num_types)]
+    table = Client()
+    for cls, handler in zip(classes, handlers):
+        table.on(cls, handler)
+    cases = (
+        ("msg.name chain", name_chain(handlers)),
+        ("handler table", lambda msg: table._dispatch(msg, 0.1)),
+    )
+    print(f"Dispatch only, {args.num_types} types")
+    for name, dispatch in cases:
+        seconds = min(time_dispatch(dispatch, messages) for _ in range(args.repeats))
+        print(f"  {name:22s} {seconds / args.num_msgs * 1e6:6.2f} usec/message")
+
+    print("Reader thread, receive to handler")
+    for name, main_thread in (("reader thread", False), ("main thread queue", True)):
+        seconds, stats = run_dispatcher(received, args.num_msgs, main_thread)
+        print(
+            f"  {name:22s} {args.num_msgs / seconds:9.0f} messages/s, "
+            f"latency mean {stats.mean_latency * 1e3:.2f} ms "
+            f"max {stats.max_latency * 1e3:.2f} ms, "
+            f"max backlog {stats.max_backlog}"
+        )
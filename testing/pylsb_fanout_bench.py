@@ -0,0 +1,147 @@
+import sys
+import os
+import ctypes
+import logging
+import multiprocessing
+import random
+import selectors
+import time
+
+sys.path.append("../")
+
+from pylsb import *
+from pylsb.manager import MessageManager, DEFAULT_SEND_QUEUE_SIZE
+
+MT_FANOUT_TEST = 5030
+MID_PUBLISHER = 6
+MID_SUBSCRIBER_START = 10
+
+
+def create_test_msg(msg_size):
+    class FANOUT_TEST(MessageData):
+        _fields_ = [("data", ctypes.c_byte * msg_size)]
+        type_id = MT_FANOUT_TEST
+        type_name = "FANOUT_TEST"
+
+    return FANOUT_TEST
+
+
+def manager_loop(port):
+    sys.stdout = open(os.devnull, "w")  # dropped message markers
+    manager = MessageManager(ip_address="127.0.0.1", port=port, send_msg_timing=False)
+    manager.logger.setLevel(logging.ERROR)
+    manager.run()
+
+
+class Receiver:
+    """Counts test messages arriving at a group of subscribers."""
+
+    def __init__(self, subscribers):
+        self.selector = selectors.DefaultSelector()
+        for sub in subscribers:
+            self.selector.register(sub._sock, selectors.EVENT_READ, sub)
+        self.received = dict.fromkeys(subscribers, 0)
+
+    def poll(self, timeout):
+        for key, mask in self.selector.select(timeout):
+            for msg in key.data.read_messages(timeout=0):
+                if msg.header.msg_type == MT_FANOUT_TEST:
+                    self.received[key.data] += 1
+
+    def wait(self, num_msgs, timeout=10):
+        """Wait until every subscriber has num_msgs messages or timeout passes."""
+        deadline = time.perf_counter() + timeout
+        while min(self.received.values()) < num_msgs and time.perf_counter() < deadline:
+            self.poll(0.1)
+        return sum(self.received.values())
+
+    def close(self):
+        self.selector.close()
+
+
+def bench(server, msg_size, num_subscribers, num_msgs):
+    subscribers = []
+    for n in range(num_subscribers):
+        sub = Client(module_id=MID_SUBSCRIBER_START + n)
+        sub.connect(server_name=server)
+        sub.subscribe(MT_FANOUT_TEST)
+        subscribers.append(sub)
+    time.sleep(0.1)
+    for sub in subscribers:
+        sub.discard_messages()
+
+    pub = Client(module_id=MID_PUBLISHER)
+    pub.connect(server_name=server)
+    msg = create_test_msg(msg_size)()
+    receiver = Receiver(subscribers)
+
+    # Messages in flight per subscriber, well within the manager's queue limit
+    window = max(1, min(64, DEFAULT_SEND_QUEUE_SIZE // 4 // msg_size))
+
+    tic = time.perf_counter()
+    for n in range(num_msgs):
+        pub.send_message(msg)
+        if n >= window:
+            receiver.wait(n + 1 - window)
+    delivered = receiver.wait(num_msgs)
+    toc = time.perf_counter()
+
+    receiver.close()
+    for sub in subscribers + [pub]:
+        sub.disconnect()
+    return toc - tic, delivered
+
+
+def run(server, msg_size, num_subscribers, num_msgs):
+    elapsed, delivered = bench(server, msg_size, num_subscribers, num_msgs)
+    dropped = num_msgs * num_subscribers - delivered
+    print(
+        f"{msg_size:8d} bytes | {num_subscribers:3d} subscribers | {elapsed / num_msgs * 1e6:9.1f} usec/message | {delivered * msg_size / elapsed / 1e6:8.1f} MB/s delivered | {dropped} dropped"
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="MessageManager fan-out cost vs subscribers and message size"
+    )
+    parser.add_argument(
+        "-ms",
+        nargs="*",
+        default=[100, 10 * 1024, 1024**2],
+        type=int,
+        dest="msg_sizes",
+        help="Message sizes in bytes.",
+    )
+    parser.add_argument(
+        "-ns",
+        nargs="*",
+        default=[1, 10, 50],
+        type=int,
+        dest="subscriber_counts",
+        help="Subscriber counts.",
+    )
+    parser.add_argument(
+        "-n",
+        default=2000,
+        type=int,
+        dest="num_msgs",
+        help="Messages per run, fewer for large messages.",
+    )
+    args = parser.parse_args()
+
+    port = random.randint(10000, 20000)
+    manager = multiprocessing.Process(target=manager_loop, args=(port,), daemon=True)
+    manager.start()
+    time.sleep(0.5)
+    server = f"127.0.0.1:{port}"
+
+    for msg_size in args.msg_sizes:
+        AddMessage(MT_FANOUT_TEST, create_test_msg(msg_size))
+        # Bound the bytes per subscriber for large messages
+        num_msgs = max(10, min(args.num_msgs, 64 * 1024**2 // msg_size))
+        for num_subscribers in args.subscriber_counts:
+            run(server, msg_size, num_subscribers, num_msgs)
+
+    manager.terminate()
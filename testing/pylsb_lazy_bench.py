@@ -0,0 +1,83 @@
+import sys
+import ctypes
+import time
+
+sys.path.append("../")
+
+from pylsb import *
+
+MT_SPIKE_SNIPPETS = 5097
+MT_CONTROL = 5098
+
+
+@msg_def
+class SPIKE_SNIPPETS(MessageData):
+    _fields_ = [
+        ("source_timestamp", ctypes.c_double),
+        ("snippets", ctypes.c_short * 48 * 32),
+    ]
+    type_id = MT_SPIKE_SNIPPETS
+    type_name = "SPIKE_SNIPPETS"
+
+
+@msg_def
+class CONTROL(MessageData):
+    _fields_ = [("pos", ctypes.c_double * 3)]
+    type_id = MT_CONTROL
+    type_name = "CONTROL"
+
+
+def frames(num_msgs):
+    """Received bytes of num_msgs messages, 9 of 10 are 3 KB SPIKE_SNIPPETS."""
+    chunks = []
+    for n in range(num_msgs):
+        data = CONTROL() if n % 10 == 0 else SPIKE_SNIPPETS()
+        header = MessageHeader()
+        header.msg_type = data.type_id
+        header.num_data_bytes = ctypes.sizeof(data)
+        chunks += [bytes(header), bytes(data)]
+    return b"".join(chunks)
+
+
+def consume(client, received, num_msgs):
+    """Filter-heavy consumer: only CONTROL positions are used."""
+    # Parse from a buffer filled as if by one recv_into
+    client._recv_buffer[: len(received)] = received
+    client._recv_start, client._recv_end = 0, len(received)
+    total = 0.0
+    tic = time.perf_counter()
+    for _ in range(num_msgs):
+        msg = client._pop_message()
+        if msg is not None and msg.header.msg_type == MT_CONTROL:
+            total += msg.data.pos[0]
+    return time.perf_counter() - tic
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Receive-side parsing for a consumer that filters on the header"
+    )
+    parser.add_argument(
+        "-n", default=300, type=int, dest="num_msgs", help="Messages per batch."
+    )
+    parser.add_argument(
+        "-r", default=200, type=int, dest="repeats", help="Batches per case."
+    )
+    args = parser.parse_args()
+
+    received = frames(args.num_msgs)
+    dropping = Client(lazy_decode=True)
+    dropping.drop_types([MT_SPIKE_SNIPPETS])
+    for name, client in (
+        ("eager", Client()),
+        ("lazy_decode", Client(lazy_decode=True)),
+        ("zero_copy", Client(zero_copy=True)),
+        ("zero_copy, lazy", Client(zero_copy=True, lazy_decode=True)),
+        ("drop_types", dropping),
+    ):
+        seconds = min(
+            consume(client, received, args.num_msgs) for _ in range(args.repeats)
+        )
+        print(f"{name:16s} {seconds / args.num_msgs * 1e6:6.2f} usec/message")
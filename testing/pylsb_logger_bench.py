@@ -0,0 +1,145 @@
+import sys
+import os
+import ctypes
+import logging
+import multiprocessing
+import random
+import signal
+import tempfile
+import time
+
+sys.path.append("../")
+
+from pylsb import *
+from pylsb._core import SAVE_MESSAGE_LOG
+from pylsb.manager import MessageManager
+from pylsb.logger import QuickLogger, LOG_FILE_HEADER
+
+MT_LOGGER_TEST = 5060
+MID_PUBLISHER = 6
+MID_SUBSCRIBER = 7
+
+
+def create_test_msg(msg_size):
+    class LOGGER_TEST(MessageData):
+        _fields_ = [("data", ctypes.c_byte * msg_size)]
+        type_id = MT_LOGGER_TEST
+        type_name = "LOGGER_TEST"
+
+    return LOGGER_TEST
+
+
+def manager_loop(port):
+    manager = MessageManager(ip_address="127.0.0.1", port=port, send_msg_timing=False)
+    manager.logger.setLevel(logging.ERROR)
+    manager.run()
+
+
+def logger_loop(server, path):
+    quick_logger = QuickLogger(path)
+    quick_logger.connect(server)
+    signal.signal(signal.SIGTERM, lambda *args: quick_logger.stop())
+    try:
+        quick_logger.run()
+    finally:
+        quick_logger.close()
+
+
+def bench(server, msg_size, num_msgs, log_dir):
+    """Publisher to subscriber rate, and frames in the saved log."""
+    sub = Client(module_id=MID_SUBSCRIBER)
+    sub.connect(server_name=server)
+    sub.subscribe(MT_LOGGER_TEST)
+    pub = Client(module_id=MID_PUBLISHER)
+    pub.connect(server_name=server)
+    pub.subscribe(MT_MESSAGE_LOG_SAVED)
+    time.sleep(0.1)
+    if log_dir:
+        pub.send_signal(MT_RESET_MESSAGE_LOG)
+    sub.discard_messages()
+    pub.discard_messages()
+
+    msg = create_test_msg(msg_size)()
+    batch = [msg] * 64
+    received = 0
+    tic = time.perf_counter()
+    for n in range(0, num_msgs, len(batch)):
+        pub.send_messages(batch[: num_msgs - n])
+        received += sum(
+            m.header.msg_type == MT_LOGGER_TEST for m in sub.read_messages(timeout=0)
+        )
+    while received < num_msgs:
+        messages = sub.read_messages(timeout=1)
+        if not messages:
+            break
+        received += sum(m.header.msg_type == MT_LOGGER_TEST for m in messages)
+    elapsed = time.perf_counter() - tic
+
+    logged = None
+    if log_dir:
+        path = os.path.join(log_dir, f"saved_{msg_size}.bin")
+        save = SAVE_MESSAGE_LOG()
+        save.pathname = path.encode()
+        save.pathname_length = len(path)
+        pub.send_message(save)
+        reply = pub.read_message(timeout=60)
+        if reply is not None and reply.header.msg_type == MT_MESSAGE_LOG_SAVED:
+            with open(path, "rb") as f:
+                logged = LOG_FILE_HEADER.unpack(f.read(LOG_FILE_HEADER.size))[5]
+            os.remove(path)
+
+    sub.disconnect()
+    pub.disconnect()
+    return received, elapsed, logged
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Routing rate with and without a QuickLogger attached"
+    )
+    parser.add_argument(
+        "-ms",
+        nargs="*",
+        default=[100, 10 * 1024],
+        type=int,
+        dest="msg_sizes",
+        help="Message sizes in bytes.",
+    )
+    parser.add_argument(
+        "-n", default=50000, type=int, dest="num_msgs", help="Messages per run."
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        for with_logger in (False, True):
+            port = random.randint(10000, 20000)
+            server = f"127.0.0.1:{port}"
+            manager = multiprocessing.Process(target=manager_loop, args=(port,))
+            manager.start()
+            time.sleep(0.5)
+            if with_logger:
+                quick_logger = multiprocessing.Process(
+                    target=logger_loop,
+                    args=(server, os.path.join(log_dir, "quicklogger.bin")),
+                )
+                quick_logger.start()
+                time.sleep(0.5)
+
+            for msg_size in args.msg_sizes:
+                AddMessage(MT_LOGGER_TEST, create_test_msg(msg_size))
+                received, elapsed, logged = bench(
+                    server, msg_size, args.num_msgs, log_dir if with_logger else None
+                )
+                label = "logger" if with_logger else "none  "
+                print(
+                    f"{msg_size:8d} bytes | {label} | {received / elapsed:9.0f} messages/s received"
+                    + ("" if logged is None else f" | {logged} frames logged")
+                )
+
+            if with_logger:
+                quick_logger.terminate()
+                quick_logger.join()
+            os.kill(manager.pid, signal.SIGINT)
+            manager.join()
@@ -0,0 +1,164 @@
+import sys
+import os
+import ctypes
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append("../")
+
+from pylsb import *
+from pylsb.logger import (
+    LOG_MAGIC,
+    LOG_VERSION,
+    LOG_FILE_HEADER,
+    LOG_DATA_OFFSET,
+    LOG_TYPE_ENTRY,
+)
+from pylsb._core import ctypes_dtype
+from pylsb.logreader import LogReader
+
+MT_SPIKE_COUNT = 5070
+MT_CONTROL = 5071
+
+
+@msg_def
+class SPIKE_COUNT(MessageData):
+    _fields_ = [
+        ("source_timestamp", ctypes.c_double),
+        ("count_interval", ctypes.c_double),
+        ("counts", ctypes.c_ubyte * 1024),
+    ]
+    type_id = MT_SPIKE_COUNT
+    type_name = "SPIKE_COUNT"
+
+
+@msg_def
+class CONTROL(MessageData):
+    _fields_ = [("pos", ctypes.c_double * 3)]
+    type_id = MT_CONTROL
+    type_name = "CONTROL"
+
+
+def write_log(path, num_spike_counts, num_controls):
+    """Synthetic log with the two types randomly interleaved, as QuickLogger writes it."""
+    header_size = ctypes.sizeof(MessageHeader)
+    rng = np.random.default_rng(0)
+    types = np.array([MT_SPIKE_COUNT] * num_spike_counts + [MT_CONTROL] * num_controls)
+    rng.shuffle(types)
+    sizes = np.where(
+        types == MT_SPIKE_COUNT, ctypes.sizeof(SPIKE_COUNT), ctypes.sizeof(CONTROL)
+    )
+    offsets = LOG_DATA_OFFSET + np.concatenate(([0], np.cumsum(header_size + sizes)))
+    data_end = int(offsets[-1])
+    offsets = offsets[:-1]
+    times = 1e9 + np.arange(len(types)) * 1e-4
+
+    type_index = np.argsort(types, kind="stable")
+    type_entries = b""
+    first = 0
+    for msg_type in (MT_SPIKE_COUNT, MT_CONTROL):
+        count = int(np.sum(types == msg_type))
+        type_entries += LOG_TYPE_ENTRY.pack(msg_type, 0, first, count)
+        first += count
+    index = (
+        offsets.astype(np.int64).tobytes()
+        + times.tobytes()
+        + type_entries
+        + type_index.astype(np.int64).tobytes()
+    )
+
+    log = np.memmap(path, np.uint8, "w+", shape=data_end + len(index))
+    LOG_FILE_HEADER.pack_into(
+        log,
+        0,
+        LOG_MAGIC,
+        LOG_VERSION,
+        header_size,
+        LOG_DATA_OFFSET,
+        data_end - LOG_DATA_OFFSET,
+        len(types),
+        2,
+        data_end,
+    )
+    header_dtype = ctypes_dtype(MessageHeader)
+    for msg_cls in (SPIKE_COUNT, CONTROL):
+        frame_dtype = np.dtype(
+            [("header", header_dtype), ("data", msg_cls.numpy_dtype())], align=False
+        )
+        frames = np.ndarray(
+            len(log) - frame_dtype.itemsize + 1, frame_dtype, log, 0, (1,)
+        )
+        select = types == msg_cls.type_id
+        records = np.zeros(int(np.sum(select)), frame_dtype)
+        records["header"]["msg_type"] = msg_cls.type_id
+        records["header"]["msg_count"] = np.arange(len(records))
+        records["header"]["send_time"] = times[select]
+        records["header"]["recv_time"] = times[select]
+        records["header"]["num_data_bytes"] = ctypes.sizeof(msg_cls)
+        if msg_cls is SPIKE_COUNT:
+            records["data"]["counts"] = rng.integers(0, 8, (len(records), 1024))
+        frames[offsets[select]] = records
+    log[data_end:] = np.frombuffer(index, np.uint8)
+    log.flush()
+    del log
+    return data_end
+
+
+def parse_with_ctypes(path, msg_type):
+    """Walk every frame, building ctypes objects for the wanted type."""
+    header_size = ctypes.sizeof(MessageHeader)
+    with open(path, "rb") as f:
+        log = f.read()
+    data_end = LOG_FILE_HEADER.unpack_from(log)[7]
+    pos = LOG_DATA_OFFSET
+    messages = []
+    while pos < data_end:
+        header = MessageHeader.from_buffer_copy(log, pos)
+        pos += header_size
+        if header.msg_type == msg_type:
+            messages.append(Message(header, header.get_data.from_buffer_copy(log, pos)))
+        pos += header.num_data_bytes
+    return messages
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Loading one message type from a log: LogReader vs ctypes parsing"
+    )
+    parser.add_argument(
+        "-n",
+        default=500000,
+        type=int,
+        dest="num_spike_counts",
+        help="SPIKE_COUNT messages (1 KB each) in the log.",
+    )
+    parser.add_argument(
+        "-c",
+        default=500000,
+        type=int,
+        dest="num_controls",
+        help="Other, small messages interleaved with them.",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        path = os.path.join(log_dir, "session.bin")
+        size = write_log(path, args.num_spike_counts, args.num_controls)
+        print(f"Log: {size / 1e6:0.0f} MB, {args.num_spike_counts} SPIKE_COUNT")
+
+        tic = time.perf_counter()
+        with LogReader(path) as reader:
+            spikes = reader.read(MT_SPIKE_COUNT)
+            total = int(spikes.data["counts"].sum(dtype=np.int64))
+        toc = time.perf_counter()
+        print(f"LogReader: {toc - tic:0.3f} sec (sum {total})")
+
+        tic = time.perf_counter()
+        messages = parse_with_ctypes(path, MT_SPIKE_COUNT)
+        total = sum(sum(msg.data.counts) for msg in messages)
+        toc = time.perf_counter()
+        print(f"ctypes:    {toc - tic:0.3f} sec (sum {total})")
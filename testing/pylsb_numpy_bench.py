@@ -0,0 +1,66 @@
+import sys
+import ctypes
+import timeit
+
+sys.path.append("../")
+
+from pylsb import *
+
+MAX_SPIKE_CHANS = 256
+MAX_UNITS = 4
+SNIPPET_LENGTH = 48
+
+
+@msg_def
+class SPIKE_SNIPPETS(MessageData):
+    _fields_ = [
+        ("source_timestamp", ctypes.c_double),
+        ("counts", ctypes.c_ubyte * MAX_UNITS * MAX_SPIKE_CHANS),
+        ("snippets", ctypes.c_short * SNIPPET_LENGTH * 32),
+    ]
+    type_id = 5080
+    type_name = "SPIKE_SNIPPETS"
+
+
+def ctypes_total(msg):
+    return sum(sum(unit_counts) for unit_counts in msg.counts)
+
+
+def numpy_total(msg):
+    return int(msg.as_numpy()["counts"].sum())
+
+
+def ctypes_peaks(msg):
+    return [max(snippet) for snippet in msg.snippets]
+
+
+def numpy_peaks(msg):
+    return msg.as_numpy()["snippets"].max(axis=1)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Field access through ctypes vs MessageData.as_numpy views"
+    )
+    parser.add_argument(
+        "-n", default=2000, type=int, dest="num_calls", help="Calls per case."
+    )
+    args = parser.parse_args()
+
+    msg = SPIKE_SNIPPETS()
+    view = msg.as_numpy()
+    view["counts"] = 1
+    view["snippets"] = 7
+    assert ctypes_total(msg) == numpy_total(msg)
+
+    for name, func in (
+        ("counts total, ctypes", ctypes_total),
+        ("counts total, numpy ", numpy_total),
+        ("snippet peaks, ctypes", ctypes_peaks),
+        ("snippet peaks, numpy ", numpy_peaks),
+        ("as_numpy()", SPIKE_SNIPPETS.as_numpy),
+    ):
+        seconds = timeit.timeit(lambda: func(msg), number=args.num_calls)
+        print(f"{name:24s} {seconds / args.num_calls * 1e6:9.1f} usec/call")
@@ -0,0 +1,58 @@
+import sys
+import ctypes
+import timeit
+
+sys.path.append("../")
+
+from pylsb import *
+from pylsb._core import msg_registry, resolve_entry
+
+
+@msg_def
+class CONTROL(MessageData):
+    _fields_ = [("pos", ctypes.c_double * 3)]
+    type_id = 5095
+    type_name = "CONTROL"
+
+
+def chainmap_decode(buffer, msg_type, data_size):
+    """Payload decoding before the registry: ChainMap lookup and sizeof per message."""
+    data_cls = msg_defs[msg_type]
+    if data_size == ctypes.sizeof(data_cls):
+        return data_cls.from_buffer_copy(buffer)
+    data = data_cls()
+    nbytes = min(data_size, ctypes.sizeof(data))
+    memoryview(data).cast("B")[:nbytes] = buffer[:nbytes]
+    return data
+
+
+def registry_decode(buffer, msg_type, data_size):
+    entry = msg_registry[msg_type] if 0 <= msg_type < MAX_MESSAGE_TYPES else None
+    if entry is None:
+        entry = resolve_entry(msg_type)
+    return entry.decode(buffer, 0, data_size)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Payload class lookup and decoding per received message"
+    )
+    parser.add_argument(
+        "-n", default=200000, type=int, dest="num_calls", help="Calls per case."
+    )
+    args = parser.parse_args()
+
+    buffer = bytearray(ctypes.sizeof(CONTROL))
+    size = len(buffer)
+    cases = [
+        ("lookup, ChainMap", lambda: msg_defs[CONTROL.type_id]),
+        ("lookup, registry", lambda: msg_registry[CONTROL.type_id]),
+        ("decode, ChainMap", lambda: chainmap_decode(buffer, CONTROL.type_id, size)),
+        ("decode, registry", lambda: registry_decode(buffer, CONTROL.type_id, size)),
+        ("unknown, registry", lambda: registry_decode(buffer, 5096, size)),
+    ]
+    for name, func in cases:
+        seconds = timeit.timeit(func, number=args.num_calls)
+        print(f"{name:18s} {seconds / args.num_calls * 1e9:7.0f} nsec/call")
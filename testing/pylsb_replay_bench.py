@@ -0,0 +1,97 @@
+import sys
+import os
+import logging
+import multiprocessing
+import random
+import signal
+import tempfile
+import time
+
+sys.path.append("../")
+
+from pylsb import *
+from pylsb.manager import MessageManager
+from pylsb.replay import LogReplay
+
+# Synthetic 10 kHz session of SPIKE_COUNT and CONTROL messages
+from pylsb_logreader_bench import write_log, MT_SPIKE_COUNT, MT_CONTROL
+
+MID_REPLAY = 6
+MID_SUBSCRIBER = 7
+
+
+def manager_loop(port):
+    manager = MessageManager(ip_address="127.0.0.1", port=port, send_msg_timing=False)
+    manager.logger.setLevel(logging.ERROR)
+    manager.run()
+
+
+def subscriber_loop(server, num_msgs, ready, done):
+    sub = Client(module_id=MID_SUBSCRIBER)
+    sub.connect(server_name=server)
+    sub.subscribe([MT_SPIKE_COUNT, MT_CONTROL])
+    time.sleep(0.1)
+    sub.discard_messages()
+    ready.set()
+    received = 0
+    while received < num_msgs:
+        messages = sub.read_messages(timeout=2)
+        if not messages:
+            break
+        received += len(messages)
+    done.put(received)
+    sub.disconnect()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Replay a synthetic 10 kHz session at several speeds"
+    )
+    parser.add_argument(
+        "-n",
+        default=20000,
+        type=int,
+        dest="num_msgs",
+        help="Messages in the session, half of them 1 KB SPIKE_COUNT.",
+    )
+    parser.add_argument(
+        "--speeds",
+        nargs="*",
+        default=[1.0, 4.0, 0.0],
+        type=float,
+        help="Playback speeds, 0 is as fast as possible.",
+    )
+    args = parser.parse_args()
+
+    port = random.randint(10000, 20000)
+    server = f"127.0.0.1:{port}"
+    manager = multiprocessing.Process(target=manager_loop, args=(port,))
+    manager.start()
+    time.sleep(0.5)
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        path = os.path.join(log_dir, "session.bin")
+        write_log(path, args.num_msgs // 2, args.num_msgs - args.num_msgs // 2)
+
+        client = Client(module_id=MID_REPLAY)
+        client.connect(server_name=server)
+        for speed in args.speeds:
+            ready = multiprocessing.Event()
+            done = multiprocessing.Queue()
+            subscriber = multiprocessing.Process(
+                target=subscriber_loop, args=(server, args.num_msgs, ready, done)
+            )
+            subscriber.start()
+            ready.wait()
+
+            with LogReplay(path, speed=speed) as replay:
+                stats = replay.run(client)
+            received = done.get()
+            subscriber.join()
+            print(f"speed {speed:4.1f} | {stats} | {received} received")
+        client.disconnect()
+
+    os.kill(manager.pid, signal.SIGINT)
+    manager.join()
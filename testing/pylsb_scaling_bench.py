@@ -0,0 +1,91 @@
+import sys
+import ctypes
+import logging
+import multiprocessing
+import os
+import random
+import time
+
+sys.path.append("../")
+
+from pylsb import *
+from pylsb.manager import MessageManager
+
+MT_SCALING_TEST = 5010
+MID_PUBLISHER = 6
+MID_SUBSCRIBER = 7
+MID_IDLE_START = 10
+
+
+@msg_def
+class SCALING_TEST(MessageData):
+    _fields_ = [("data", ctypes.c_byte * 100)]
+    type_id = MT_SCALING_TEST
+    type_name = "SCALING_TEST"
+
+
+def manager_loop(port):
+    manager = MessageManager(ip_address="127.0.0.1", port=port, send_msg_timing=False)
+    manager.logger.setLevel(logging.WARNING)
+    manager.run()
+
+
+def measure(pub, sub, num_msgs):
+    """Round trip publisher -> manager -> subscriber, one message at a time."""
+    msg = SCALING_TEST()
+    tic = time.perf_counter()
+    for n in range(num_msgs):
+        pub.send_message(msg)
+        sub.read_message(timeout=-1)
+    toc = time.perf_counter()
+    return (toc - tic) / num_msgs
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="MessageManager per-message cost vs number of connected modules"
+    )
+    parser.add_argument(
+        "-n", default=10000, type=int, dest="num_msgs", help="Messages per step."
+    )
+    parser.add_argument(
+        "-m",
+        nargs="*",
+        default=[10, 50, 100, 150, 190],
+        type=int,
+        dest="module_counts",
+        help="Connected module counts to measure.",
+    )
+    args = parser.parse_args()
+
+    port = random.randint(10000, 20000)
+    manager = multiprocessing.Process(target=manager_loop, args=(port,), daemon=True)
+    manager.start()
+    time.sleep(0.5)
+
+    server = f"127.0.0.1:{port}"
+    pub = Client(module_id=MID_PUBLISHER)
+    pub.connect(server_name=server)
+    sub = Client(module_id=MID_SUBSCRIBER)
+    sub.connect(server_name=server)
+    sub.subscribe(MT_SCALING_TEST)
+    time.sleep(0.1)
+
+    print(f"{os.cpu_count()} CPUs, Python {sys.version.split()[0]}, {sys.platform}")
+    idle = []
+    for num_modules in sorted(args.module_counts):
+        # publisher and subscriber count towards the connected modules
+        while len(idle) + 2 < num_modules:
+            mod = Client(module_id=MID_IDLE_START + len(idle))
+            mod.connect(server_name=server)
+            idle.append(mod)
+
+        measure(pub, sub, min(1000, args.num_msgs))  # warm up
+        cost = measure(pub, sub, args.num_msgs)
+        print(f"{num_modules:4d} modules -> {cost * 1e6:8.2f} usec/message")
+
+    for mod in idle + [pub, sub]:
+        mod.disconnect()
+    manager.terminate()
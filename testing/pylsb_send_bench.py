@@ -0,0 +1,97 @@
+import sys
+import ctypes
+import socket
+import time
+
+sys.path.append("../")
+
+from pylsb import *
+from pylsb.client import requires_connection
+
+
+@msg_def
+class CONTROL(MessageData):
+    _fields_ = [("pos", ctypes.c_double * 3)]
+    type_id = 5099
+    type_name = "CONTROL"
+
+
+@requires_connection
+def send_with_new_header(client, msg_data, dest_mod_id=0, dest_host_id=0):
+    """send_message before header templates: a new ctypes header per call."""
+    if dest_mod_id < 0 or dest_mod_id > MAX_MODULES:
+        raise ValueError(dest_mod_id)
+    if dest_host_id < 0 or dest_host_id > MAX_HOSTS:
+        raise ValueError(dest_host_id)
+
+    header = client.header_cls()
+    header.msg_type = msg_data.type_id
+    header.msg_count = client._msg_count
+    header.send_time = time.time()
+    header.recv_time = 0.0
+    header.src_host_id = client._host_id
+    header.src_mod_id = client._module_id
+    header.dest_host_id = dest_host_id
+    header.dest_mod_id = dest_mod_id
+    header.num_data_bytes = ctypes.sizeof(msg_data)
+
+    client._sendall((header, msg_data), ctypes.sizeof(header) + header.num_data_bytes)
+    client._msg_count += 1
+
+
+def time_sends(send, client, msg, num_msgs, peer, frame_size):
+    tic = time.perf_counter()
+    for _ in range(num_msgs):
+        send(client, msg)
+    toc = time.perf_counter()
+    # Drain outside of the timing, the socket buffer holds a whole round
+    pending = num_msgs * frame_size
+    while pending:
+        pending -= len(peer.recv(pending))
+    return toc - tic
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Per-call overhead of Client.send_message and send_signal"
+    )
+    parser.add_argument(
+        "-n", default=1000, type=int, dest="num_msgs", help="Sends per round."
+    )
+    parser.add_argument(
+        "-r", default=200, type=int, dest="repeats", help="Best of this many rounds."
+    )
+    args = parser.parse_args()
+
+    # A connected client without a manager, writing into one end of a socket pair
+    client = Client(module_id=10)
+    sock, peer = socket.socketpair()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024**2)
+    client._sock = sock
+    client._connected = True
+    msg = CONTROL()
+    header_size = ctypes.sizeof(client.header_cls)
+    msg_size = header_size + ctypes.sizeof(msg)
+
+    cases = (
+        ("send_message, new header", send_with_new_header, msg_size),
+        ("send_message, template", lambda c, m: c.send_message(m), msg_size),
+        ("send_signal, template", lambda c, m: c.send_signal(m.type_id), header_size),
+    )
+    for title in (
+        "With the sendmsg syscall",
+        "Without the syscall (per-call overhead)",
+    ):
+        print(title)
+        for name, send, frame_size in cases:
+            seconds = min(
+                time_sends(send, client, msg, args.num_msgs, peer, frame_size)
+                for _ in range(args.repeats)
+            )
+            print(f"  {name:26s} {seconds / args.num_msgs * 1e6:6.2f} usec/call")
+        # Second pass: nothing is written, nothing to drain
+        client._sendall = lambda buffers, nbytes: None
+        cases = [(name, send, 0) for name, send, _ in cases]
+    client._connected = False
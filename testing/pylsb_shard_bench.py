@@ -0,0 +1,150 @@
+import sys
+import os
+import ctypes
+import logging
+import multiprocessing
+import random
+import signal
+import time
+
+sys.path.append("../")
+
+from pylsb import *
+from pylsb.manager import MessageManager
+from pylsb.shard import ShardedMessageManager
+
+MT_SHARD_TEST = 5040
+MID_PUBLISHER_START = 10
+MID_SUBSCRIBER_START = 50
+
+
+@msg_def
+class SHARD_TEST(MessageData):
+    _fields_ = [("data", ctypes.c_byte * 100)]
+    type_id = MT_SHARD_TEST
+    type_name = "SHARD_TEST"
+
+
+def manager_loop(port, num_workers):
+    logging.getLogger().setLevel(logging.WARNING)
+    if num_workers == 1:
+        manager = MessageManager(
+            ip_address="127.0.0.1", port=port, send_msg_timing=False
+        )
+    else:
+        manager = ShardedMessageManager(
+            ip_address="127.0.0.1",
+            port=port,
+            num_workers=num_workers,
+            send_msg_timing=False,
+        )
+    manager.run()
+
+
+def publisher_loop(server, module_id, num_msgs, start):
+    pub = Client(module_id=module_id)
+    pub.connect(server_name=server)
+    start.wait()
+    msg = SHARD_TEST()
+    for n in range(0, num_msgs, 64):
+        pub.send_messages([msg] * min(64, num_msgs - n))
+    pub.disconnect()
+
+
+def subscriber_loop(server, module_id, num_msgs, ready, done):
+    sub = Client(module_id=module_id)
+    sub.connect(server_name=server)
+    sub.subscribe(MT_SHARD_TEST)
+    time.sleep(0.2)
+    sub.discard_messages()
+    ready.release()
+
+    received = 0
+    deadline = time.perf_counter() + 60
+    while received < num_msgs and time.perf_counter() < deadline:
+        for msg in sub.read_messages(timeout=0.5):
+            received += msg.header.msg_type == MT_SHARD_TEST
+    done.put(received)
+    sub.disconnect()
+
+
+def bench(num_workers, num_publishers, num_subscribers, num_msgs):
+    """Aggregate delivery rate with every subscriber receiving every publisher."""
+    port = random.randint(10000, 20000)
+    server = f"127.0.0.1:{port}"
+    # Not a daemon, the sharded manager starts its own worker processes
+    manager = multiprocessing.Process(target=manager_loop, args=(port, num_workers))
+    manager.start()
+    time.sleep(2)
+
+    ready = multiprocessing.Semaphore(0)
+    start = multiprocessing.Event()
+    done = multiprocessing.Queue()
+    total = num_publishers * num_msgs
+    subscribers = [
+        multiprocessing.Process(
+            target=subscriber_loop,
+            args=(server, MID_SUBSCRIBER_START + n, total, ready, done),
+        )
+        for n in range(num_subscribers)
+    ]
+    publishers = [
+        multiprocessing.Process(
+            target=publisher_loop,
+            args=(server, MID_PUBLISHER_START + n, num_msgs, start),
+        )
+        for n in range(num_publishers)
+    ]
+    for proc in subscribers:
+        proc.start()
+    for _ in subscribers:
+        ready.acquire()
+    for proc in publishers:
+        proc.start()
+    time.sleep(0.5)
+
+    tic = time.perf_counter()
+    start.set()
+    delivered = sum(done.get() for _ in subscribers)
+    toc = time.perf_counter()
+
+    for proc in publishers + subscribers:
+        proc.join()
+    os.kill(manager.pid, signal.SIGINT)
+    manager.join()
+    return delivered / (toc - tic), total * num_subscribers - delivered
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Aggregate throughput of a ShardedMessageManager vs worker count"
+    )
+    parser.add_argument(
+        "-w",
+        nargs="*",
+        default=[1, 2, 4],
+        type=int,
+        dest="worker_counts",
+        help="Worker counts, 1 runs the plain MessageManager.",
+    )
+    parser.add_argument(
+        "-np", default=4, type=int, dest="num_publishers", help="Publishers."
+    )
+    parser.add_argument(
+        "-ns", default=8, type=int, dest="num_subscribers", help="Subscribers."
+    )
+    parser.add_argument(
+        "-n", default=5000, type=int, dest="num_msgs", help="Messages per publisher."
+    )
+    args = parser.parse_args()
+
+    print(f"{multiprocessing.cpu_count()} CPUs")
+    for num_workers in args.worker_counts:
+        rate, dropped = bench(
+            num_workers, args.num_publishers, args.num_subscribers, args.num_msgs
+        )
+        print(
+            f"{num_workers:2d} workers | {rate:10.0f} messages/s delivered | {dropped} dropped"
+        )
@@ -0,0 +1,120 @@
+import sys
+import os
+import ctypes
+import logging
+import multiprocessing
+import random
+import time
+
+sys.path.append("../")
+
+from pylsb import *
+from pylsb.manager import MessageManager
+from pylsb.shm import DEFAULT_SHM_RING_SIZE
+
+MT_SHM_TEST = 5050
+MID_PUBLISHER = 6
+MID_SUBSCRIBER = 7
+
+
+def create_test_msg(msg_size):
+    class SHM_TEST(MessageData):
+        _fields_ = [("data", ctypes.c_byte * msg_size)]
+        type_id = MT_SHM_TEST
+        type_name = "SHM_TEST"
+
+    return SHM_TEST
+
+
+def manager_loop(port):
+    manager = MessageManager(ip_address="127.0.0.1", port=port, send_msg_timing=False)
+    manager.logger.setLevel(logging.ERROR)
+    manager.run()
+
+
+def count(messages):
+    return sum(msg.header.msg_type == MT_SHM_TEST for msg in messages)
+
+
+def bench(server, msg_size, num_msgs, shared_memory):
+    sub = Client(module_id=MID_SUBSCRIBER)
+    sub.connect(server_name=server, shared_memory=shared_memory)
+    sub.subscribe(MT_SHM_TEST)
+    pub = Client(module_id=MID_PUBLISHER)
+    pub.connect(server_name=server, shared_memory=shared_memory)
+    time.sleep(0.1)
+    sub.discard_messages()
+    assert sub.shared_memory == pub.shared_memory == shared_memory
+
+    msg = create_test_msg(msg_size)()
+
+    # Round trips, one message in flight
+    num_pings = max(10, num_msgs // 10)
+    tic = time.perf_counter()
+    for _ in range(num_pings):
+        pub.send_message(msg)
+        while not count(sub.read_messages(max_count=1, timeout=1)):
+            pass
+    latency = (time.perf_counter() - tic) / num_pings
+
+    # Throughput, a window of messages in flight
+    window = max(1, min(64, DEFAULT_SHM_RING_SIZE // 4 // msg_size))
+    received = 0
+    tic = time.perf_counter()
+    for n in range(num_msgs):
+        pub.send_message(msg)
+        while n + 1 - received > window:
+            received += count(sub.read_messages(timeout=1))
+    while received < num_msgs:
+        received += count(sub.read_messages(timeout=1))
+    elapsed = time.perf_counter() - tic
+
+    sub.disconnect()
+    pub.disconnect()
+    return latency, elapsed
+
+
+def run(server, msg_size, num_msgs):
+    for shared_memory in (False, True):
+        latency, elapsed = bench(server, msg_size, num_msgs, shared_memory)
+        transport = "shm" if shared_memory else "tcp"
+        print(
+            f"{msg_size:8d} bytes | {transport} | {latency * 1e6:9.1f} usec round trip | {elapsed / num_msgs * 1e6:9.1f} usec/message | {num_msgs * msg_size / elapsed / 1e6:8.1f} MB/s"
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Publisher to subscriber cost over TCP vs shared memory"
+    )
+    parser.add_argument(
+        "-ms",
+        nargs="*",
+        default=[100, 10 * 1024, 1024**2],
+        type=int,
+        dest="msg_sizes",
+        help="Message sizes in bytes.",
+    )
+    parser.add_argument(
+        "-n",
+        default=5000,
+        type=int,
+        dest="num_msgs",
+        help="Messages per run, fewer for large messages.",
+    )
+    args = parser.parse_args()
+
+    port = random.randint(10000, 20000)
+    manager = multiprocessing.Process(target=manager_loop, args=(port,), daemon=True)
+    manager.start()
+    time.sleep(0.5)
+    server = f"127.0.0.1:{port}"
+
+    for msg_size in args.msg_sizes:
+        AddMessage(MT_SHM_TEST, create_test_msg(msg_size))
+        num_msgs = max(10, min(args.num_msgs, 256 * 1024**2 // msg_size))
+        run(server, msg_size, num_msgs)
+
+    manager.terminate()
@@ -0,0 +1,99 @@
+import sys
+import os
+import subprocess
+import tempfile
+
+sys.path.append("../")
+
+PACKAGE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+HEADER_TEMPLATE = """
+#define MT_TYPE_{n} {type_id}
+typedef struct {{
+    MSG_HEADER header;
+    double source_timestamp;
+    int values[NUM_VALUES];
+    float gains[NUM_GAINS];
+    char name[32];
+}} MDF_TYPE_{n};
+"""
+
+# Time to first message definition, measured inside a fresh interpreter
+CASES = {
+    "import pylsb": "import pylsb",
+    "compile headers": (
+        "import pylsb, pylsb.compile\n"
+        "namespace = {}\n"
+        "exec(pylsb.compile.generate(include_files), namespace)\n"
+        "pylsb.msg_defs[3000]"
+    ),
+    "cached, eager": (
+        "import pylsb, pylsb.compile\n"
+        "pylsb.compile.load(include_files, lazy=False)\n"
+        "pylsb.msg_defs[3000]"
+    ),
+    "cached, lazy": (
+        "import pylsb, pylsb.compile\n"
+        "pylsb.compile.load(include_files)\n"
+        "pylsb.msg_defs[3000]"
+    ),
+}
+
+
+def write_header(path, num_types):
+    with open(path, "w") as f:
+        f.write("#define NUM_VALUES 16\n#define NUM_GAINS 64\n")
+        f.write(
+            "typedef struct {\n    int serial_no;\n    int sub_sample;\n} MSG_HEADER;\n"
+        )
+        for n in range(num_types):
+            f.write(HEADER_TEMPLATE.format(n=n, type_id=3000 + n))
+
+
+def time_case(code, include_files, cache_dir):
+    script = (
+        "import time\n"
+        "tic = time.perf_counter()\n"
+        f"include_files = {include_files!r}\n"
+        f"{code}\n"
+        "print(time.perf_counter() - tic)\n"
+    )
+    env = dict(os.environ, PYLSB_CACHE_DIR=cache_dir, PYTHONPATH=PACKAGE_DIR)
+    # The cached module is also byte-compiled by the import system
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    result = subprocess.run(
+        [sys.executable, "-c", script], env=env, capture_output=True, check=True
+    )
+    return float(result.stdout)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Module startup with compiled message definitions"
+    )
+    parser.add_argument(
+        "-n",
+        default=400,
+        type=int,
+        dest="num_types",
+        help="Message types in the header.",
+    )
+    parser.add_argument(
+        "-r", default=5, type=int, dest="repeats", help="Best of this many starts."
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        header = os.path.join(tmp_dir, "msg_types.h")
+        write_header(header, args.num_types)
+        cache_dir = os.path.join(tmp_dir, "cache")
+        print(f"{args.num_types} message types, best of {args.repeats} starts")
+        for name, code in CASES.items():
+            # First start fills the cache
+            time_case(code, [header], cache_dir)
+            seconds = min(
+                time_case(code, [header], cache_dir) for _ in range(args.repeats)
+            )
+            print(f"{name:16s} {seconds * 1e3:7.1f} ms")
@@ -1,16 +1,47 @@
+import array
+import asyncio
 import ctypes
-import random
+import os
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
 import threading
 import time
 import unittest
+import unittest.mock
 
-from pylsb import msg_def
-from pylsb.client import Client
+import pylsb
+import pylsb.compile
+
+from pylsb import msg_def, MessageData, MessageHeader
+from pylsb._core import SAVE_MESSAGE_LOG, SHM_CONNECT, msg_registry, rebuild_registry
+from pylsb.aio import AsyncClient, AsyncMessageManager
+from pylsb.constants import *
+from pylsb.client import (
+    SHM_CONNECT_TIMEOUT,
+    Client,
+    InvalidDestinationHost,
+    InvalidDestinationModule,
+)
+from pylsb.logger import QuickLogger, LOG_FILE_HEADER, LOG_TYPE_ENTRY, LOG_MAGIC
 from pylsb.manager import MessageManager
+from pylsb.replay import LogReplay
+from pylsb.shm import ShmChannel
+
+try:
+    import numpy as np
+    from pylsb.logreader import LogReader
+except ImportError:
+    np = None
+from pylsb.shard import ShardedMessageManager
 
 # Choose a unique message type id number
 MT_TEST_MESSAGE = 1234
 MT_TEST_MESSAGE2 = 5678
+MT_PACKED_MESSAGE = 5679
+MT_LARGE_MESSAGE = 4321
 
 
 @msg_def
@@ -35,6 +66,34 @@ class TEST_MESSAGE2(ctypes.Structure):
     type_name: str = "TEST_MESSAGE2"
 
 
+@msg_def
+class PACKED_MESSAGE(MessageData):
+    _fields_ = [
+        ("val", ctypes.c_double),
+    ]
+
+    type_id: int = MT_PACKED_MESSAGE
+    type_name: str = "PACKED_MESSAGE"
+    data_struct = struct.Struct("=d")
+
+
+@msg_def
+class LARGE_MESSAGE(MessageData):
+    _fields_ = [
+        ("data", ctypes.c_ubyte * (3 * 1024**2)),
+    ]
+
+    type_id: int = MT_LARGE_MESSAGE
+    type_name: str = "LARGE_MESSAGE"
+
+
+def free_port() -> int:
+    """Port that is not in use, random ports collide across many managers."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
 def wait_for_message():
     """
     Helper function for allowing time for a message to reach the manager.
@@ -47,12 +106,14 @@ class TestSingleClient(unittest.TestCase):
     Test interactions between a single client and manager.
     """
 
+    manager_cls = MessageManager
+
     def setUp(self):
-        self.port = random.randint(1000, 10000)  # random port
+        self.port = free_port()
         self.module_id = 11
         self.client = Client(module_id=self.module_id, host_id=0, timecode=False)
 
-        self.manager = MessageManager(
+        self.manager = self.manager_cls(
             ip_address="127.0.0.1",
             port=self.port,
             timecode=False,
@@ -280,3 +341,1687 @@ class TestSingleClient(unittest.TestCase):
             [mod.id for mod in self.manager.subscriptions[MT_TEST_MESSAGE2]],
             msg="Module id not found in TEST_MESSAGE2 subscriptions",
         )
+
+
+class TestPublishSubscribe(unittest.TestCase):
+    """
+    Test message delivery between a publisher and a subscriber client.
+    """
+
+    manager_cls = MessageManager
+    shared_memory = False
+    unix_socket = False
+
+    def setUp(self):
+        self.port = free_port()
+        self.unix_path = None
+        self.server_name = f"127.0.0.1:{self.port}"
+        if self.unix_socket:
+            self.tmp_dir = tempfile.TemporaryDirectory()
+            self.unix_path = os.path.join(self.tmp_dir.name, "pylsb.sock")
+            self.server_name = f"unix:{self.unix_path}"
+        self.publisher = Client(module_id=12, host_id=0, timecode=False)
+        self.subscriber = Client(module_id=13, host_id=0, timecode=False)
+
+        self.manager = self.manager_cls(
+            ip_address="127.0.0.1",
+            port=self.port,
+            timecode=False,
+            debug=False,
+            send_msg_timing=False,
+            unix_path=self.unix_path,
+        )
+        self.manager_thread = threading.Thread(
+            target=self.manager.run,
+        )
+        self.manager_thread.start()
+        wait_for_message()
+
+        self.publisher.connect(
+            server_name=self.server_name, shared_memory=self.shared_memory
+        )
+        self.subscriber.connect(
+            server_name=self.server_name, shared_memory=self.shared_memory
+        )
+        self.subscriber.subscribe(
+            [MT_TEST_MESSAGE, MT_TEST_MESSAGE2, MT_PACKED_MESSAGE]
+        )
+        wait_for_message()
+        self.subscriber.discard_messages()  # subscription acknowledgements
+
+    def tearDown(self):
+        try:
+            self.publisher.disconnect()
+            self.subscriber.disconnect()
+        finally:
+            self.manager.close()
+        self.manager_thread.join()
+        for mod in self.manager.modules:
+            mod.close()
+        if self.unix_socket:
+            self.tmp_dir.cleanup()
+
+    def test_whenClientSendsBatch_subscriberReceivesAllInOrder(self):
+        """
+        Test if all messages of a batch arrive in order with consecutive message counts.
+        """
+        # Arrange
+        batch = []
+        for n in range(3):
+            msg = TEST_MESSAGE()
+            msg.val = n
+            batch.append(msg)
+        batch.append(TEST_MESSAGE2())
+        first_count = self.publisher.msg_count
+
+        # Act
+        stats = self.publisher.send_messages(batch)
+        wait_for_message()
+        received = [self.subscriber.read_message(timeout=1) for _ in batch]
+
+        # Assert
+        header_size = ctypes.sizeof(self.publisher.header_cls)
+        self.assertEqual(stats.num_messages, 4)
+        self.assertEqual(
+            stats.num_bytes,
+            4 * header_size
+            + 3 * ctypes.sizeof(TEST_MESSAGE)
+            + ctypes.sizeof(TEST_MESSAGE2),
+        )
+        self.assertEqual(
+            [msg.header.msg_type for msg in received],
+            [MT_TEST_MESSAGE] * 3 + [MT_TEST_MESSAGE2],
+        )
+        self.assertEqual([msg.data.val for msg in received[:3]], [0, 1, 2])
+        self.assertEqual(
+            [msg.header.msg_count for msg in received],
+            list(range(first_count, first_count + 4)),
+        )
+
+    def test_whenClientSendsRepeatedly_headersAreStampedPerMessage(self):
+        """
+        Test if reused headers still get a new msg_count and send_time, and the destination checks.
+        """
+        # Arrange
+        msg = TEST_MESSAGE2()
+        first_count = self.publisher.msg_count
+
+        # Act
+        for n in range(3):
+            msg.val = n
+            self.publisher.send_message(msg)
+            time.sleep(0.01)
+        received = [self.subscriber.read_message(timeout=1) for _ in range(3)]
+
+        # Assert
+        self.assertEqual([r.data.val for r in received], [0, 1, 2])
+        self.assertEqual(
+            [r.header.msg_count for r in received],
+            list(range(first_count, first_count + 3)),
+        )
+        self.assertLess(received[0].header.send_time, received[1].header.send_time)
+        self.assertLess(received[1].header.send_time, received[2].header.send_time)
+        self.assertEqual({r.header.src_mod_id for r in received}, {12})
+        with self.assertRaises(InvalidDestinationModule):
+            self.publisher.send_message(msg, dest_mod_id=MAX_MODULES + 1)
+        with self.assertRaises(InvalidDestinationHost):
+            self.publisher.send_signal(MT_TEST_MESSAGE2, dest_host_id=-1)
+
+    def test_whenBatchCrossesIntMax_msgCountWrapsToZero(self):
+        """
+        Test if the counts of a batch wrap like the C int header field.
+        """
+        # Arrange
+        self.publisher._msg_count = 2**31 - 2
+        batch = [TEST_MESSAGE2(val=n) for n in range(4)]
+
+        # Act
+        self.publisher.send_messages(batch)
+        received = [self.subscriber.read_message(timeout=1) for _ in batch]
+
+        # Assert
+        self.assertEqual(
+            [r.header.msg_count for r in received], [2**31 - 2, 2**31 - 1, 0, 1]
+        )
+        self.assertEqual(self.publisher.msg_count, 2)
+
+    def test_whenMsgCountReachesIntMax_itWrapsToZero(self):
+        """
+        Test if msg_count wraps like the C int header field instead of overflowing.
+        """
+        # Arrange
+        self.publisher._msg_count = 2**31 - 1
+
+        # Act
+        self.publisher.send_message(TEST_MESSAGE2(val=1))
+        self.publisher.send_values(PACKED_MESSAGE, 2)
+        received = [self.subscriber.read_message(timeout=1) for _ in range(2)]
+
+        # Assert
+        self.assertEqual([r.header.msg_count for r in received], [2**31 - 1, 0])
+        self.assertEqual([r.data.val for r in received], [1, 2])
+        self.assertEqual(self.publisher.msg_count, 1)
+
+    def test_whenClientSendsValues_subscriberReceivesTheMessage(self):
+        """
+        Test if a message packed with data_struct arrives like a ctypes message.
+        """
+        # Act
+        self.publisher.send_values(PACKED_MESSAGE, 2.5)
+        msg = self.subscriber.read_message(timeout=1)
+
+        # Assert
+        self.assertEqual(msg.header.msg_type, MT_PACKED_MESSAGE)
+        self.assertEqual(msg.header.num_data_bytes, ctypes.sizeof(PACKED_MESSAGE))
+        self.assertEqual(msg.data.val, 2.5)
+        self.assertEqual(PACKED_MESSAGE.unpack_from(msg.data), (2.5,))
+
+    def test_whenClientSendsFrames_theyArriveUnchanged(self):
+        """
+        Test if complete frames, e.g. recorded ones, are sent without restamping.
+        """
+        # Arrange
+        header = MessageHeader()
+        header.msg_type = MT_TEST_MESSAGE2
+        header.msg_count = 1000
+        header.src_mod_id = 12
+        header.num_data_bytes = ctypes.sizeof(TEST_MESSAGE2)
+        frame = bytes(header) + bytes(TEST_MESSAGE2(val=7))
+        msg_count = self.publisher.msg_count
+
+        # Act
+        self.publisher.send_frames((frame,), len(frame))
+        msg = self.subscriber.read_message(timeout=1)
+
+        # Assert
+        self.assertEqual(msg.header.msg_count, 1000)
+        self.assertEqual(msg.data.val, 7)
+        self.assertEqual(self.publisher.msg_count, msg_count)
+
+    def test_whenTypeHasNoDefinition_subscriberReceivesRawBytes(self):
+        """
+        Test if payloads of unknown message types pass through as bytes.
+        """
+
+        # Arrange
+        class UNKNOWN_MESSAGE(MessageData):
+            _fields_ = [("val", ctypes.c_int * 3)]
+            type_id = 4200
+
+        msg = UNKNOWN_MESSAGE()
+        msg.val[:] = [1, 2, 3]
+        self.subscriber.subscribe(4200)
+        wait_for_message()
+        self.subscriber.discard_messages()
+
+        # Act
+        self.publisher.send_message(msg)
+        received = self.subscriber.read_message(timeout=1)
+
+        # Assert
+        self.assertEqual(received.type_id, 4200)
+        self.assertEqual(received.data, bytes(msg))
+        self.assertEqual(received.copy().data, bytes(msg))
+
+    def test_whenClientDecodesLazily_dataIsDecodedOnFirstAccess(self):
+        """
+        Test if a lazy_decode client keeps the payload until data is used.
+        """
+        # Arrange
+        subscriber = Client(module_id=14, lazy_decode=True)
+        subscriber.connect(
+            server_name=self.server_name, shared_memory=self.shared_memory
+        )
+        try:
+            subscriber.subscribe(MT_TEST_MESSAGE)
+            wait_for_message()
+            subscriber.discard_messages()
+            msg = TEST_MESSAGE()
+            msg.val = 1.5
+
+            # Act
+            self.publisher.send_message(msg)
+            received = subscriber.read_message(timeout=1)
+            payload = received.payload
+            data = received.data
+        finally:
+            subscriber.disconnect()
+
+        # Assert
+        self.assertEqual(received.type_id, MT_TEST_MESSAGE)
+        self.assertEqual(received.name, "TEST_MESSAGE")
+        self.assertEqual(bytes(payload), bytes(msg))
+        self.assertIsInstance(data, TEST_MESSAGE)
+        self.assertEqual(data.val, 1.5)
+        self.assertIs(received.data, data)
+
+    def test_whenTypesAreDropped_theyAreSkipped(self):
+        """
+        Test if dropped and unknown types are skipped by read_message and read_messages.
+        """
+
+        # Arrange
+        class UNKNOWN_MESSAGE(MessageData):
+            type_id = 4201
+
+        self.subscriber.subscribe(4201)
+        wait_for_message()
+        self.subscriber.discard_messages()
+        self.subscriber.drop_types([MT_TEST_MESSAGE], unknown=True)
+
+        # Act
+        self.publisher.send_messages(
+            [TEST_MESSAGE(), UNKNOWN_MESSAGE(), TEST_MESSAGE2(), TEST_MESSAGE()]
+        )
+        received = self.subscriber.read_message(timeout=1)
+        remaining = self.subscriber.read_messages(timeout=0.2)
+
+        # Assert
+        self.assertEqual(received.type_id, MT_TEST_MESSAGE2)
+        self.assertEqual(remaining, [])
+
+    def test_whenDispatcherRuns_handlersAreCalledByType(self):
+        """
+        Test if the dispatcher calls handlers by type, the default handler for
+        other types, and queues main_thread handlers for dispatch_pending.
+        """
+        # Arrange
+        self.subscriber.subscribe(4202)
+        wait_for_message()
+        self.subscriber.discard_messages()
+        vals, handler_threads, main_vals, other_types = [], [], [], []
+
+        def on_test_message(msg):
+            vals.append(msg.data.val)
+            handler_threads.append(threading.current_thread())
+
+        self.subscriber.on(TEST_MESSAGE, on_test_message)
+        self.subscriber.on(
+            MT_TEST_MESSAGE2, lambda msg: main_vals.append(msg.data.val), True
+        )
+        self.subscriber.on(None, lambda msg: other_types.append(msg.type_id))
+        batch = []
+        for n in range(3):
+            msg = TEST_MESSAGE()
+            msg.val = n
+            msg2 = TEST_MESSAGE2()
+            msg2.val = 10 + n
+            batch += [msg, msg2]
+
+        # Act
+        self.subscriber.start_dispatcher()
+        self.publisher.send_messages(batch)
+        self.publisher.send_signal(4202)
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline and (
+            len(vals) < 3 or not other_types or self.subscriber.dispatch_backlog < 3
+        ):
+            time.sleep(0.01)
+        backlog = self.subscriber.dispatch_backlog
+        dispatched = self.subscriber.dispatch_pending()
+        self.subscriber.stop_dispatcher()
+        stats = self.subscriber.dispatch_stats
+
+        # Assert
+        self.assertEqual(vals, [0, 1, 2])
+        self.assertNotIn(threading.current_thread(), handler_threads)
+        self.assertEqual(other_types, [4202])
+        self.assertEqual(backlog, 3)
+        self.assertEqual(dispatched, 3)
+        self.assertEqual(main_vals, [10, 11, 12])
+        self.assertEqual(self.subscriber.dispatch_backlog, 0)
+        self.assertEqual(stats.num_dispatched, 7)
+        self.assertEqual(stats.num_unhandled, 0)
+        self.assertEqual(stats.max_backlog, 3)
+        self.assertGreaterEqual(stats.max_latency, stats.mean_latency)
+        self.assertGreater(stats.mean_latency, 0)
+
+    def test_whenHandlerRaises_stopDispatcherReraisesIt(self):
+        """
+        Test if an exception in a handler ends the dispatcher and is raised by stop_dispatcher.
+        """
+
+        # Arrange
+        def on_test_message(msg):
+            raise ValueError(msg.data.val)
+
+        self.subscriber.on(MT_TEST_MESSAGE, on_test_message)
+        self.subscriber.start_dispatcher(read_timeout=0.01)
+
+        # Act
+        self.publisher.send_message(TEST_MESSAGE())
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline and self.subscriber.dispatcher_running:
+            time.sleep(0.01)
+
+        # Assert
+        self.assertFalse(self.subscriber.dispatcher_running)
+        with self.assertRaises(ValueError):
+            self.subscriber.stop_dispatcher()
+        self.subscriber.stop_dispatcher()  # no longer running
+
+    def test_whenHandlerStopsDispatcher_restOfTheBatchIsNotDispatched(self):
+        """
+        Test if no handler is called after a handler stopped the dispatcher mid-batch.
+        """
+        # Arrange
+        vals = []
+
+        def on_test_message(msg):
+            vals.append(msg.data.val)
+            self.subscriber.stop_dispatcher()
+
+        self.subscriber.on(MT_TEST_MESSAGE, on_test_message)
+        self.publisher.send_messages([TEST_MESSAGE(val=n) for n in range(5)])
+        wait_for_message()
+
+        # Act
+        self.subscriber.start_dispatcher(read_timeout=0.01)
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline and self.subscriber.dispatcher_running:
+            time.sleep(0.01)
+
+        # Assert
+        self.assertFalse(self.subscriber.dispatcher_running)
+        self.assertEqual(vals, [0])
+
+    def test_whenHandlerRaises_disconnectLeavesTheManagerWithoutRaising(self):
+        """
+        Test if disconnect still leaves the manager after a handler raised, and
+        the exception stays with stop_dispatcher.
+        """
+
+        # Arrange
+        def on_test_message(msg):
+            raise ValueError(msg.data.val)
+
+        self.subscriber.on(MT_TEST_MESSAGE, on_test_message)
+        self.subscriber.start_dispatcher(read_timeout=0.01)
+        self.publisher.send_message(TEST_MESSAGE())
+        deadline = time.monotonic() + 2
+        while time.monotonic() < deadline and self.subscriber.dispatcher_running:
+            time.sleep(0.01)
+
+        # Act
+        self.subscriber.disconnect()
+        wait_for_message()
+
+        # Assert
+        self.assertIsNone(self.manager.module_by_id[13])
+        with self.assertRaises(ValueError):
+            self.subscriber.stop_dispatcher()
+
+    def test_whenHandlersSend_sendsFromBothThreadsArriveIntact(self):
+        """
+        Test if sends from a handler on the dispatcher thread and from the main
+        thread do not interleave or share a msg_count.
+        """
+        # Arrange
+        num_msgs = 2000
+        self.publisher.subscribe(MT_PACKED_MESSAGE)
+        wait_for_message()
+        self.publisher.discard_messages()
+
+        def on_test_message(msg):
+            self.subscriber.send_values(PACKED_MESSAGE, msg.data.val)
+
+        self.subscriber.on(MT_TEST_MESSAGE, on_test_message)
+        self.subscriber.start_dispatcher(read_timeout=0.01)
+        # Switch threads as often as possible, mid-send included
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+        # Act
+        try:
+            self.publisher.send_messages([TEST_MESSAGE(val=n) for n in range(num_msgs)])
+            for n in range(num_msgs):
+                self.subscriber.send_values(PACKED_MESSAGE, num_msgs + n)
+        finally:
+            sys.setswitchinterval(switch_interval)
+        received = []
+        deadline = time.monotonic() + 5
+        while len(received) < 2 * num_msgs and time.monotonic() < deadline:
+            received += [msg.copy() for msg in self.publisher.read_messages(timeout=1)]
+        self.subscriber.stop_dispatcher()
+
+        # Assert
+        self.assertEqual(len(received), 2 * num_msgs)
+        self.assertEqual({msg.data.val for msg in received}, set(range(2 * num_msgs)))
+        self.assertEqual(len({msg.header.msg_count for msg in received}), 2 * num_msgs)
+
+    def test_whenClientReadsMessages_availableMessagesAreReturnedUpToMaxCount(self):
+        """
+        Test if read_messages returns all available messages, limited by max_count.
+        """
+        # Arrange
+        batch = [TEST_MESSAGE2() for _ in range(5)]
+        self.publisher.send_messages(batch)
+        wait_for_message()
+
+        # Act
+        first = self.subscriber.read_messages(max_count=3)
+        rest = self.subscriber.read_messages()
+        empty = self.subscriber.read_messages(timeout=0)
+
+        # Assert
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(rest), 2)
+        self.assertEqual(empty, [])
+        self.assertEqual(
+            [msg.header.msg_count for msg in first + rest],
+            list(range(first[0].header.msg_count, first[0].header.msg_count + 5)),
+        )
+
+    def test_whenManyMessagesAreQueued_readMessagesDrainsThemInOneCall(self):
+        """
+        Test if read_messages keeps filling the receive buffer while data is available.
+        """
+
+        # Arrange
+        if self.unix_socket:
+            self.skipTest("Unix sockets buffer less than one receive buffer fill")
+
+        class KB_MESSAGE(MessageData):
+            _fields_ = [("data", ctypes.c_byte * 1000)]
+            type_id = 4203
+
+        self.subscriber.subscribe(4203)
+        wait_for_message()
+        self.subscriber.discard_messages()
+        num_msgs = 3000
+
+        # Act
+        self.publisher.send_messages([KB_MESSAGE() for _ in range(num_msgs)])
+        time.sleep(0.5)  # let the manager forward the whole batch
+        deadline = time.monotonic() + 5
+        first = self.subscriber.read_messages()
+        received = len(first)
+        while received < num_msgs and time.monotonic() < deadline:
+            received += len(self.subscriber.read_messages(timeout=1))
+
+        # Assert
+        self.assertEqual(received, num_msgs)
+        self.assertGreater(len(first), num_msgs // 2)
+
+    def test_whenClientReadsZeroCopy_copiedMessagesOutliveTheReceiveBuffer(self):
+        """
+        Test if zero-copy messages carry the payload and copies survive later reads.
+        """
+        # Arrange
+        self.subscriber.disconnect()
+        self.subscriber = Client(module_id=13, host_id=0, zero_copy=True)
+        self.subscriber.connect(
+            server_name=self.server_name, shared_memory=self.shared_memory
+        )
+        self.subscriber.subscribe(MT_TEST_MESSAGE2)
+        wait_for_message()
+        self.subscriber.discard_messages()
+        batch = []
+        for n in range(20):
+            msg = TEST_MESSAGE2()
+            msg.val = n
+            batch.append(msg)
+        self.publisher.send_messages(batch)
+        wait_for_message()
+
+        # Act
+        copies = []
+        for _ in batch:
+            msg = self.subscriber.read_message(timeout=1)
+            copies.append(msg.copy())
+
+        # Assert
+        self.assertEqual([msg.data.val for msg in copies], list(range(20)))
+
+    def test_whenMessageHasDestination_onlyThatSubscriberReceivesIt(self):
+        """
+        Test if directed messages reach a subscribed destination and nobody else.
+        """
+        # Arrange
+        msg = TEST_MESSAGE2()
+
+        # Act
+        msg.val = 1
+        self.publisher.send_message(msg, dest_mod_id=13)
+        msg.val = 2
+        self.publisher.send_message(msg, dest_mod_id=99)
+        wait_for_message()
+        received = self.subscriber.read_messages()
+
+        # Assert
+        self.assertEqual([msg.data.val for msg in received], [1])
+
+    def test_whenClientAsksForSharedMemory_itIsUsedIfTheManagerSupportsIt(self):
+        """
+        Test if shared memory is negotiated with MessageManager and refused by the asyncio engine.
+        """
+        # Arrange
+        client = Client(module_id=14)
+
+        # Act
+        client.connect(server_name=self.server_name, shared_memory=True)
+        client.subscribe(MT_TEST_MESSAGE2)
+        wait_for_message()
+        client.discard_messages()
+        msg = TEST_MESSAGE2()
+        msg.val = 3
+        self.publisher.send_message(msg)
+        received = client.read_message(timeout=1)
+        shared_memory = client.shared_memory
+        client.disconnect()
+
+        # Assert
+        self.assertEqual(
+            shared_memory,
+            sys.version_info >= (3, 8)
+            and not isinstance(self.manager, AsyncMessageManager),
+        )
+        self.assertEqual(received.data.val, 3)
+
+    def test_whenSharedMemoryIsRefused_clientFallsBackWithoutTimeout(self):
+        """
+        Test if a manager refusing shared memory answers right away instead of letting the client time out.
+        """
+        # Arrange
+        client = Client(module_id=14)
+
+        # Act
+        t_start = time.perf_counter()
+        client.connect(server_name=self.server_name, shared_memory=True)
+        connect_time = time.perf_counter() - t_start
+        client.subscribe(MT_TEST_MESSAGE2)
+        wait_for_message()
+        client.discard_messages()
+        self.publisher.send_message(TEST_MESSAGE2(val=8))
+        received = client.read_message(timeout=1)
+        client.disconnect()
+
+        # Assert
+        self.assertLess(connect_time, SHM_CONNECT_TIMEOUT / 2)
+        self.assertEqual(received.data.val, 8)
+
+    def test_whenCpuIsNotX86_64_sharedMemoryIsNotUsed(self):
+        """
+        Test if clients stay on TCP on CPUs the shared memory rings are not safe on.
+        """
+        # Arrange
+        client = Client(module_id=14)
+
+        # Act
+        with unittest.mock.patch("platform.machine", return_value="arm64"):
+            client.connect(server_name=self.server_name, shared_memory=True)
+        client.subscribe(MT_TEST_MESSAGE2)
+        wait_for_message()
+        client.discard_messages()
+        self.publisher.send_message(TEST_MESSAGE2(val=6))
+        received = client.read_message(timeout=1)
+        shared_memory = client.shared_memory
+        client.disconnect()
+
+        # Assert
+        self.assertFalse(shared_memory)
+        self.assertEqual(received.data.val, 6)
+
+    @unittest.skipUnless(sys.version_info >= (3, 8), "needs shared memory")
+    def test_whenSharedMemoryNonceIsWrong_theRequestIsRefused(self):
+        """
+        Test if the manager only attaches to segments the requesting client created.
+        """
+        # Arrange
+        client = Client(module_id=14)
+        client.connect(server_name=self.server_name)
+        channel = ShmChannel.create(client._sock, 1024**2)
+        msg = SHM_CONNECT()
+        msg.name = channel.name.encode()
+        msg.ring_size = 1024**2
+        msg.nonce[:] = bytes(b ^ 0xFF for b in channel.nonce)
+
+        # Act
+        client.send_message(msg)
+        reply = client._wait_for_shm_reply()
+        client.subscribe(MT_TEST_MESSAGE2)
+        wait_for_message()
+        client.discard_messages()
+        msg = TEST_MESSAGE2()
+        msg.val = 4
+        self.publisher.send_message(msg)
+        received = client.read_message(timeout=1)
+        module = self.manager.module_by_id[14]
+        client.disconnect()
+        channel.release()
+
+        # Assert
+        self.assertEqual(reply, MT_SHM_CONNECT_CANCEL)
+        self.assertFalse(client.shared_memory)
+        self.assertFalse(module.shared_memory)
+        self.assertIsNone(module.shm_pending)
+        self.assertEqual(received.data.val, 4)
+
+    @unittest.skipUnless(sys.version_info >= (3, 8), "needs shared memory")
+    def test_whenSharedMemoryRequestIsCancelled_theClientStaysOnTcp(self):
+        """
+        Test if a cancel after the request timed out keeps both sides on TCP,
+        and the late acknowledgement is discarded.
+        """
+        # Arrange
+        client = Client(module_id=14)
+        client.connect(server_name=self.server_name)
+        channel = ShmChannel.create(client._sock, 1024**2)
+        msg = SHM_CONNECT()
+        msg.name = channel.name.encode()
+        msg.ring_size = 1024**2
+        msg.nonce[:] = channel.nonce
+        client.send_message(msg)
+
+        # Act
+        client._cancel_shared_memory()
+        channel.release()
+        client.subscribe(MT_TEST_MESSAGE2)
+        wait_for_message()
+        client.discard_messages()
+        msg = TEST_MESSAGE2()
+        msg.val = 5
+        self.publisher.send_message(msg)
+        received = client.read_message(timeout=1)
+        module = self.manager.module_by_id[14]
+        client.disconnect()
+
+        # Assert
+        self.assertFalse(client.shared_memory)
+        self.assertFalse(module.shared_memory)
+        self.assertIsNone(module.shm_pending)
+        self.assertEqual(received.data.val, 5)
+
+
+class TestPublishSubscribeSharedMemory(TestPublishSubscribe):
+    shared_memory = True
+
+    @unittest.skipUnless(sys.version_info >= (3, 8), "needs shared memory")
+    def test_whenMessageIsLargerThanTheRing_itArrivesIntact(self):
+        """
+        Test if a message larger than the shared memory rings is streamed through them.
+        """
+        # Arrange
+        self.subscriber.disconnect()
+        self.subscriber = Client(module_id=13)
+        self.subscriber.connect(
+            server_name=self.server_name,
+            shared_memory=True,
+            shm_ring_size=1024**2,
+        )
+        self.subscriber.subscribe(MT_LARGE_MESSAGE)
+        wait_for_message()
+        self.subscriber.discard_messages()
+        msg = LARGE_MESSAGE()
+        for n in range(0, len(msg.data), 4096):
+            msg.data[n] = n // 4096 % 256
+
+        # Act
+        self.publisher.send_message(msg)
+        received = self.subscriber.read_message(timeout=5)
+
+        # Assert
+        self.assertTrue(self.publisher.shared_memory)
+        self.assertTrue(self.subscriber.shared_memory)
+        self.assertEqual(received.header.msg_type, MT_LARGE_MESSAGE)
+        self.assertEqual(bytes(received.data), bytes(msg))
+
+    @unittest.skipUnless(sys.version_info >= (3, 8), "needs shared memory")
+    def test_whenDoorbellIsMissedOnABusyManager_messageIsStillRead(self):
+        """
+        Test if the manager finds a frame without a doorbell while other sockets keep it busy.
+        """
+        # Arrange
+        busy = Client(module_id=16)
+        busy.connect(server_name=self.server_name)
+        stop = threading.Event()
+
+        def keep_busy():
+            while not stop.is_set():
+                busy.send_signal(4205)
+
+        busy_thread = threading.Thread(target=keep_busy)
+        self.publisher._sock.notify_reader = lambda: None  # doorbell is missed
+        msg = TEST_MESSAGE2()
+        msg.val = 7
+
+        # Act
+        busy_thread.start()
+        try:
+            time.sleep(0.1)
+            self.publisher.send_message(msg)
+            received = self.subscriber.read_message(timeout=1)
+        finally:
+            stop.set()
+            busy_thread.join()
+            busy.disconnect()
+
+        # Assert
+        self.assertTrue(self.publisher.shared_memory)
+        self.assertIsNotNone(received)
+        self.assertEqual(received.data.val, 7)
+
+    @unittest.skipUnless(sys.version_info >= (3, 8), "needs shared memory")
+    def test_whenClientIsNotLocal_sharedMemoryIsRefused(self):
+        """
+        Test if a client connecting from a non-loopback address stays on TCP.
+        """
+        # Arrange
+        probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            probe.connect(("192.0.2.1", 9))  # Only picks a route, sends nothing
+            address = probe.getsockname()[0]
+        except OSError:
+            address = "127.0.0.1"
+        finally:
+            probe.close()
+        if address.startswith("127."):
+            self.skipTest("no non-loopback address")
+        port = free_port()
+        manager = MessageManager(
+            ip_address="0.0.0.0", port=port, timecode=False, send_msg_timing=False
+        )
+        manager_thread = threading.Thread(target=manager.run)
+        manager_thread.start()
+        wait_for_message()
+        client = Client(module_id=14)
+
+        # Act
+        try:
+            t_start = time.perf_counter()
+            client.connect(server_name=f"{address}:{port}", shared_memory=True)
+            connect_time = time.perf_counter() - t_start
+            shared_memory = client.shared_memory
+            client.disconnect()
+        finally:
+            manager.close()
+            manager_thread.join()
+
+        # Assert
+        self.assertFalse(shared_memory)
+        self.assertLess(connect_time, SHM_CONNECT_TIMEOUT / 2)
+
+
+class TestAsyncClient(unittest.TestCase):
+    """
+    Test message delivery to an AsyncClient from a publishing Client.
+    Coroutines run on a fresh event loop per test (IsolatedAsyncioTestCase
+    needs Python 3.8).
+    """
+
+    manager_cls = MessageManager
+    unix_socket = False
+
+    def setUp(self):
+        self.port = free_port()
+        self.unix_path = None
+        self.server_name = f"127.0.0.1:{self.port}"
+        if self.unix_socket:
+            self.tmp_dir = tempfile.TemporaryDirectory()
+            self.unix_path = os.path.join(self.tmp_dir.name, "pylsb.sock")
+            self.server_name = f"unix:{self.unix_path}"
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.publisher = Client(module_id=12, host_id=0, timecode=False)
+        self.subscriber = AsyncClient(module_id=14, host_id=0, timecode=False)
+
+        self.manager = self.manager_cls(
+            ip_address="127.0.0.1",
+            port=self.port,
+            timecode=False,
+            debug=False,
+            send_msg_timing=False,
+            unix_path=self.unix_path,
+        )
+        self.manager_thread = threading.Thread(
+            target=self.manager.run,
+        )
+        self.manager_thread.start()
+        wait_for_message()
+        self.publisher.connect(server_name=f"127.0.0.1:{self.port}")
+        self.loop.run_until_complete(self.connect_subscriber())
+
+    async def connect_subscriber(self):
+        await self.subscriber.connect(server_name=self.server_name)
+        await self.subscriber.subscribe([MT_TEST_MESSAGE2])
+        await self.subscriber.wait_for_acknowledgement()
+
+    def tearDown(self):
+        try:
+            self.loop.run_until_complete(self.subscriber.disconnect())
+            self.publisher.disconnect()
+        finally:
+            self.loop.close()
+            asyncio.set_event_loop(None)
+            self.manager.close()
+        self.manager_thread.join()
+        for mod in self.manager.modules:
+            mod.close()
+        if self.unix_socket:
+            self.tmp_dir.cleanup()
+
+    def test_whenAsyncClientConnects_clientConnectsToMessageManager(self):
+        """
+        Test if the AsyncClient is registered with the manager.
+        """
+        # Assert
+        self.assertTrue(self.subscriber.connected)
+        self.assertIn(14, [mod.id for mod in self.manager.modules.values()])
+
+    def test_whenAsyncClientReads_publishedMessageIsReceived(self):
+        """
+        Test if read_message awaits a message sent by another client.
+        """
+        # Arrange
+        msg = TEST_MESSAGE2()
+        msg.val = 3.5
+
+        async def publish_and_read():
+            pending = asyncio.ensure_future(self.subscriber.read_message(timeout=1))
+            await asyncio.sleep(0.05)
+            self.publisher.send_message(msg)
+            received = await pending
+            empty = await self.subscriber.read_message(timeout=0)
+            return received, empty
+
+        # Act
+        received, empty = self.loop.run_until_complete(publish_and_read())
+
+        # Assert
+        self.assertEqual(received.header.msg_type, MT_TEST_MESSAGE2)
+        self.assertEqual(received.data.val, 3.5)
+        self.assertIsNone(empty)
+
+    def test_whenAsyncClientIterates_messagesArriveInOrder(self):
+        """
+        Test if async iteration yields published messages in order.
+        """
+        # Arrange
+        batch = []
+        for n in range(5):
+            msg = TEST_MESSAGE2()
+            msg.val = n
+            batch.append(msg)
+
+        async def iterate():
+            received = []
+            async for msg in self.subscriber:
+                received.append(msg.data.val)
+                if len(received) == len(batch):
+                    break
+            return received
+
+        # Act
+        self.publisher.send_messages(batch)
+        received = self.loop.run_until_complete(iterate())
+
+        # Assert
+        self.assertEqual(received, [0, 1, 2, 3, 4])
+
+    def test_whenAsyncMsgCountReachesIntMax_itWrapsToZero(self):
+        """
+        Test if the AsyncClient msg_count wraps like the C int header field, as Client does.
+        """
+        # Arrange
+        self.publisher.subscribe(MT_TEST_MESSAGE2)
+        wait_for_message()
+        self.publisher.discard_messages()
+        self.subscriber._msg_count = 2**31 - 1
+
+        async def send_two():
+            await self.subscriber.send_message(TEST_MESSAGE2(val=1))
+            await self.subscriber.send_message(TEST_MESSAGE2(val=2))
+
+        # Act
+        self.loop.run_until_complete(send_two())
+        received = [self.publisher.read_message(timeout=1) for _ in range(2)]
+
+        # Assert
+        self.assertEqual([r.header.msg_count for r in received], [2**31 - 1, 0])
+        self.assertEqual([r.data.val for r in received], [1, 2])
+        self.assertEqual(self.subscriber.msg_count, 1)
+
+
+class TestSingleClientAsyncManager(TestSingleClient):
+    manager_cls = AsyncMessageManager
+
+
+class TestPublishSubscribeAsyncManager(TestPublishSubscribe):
+    manager_cls = AsyncMessageManager
+
+    def test_whenLoggerStalls_itsQueueStaysBoundedAndReadingPauses(self):
+        """
+        Test if a logger that does not read neither grows the manager's buffers
+        past send_queue_size nor loses messages while it is behind.
+        """
+
+        # Arrange
+        class KB64_MESSAGE(MessageData):
+            _fields_ = [("data", ctypes.c_byte * 64 * 1024)]
+            type_id = 4204
+
+        logger = Client(module_id=15, host_id=0, timecode=False)
+        logger.connect(server_name=self.server_name, logger_status=True)
+        wait_for_message()
+        logger.discard_messages()
+        logger_module = self.manager.module_by_id[15]
+        num_msgs = 1000
+        publishing = threading.Thread(
+            target=self.publisher.send_messages,
+            args=([KB64_MESSAGE() for _ in range(num_msgs)],),
+        )
+
+        # Act
+        publishing.start()
+        time.sleep(1)
+        queued = logger_module.conn.get_write_buffer_size()
+        paused = publishing.is_alive()
+        received = 0
+        deadline = time.monotonic() + 10
+        while received < num_msgs and time.monotonic() < deadline:
+            received += sum(
+                msg.header.msg_type == 4204 for msg in logger.read_messages(timeout=0.1)
+            )
+        publishing.join()
+        logger.disconnect()
+
+        # Assert
+        self.assertTrue(paused)
+        self.assertLessEqual(queued, self.manager.send_queue_size)
+        self.assertEqual(received, num_msgs)
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "needs AF_UNIX")
+class TestPublishSubscribeUnixSocket(TestPublishSubscribe):
+    unix_socket = True
+
+    def test_whenUnixPathIsARegularFile_managerRaisesAndKeepsIt(self):
+        """
+        Test if a manager refuses to replace a file at its socket path that is not a socket.
+        """
+        # Arrange
+        path = os.path.join(self.tmp_dir.name, "not_a_socket")
+        with open(path, "w") as f:
+            f.write("data")
+
+        # Act & Assert
+        with self.assertRaises(OSError):
+            self.manager_cls(ip_address="127.0.0.1", port=free_port(), unix_path=path)
+        with open(path) as f:
+            self.assertEqual(f.read(), "data")
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "needs AF_UNIX")
+class TestPublishSubscribeUnixSocketAsyncManager(TestPublishSubscribe):
+    manager_cls = AsyncMessageManager
+    unix_socket = True
+
+
+class TestAsyncClientAsyncManager(TestAsyncClient):
+    manager_cls = AsyncMessageManager
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "needs AF_UNIX")
+class TestAsyncClientUnixSocket(TestAsyncClient):
+    unix_socket = True
+
+
+@unittest.skipUnless(hasattr(socket, "SO_REUSEPORT"), "needs SO_REUSEPORT")
+@unittest.skipUnless(sys.version_info >= (3, 8), "needs multiprocessing.shared_memory")
+class TestShardedManager(unittest.TestCase):
+    """
+    Test routing between clients spread over the shards of a ShardedMessageManager.
+    """
+
+    ring_size = 8 * 1024**2
+    send_msg_timing = False
+
+    def setUp(self):
+        self.port = free_port()
+        self.manager = ShardedMessageManager(
+            ip_address="127.0.0.1",
+            port=self.port,
+            num_workers=2,
+            ring_size=self.ring_size,
+            send_msg_timing=self.send_msg_timing,
+        )
+        self.manager_thread = threading.Thread(
+            target=self.manager.run,
+        )
+        self.manager_thread.start()
+        time.sleep(1.5)  # worker processes start up
+
+        # Enough clients that both shards get some of them
+        self.subscribers = []
+        for n in range(6):
+            sub = Client(module_id=20 + n)
+            sub.connect(server_name=f"127.0.0.1:{self.port}")
+            sub.subscribe(MT_TEST_MESSAGE2)
+            self.subscribers.append(sub)
+        self.publisher = Client(module_id=12)
+        self.publisher.connect(server_name=f"127.0.0.1:{self.port}")
+        wait_for_message()
+        for sub in self.subscribers:
+            sub.discard_messages()
+
+    def tearDown(self):
+        try:
+            for mod in self.subscribers + [self.publisher]:
+                mod.disconnect()
+        finally:
+            self.manager.close()
+        self.manager_thread.join()
+
+    def test_whenClientPublishes_subscribersOnAllShardsReceive(self):
+        """
+        Test if every subscriber gets every message, whichever shard it is on.
+        """
+        # Arrange
+        batch = []
+        for n in range(10):
+            msg = TEST_MESSAGE2()
+            msg.val = n
+            batch.append(msg)
+
+        # Act
+        self.publisher.send_messages(batch)
+        wait_for_message()
+
+        # Assert
+        for sub in self.subscribers:
+            received = [msg.data.val for msg in sub.read_messages()]
+            self.assertEqual(received, list(range(10)))
+
+    def test_whenMessageHasDestination_onlyThatSubscriberReceivesIt(self):
+        """
+        Test if directed messages reach their destination on any shard.
+        """
+        # Arrange
+        msg = TEST_MESSAGE2()
+
+        # Act
+        for sub in self.subscribers:
+            msg.val = sub.module_id
+            self.publisher.send_message(msg, dest_mod_id=sub.module_id)
+        wait_for_message()
+
+        # Assert
+        for sub in self.subscribers:
+            received = [msg.data.val for msg in sub.read_messages()]
+            self.assertEqual(received, [sub.module_id])
+
+
+class TestShardedManagerSmallRings(TestShardedManager):
+    ring_size = 1024**2
+
+    def test_whenRingToShardIsFull_messageIsReportedAsFailed(self):
+        """
+        Test if a message that does not fit the ring to another shard is reported with FAILED_MESSAGE
+        for each subscriber that missed it.
+        """
+        # Arrange
+        for sub in self.subscribers:
+            sub.subscribe(MT_LARGE_MESSAGE)
+        self.publisher.subscribe(MT_FAILED_MESSAGE)
+        wait_for_message()
+        self.publisher.discard_messages()
+        for sub in self.subscribers:
+            sub.discard_messages()
+
+        # Act
+        self.publisher.send_message(LARGE_MESSAGE())
+        missed = [
+            sub.module_id
+            for sub in self.subscribers
+            if not sub.read_messages(timeout=1)
+        ]
+        if not missed:
+            self.skipTest("all clients were placed on the same shard")
+        failed = []
+        deadline = time.monotonic() + 2
+        while len(failed) < len(missed) and time.monotonic() < deadline:
+            failed += [msg.copy() for msg in self.publisher.read_messages(timeout=0.1)]
+
+        # Assert
+        for msg in failed:
+            self.assertEqual(msg.header.msg_type, MT_FAILED_MESSAGE)
+            self.assertEqual(msg.data.msg_header.msg_type, MT_LARGE_MESSAGE)
+            self.assertEqual(msg.data.msg_header.src_mod_id, 12)
+        self.assertEqual(sorted(msg.data.dest_mod_id for msg in failed), missed)
+
+
+class TestShardedManagerTiming(TestShardedManager):
+    send_msg_timing = True
+
+    def test_whenTimingIsEnabled_timingCountsMessagesOfAllShards(self):
+        """
+        Test if TIMING_MESSAGE is sent periodically with the counts of every shard.
+        """
+        # Arrange
+        for sub in self.subscribers:
+            sub.subscribe(MT_TIMING_MESSAGE)
+        wait_for_message()
+        batch = [TEST_MESSAGE2() for _ in range(10)]
+
+        # Act
+        self.publisher.send_messages(batch)
+        time.sleep(2.5)
+
+        # Assert
+        for sub in self.subscribers:
+            timing = [
+                msg.data
+                for msg in sub.read_messages()
+                if msg.header.msg_type == MT_TIMING_MESSAGE
+            ]
+            self.assertGreaterEqual(len(timing), 2)
+            self.assertEqual(sum(data.timing[MT_TEST_MESSAGE2] for data in timing), 10)
+
+
+def read_log(path):
+    """
+    Helper function returning the payloads in a message log by type.
+    """
+    with open(path, "rb") as f:
+        log = f.read()
+    (
+        magic,
+        version,
+        header_size,
+        data_offset,
+        data_size,
+        num_frames,
+        num_types,
+        index_offset,
+    ) = LOG_FILE_HEADER.unpack_from(log)
+    assert magic == LOG_MAGIC and index_offset == data_offset + data_size
+
+    offsets = array.array("q", log[index_offset : index_offset + 8 * num_frames])
+    type_offset = index_offset + 16 * num_frames
+    type_index = array.array("q", log[type_offset + LOG_TYPE_ENTRY.size * num_types :])
+    payloads = {}
+    for n in range(num_types):
+        msg_type, _, first, count = LOG_TYPE_ENTRY.unpack_from(
+            log, type_offset + n * LOG_TYPE_ENTRY.size
+        )
+        payloads[msg_type] = []
+        for frame in type_index[first : first + count]:
+            offset = offsets[frame]
+            (num_data_bytes,) = struct.unpack_from(
+                "=i", log, offset + MessageHeader.num_data_bytes.offset
+            )
+            start = offset + header_size
+            payloads[msg_type].append(log[start : start + num_data_bytes])
+    return payloads
+
+
+class TestQuickLogger(unittest.TestCase):
+    """
+    Test recording of routed messages by a QuickLogger module.
+    """
+
+    def setUp(self):
+        self.port = free_port()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.manager = MessageManager(
+            ip_address="127.0.0.1",
+            port=self.port,
+            send_msg_timing=False,
+        )
+        self.manager_thread = threading.Thread(
+            target=self.manager.run,
+        )
+        self.manager_thread.start()
+        wait_for_message()
+
+        self.quick_logger = QuickLogger(
+            os.path.join(self.tmp_dir.name, "quicklogger.bin"),
+            prealloc_size=64 * 1024,
+        )
+        self.quick_logger.connect(server_name=f"127.0.0.1:{self.port}")
+        self.logger_thread = threading.Thread(target=self.quick_logger.run)
+        self.logger_thread.start()
+
+        self.publisher = Client(module_id=12)
+        self.publisher.connect(server_name=f"127.0.0.1:{self.port}")
+        self.publisher.subscribe(MT_MESSAGE_LOG_SAVED)
+        wait_for_message()
+        self.publisher.discard_messages()
+
+    def tearDown(self):
+        try:
+            self.publisher.disconnect()
+            self.quick_logger.stop()
+            self.logger_thread.join()
+            self.quick_logger.close()
+        finally:
+            self.manager.close()
+        self.manager_thread.join()
+        for mod in self.manager.modules:
+            mod.close()
+        self.tmp_dir.cleanup()
+
+    def publish(self, values):
+        batch = []
+        for val in values:
+            msg = TEST_MESSAGE2()
+            msg.val = val
+            batch.append(msg)
+        self.publisher.send_messages(batch)
+
+    def save_log(self):
+        path = os.path.join(self.tmp_dir.name, "saved.bin")
+        msg = SAVE_MESSAGE_LOG()
+        msg.pathname = path.encode()
+        msg.pathname_length = len(path)
+        self.publisher.send_message(msg)
+        reply = self.publisher.read_message(timeout=5)
+        self.assertEqual(reply.header.msg_type, MT_MESSAGE_LOG_SAVED)
+        return read_log(path)
+
+    def logged_values(self, payloads):
+        return [
+            TEST_MESSAGE2.from_buffer_copy(payload).val
+            for payload in payloads.get(MT_TEST_MESSAGE2, [])
+        ]
+
+    def test_whenLogIsSaved_everyPublishedMessageIsInTheFile(self):
+        """
+        Test if a saved log holds every message, in order, larger than the preallocated file.
+        """
+        # Arrange
+        values = list(range(5000))
+
+        # Act
+        for n in range(0, len(values), 500):
+            self.publish(values[n : n + 500])
+        payloads = self.save_log()
+
+        # Assert
+        self.assertEqual(self.logged_values(payloads), values)
+        self.assertEqual(len(payloads[MT_SAVE_MESSAGE_LOG]), 1)
+
+    def test_whenLoggingIsPaused_messagesAreNotLogged(self):
+        """
+        Test if messages sent between PAUSE and RESUME are left out of the log.
+        """
+        # Arrange
+        self.publish([1, 2])
+
+        # Act
+        self.publisher.send_signal(MT_PAUSE_MESSAGE_LOGGING)
+        self.publish([3, 4])
+        self.publisher.send_signal(MT_RESUME_MESSAGE_LOGGING)
+        self.publish([5])
+        payloads = self.save_log()
+
+        # Assert
+        self.assertEqual(self.logged_values(payloads), [1, 2, 5])
+
+    def test_whenLogIsReset_earlierMessagesAreDropped(self):
+        """
+        Test if RESET discards everything logged before it.
+        """
+        # Arrange
+        self.publish([1, 2])
+
+        # Act
+        self.publisher.send_signal(MT_RESET_MESSAGE_LOG)
+        self.publish([3])
+        payloads = self.save_log()
+
+        # Assert
+        self.assertEqual(self.logged_values(payloads), [3])
+
+    def test_whenLogIsDumped_logFileIsCompleteAndLoggingContinues(self):
+        """
+        Test if DUMP indexes the log file in place and later messages are still logged.
+        """
+        # Arrange
+        self.publish([1, 2])
+
+        # Act
+        self.publisher.send_signal(MT_DUMP_MESSAGE_LOG)
+        wait_for_message()
+        dumped = read_log(self.quick_logger.path)
+        self.publish([3])
+        payloads = self.save_log()
+
+        # Assert
+        self.assertEqual(self.logged_values(dumped), [1, 2])
+        self.assertEqual(self.logged_values(payloads), [1, 2, 3])
+
+    @unittest.skipUnless(np, "needs numpy")
+    def test_whenLogIsRead_eachTypeIsAStructuredArray(self):
+        """
+        Test if LogReader returns payloads and header fields of a type, also when types are interleaved.
+        """
+        # Arrange
+        batch = []
+        for n in range(100):
+            msg = TEST_MESSAGE2()
+            msg.val = n
+            batch.append(msg)
+            if n % 3 == 0:
+                msg = TEST_MESSAGE()
+                msg.arr[:] = range(n, n + 8)
+                batch.append(msg)
+        self.publisher.send_messages(batch)
+        path = os.path.join(self.tmp_dir.name, "saved.bin")
+        self.save_log()
+
+        # Act
+        with LogReader(path) as reader:
+            messages2 = reader.read(MT_TEST_MESSAGE2)
+            messages = reader.read(MT_TEST_MESSAGE)
+            middle = reader.read(
+                MT_TEST_MESSAGE2,
+                start_time=messages2.recv_time[0],
+                end_time=messages2.recv_time[-1] + 1,
+            )
+
+        # Assert
+        np.testing.assert_array_equal(messages2.data["val"], np.arange(100))
+        np.testing.assert_array_equal(
+            messages.data["arr"], [range(n, n + 8) for n in range(0, 100, 3)]
+        )
+        self.assertTrue(np.all(messages2.src_mod_id == 12))
+        self.assertTrue(np.all(np.diff(messages.msg_count) == 4))
+        self.assertTrue(np.all(messages2.recv_time >= messages2.send_time))
+        self.assertEqual(len(middle), 100)
+
+    def test_whenLogIsReplayed_subscriberReceivesTheRecordedMessages(self):
+        """
+        Test if LogReplay republishes the recorded user messages in order.
+        """
+        # Arrange
+        self.publish(range(50))
+        path = os.path.join(self.tmp_dir.name, "saved.bin")
+        self.save_log()
+        subscriber = Client(module_id=13)
+        subscriber.connect(server_name=f"127.0.0.1:{self.port}")
+        subscriber.subscribe(MT_TEST_MESSAGE2)
+        wait_for_message()
+        subscriber.discard_messages()
+
+        # Act
+        with LogReplay(path, speed=0) as replay:
+            stats = replay.run(self.publisher)
+        wait_for_message()
+        received = subscriber.read_messages()
+        subscriber.disconnect()
+
+        # Assert
+        self.assertEqual(stats.num_messages, 50)
+        self.assertEqual([msg.data.val for msg in received], list(range(50)))
+
+    def test_whenLogIsReplayedFaster_recordedTimingIsScaled(self):
+        """
+        Test if a replay at twice the speed takes half the recorded time.
+        """
+        # Arrange
+        self.publish([1])
+        time.sleep(0.4)
+        self.publish([2])
+        path = os.path.join(self.tmp_dir.name, "saved.bin")
+        self.save_log()
+
+        # Act
+        with LogReplay(path, msg_types=[MT_TEST_MESSAGE2], speed=2) as replay:
+            stats = replay.run(self.publisher)
+
+        # Assert
+        self.assertEqual(stats.num_messages, 2)
+        self.assertAlmostEqual(stats.target_duration, 0.2, delta=0.05)
+        self.assertGreaterEqual(stats.duration, stats.target_duration)
+        self.assertEqual(len(stats.jitter), 2)
+
+
+class TestMessageDataNumpy(unittest.TestCase):
+    """
+    Test NumPy views of message data.
+    """
+
+    def test_whenPylsbIsImported_numpyIsNotImported(self):
+        """
+        Test if base usage works without numpy.
+        """
+        # Act
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, pylsb, pylsb.client, pylsb.manager; "
+                "sys.exit('numpy' in sys.modules)",
+            ]
+        )
+
+        # Assert
+        self.assertEqual(result.returncode, 0)
+
+    @unittest.skipUnless(np, "needs numpy")
+    def test_whenDtypeIsDerived_itMatchesTheCtypesLayout(self):
+        """
+        Test if packed, nested and multi-dimensional fields keep their ctypes offsets.
+        """
+
+        # Arrange
+        class PACKED_MESSAGE(MessageData):
+            _pack_ = 1
+            _fields_ = [
+                ("flag", ctypes.c_byte),
+                ("header", MessageHeader),
+                ("grid", ctypes.c_short * 3 * 2),
+                ("name", ctypes.c_char * 5),
+            ]
+
+        # Act
+        dtype = PACKED_MESSAGE.numpy_dtype()
+
+        # Assert
+        self.assertIs(PACKED_MESSAGE.numpy_dtype(), dtype)
+        self.assertEqual(dtype.itemsize, ctypes.sizeof(PACKED_MESSAGE))
+        for name, _ in PACKED_MESSAGE._fields_:
+            self.assertEqual(
+                dtype.fields[name][1], getattr(PACKED_MESSAGE, name).offset
+            )
+        self.assertEqual(dtype["grid"].shape, (2, 3))
+        self.assertEqual(dtype["name"], np.dtype("S5"))
+
+    @unittest.skipUnless(np, "needs numpy")
+    def test_whenMessageIsViewedAsNumpy_theViewSharesItsMemory(self):
+        """
+        Test if as_numpy returns a view, not a copy.
+        """
+        # Arrange
+        msg = TEST_MESSAGE()
+        msg.arr[:] = range(8)
+
+        # Act
+        view = msg.as_numpy()
+        view["val"] = 2.5
+        view["arr"] *= 2
+
+        # Assert
+        self.assertEqual(msg.val, 2.5)
+        self.assertEqual(list(msg.arr), list(range(0, 16, 2)))
+
+
+class TestCompileCache(unittest.TestCase):
+    """
+    Test cached, lazily built message definitions compiled from C headers.
+    """
+
+    HEADER = """
+#define MAX_SAMPLES 4
+#define NAME_LENGTH 4
+#define MT_CACHED_SAMPLE 4101
+#define MT_CACHED_SIGNAL 4102
+
+typedef struct {
+    int serial_no;
+    int sub_sample;
+} CACHED_HEADER;
+
+typedef struct {
+    CACHED_HEADER header;
+    double samples[MAX_SAMPLES];
+    char name[NAME_LENGTH * 2];
+} MDF_CACHED_SAMPLE;
+
+typedef struct {
+} MDF_CACHED_SIGNAL;
+"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        self.header = os.path.join(self.tmp_dir.name, "cached_types.h")
+        with open(self.header, "w") as f:
+            f.write(self.HEADER)
+        self.saved_defs = dict.copy(pylsb.user_msg_defs)
+        self.saved_factories = dict(pylsb.user_msg_defs.factories)
+
+    def tearDown(self):
+        pylsb.user_msg_defs.clear()
+        pylsb.user_msg_defs.update(self.saved_defs)
+        pylsb.user_msg_defs.factories.clear()
+        pylsb.user_msg_defs.factories.update(self.saved_factories)
+        rebuild_registry()
+        self.tmp_dir.cleanup()
+
+    def test_whenLazyModuleIsLoaded_classesAreBuiltOnFirstLookup(self):
+        """
+        Test if a message class is only built when msg_defs looks it up.
+        """
+        # Arrange
+        module = pylsb.compile.load(
+            [self.header], module_name="cached_types_lazy", cache_dir=self.cache_dir
+        )
+        self.assertNotIn("MDF_CACHED_SAMPLE", vars(module))
+        self.assertIn(module.MT_CACHED_SAMPLE, pylsb.msg_defs)
+        self.assertIsNone(msg_registry[module.MT_CACHED_SAMPLE])
+
+        # Act
+        msg_cls = pylsb.msg_defs[module.MT_CACHED_SAMPLE]
+
+        # Assert
+        self.assertIs(module.MDF_CACHED_SAMPLE, msg_cls)
+        self.assertIs(msg_registry[module.MT_CACHED_SAMPLE].msg_cls, msg_cls)
+        self.assertIn("CACHED_HEADER", vars(module))
+        self.assertEqual(msg_cls.type_id, 4101)
+        self.assertEqual(len(msg_cls().samples), 4)
+        self.assertEqual(module.MDF_CACHED_SIGNAL.type_name, "CACHED_SIGNAL")
+        with self.assertRaises(AttributeError):
+            module.MDF_MISSING
+
+    def test_whenLazyModuleIsStarImported_classesAreNotBuilt(self):
+        """
+        Test if a star import of a lazy module takes the constants without building any class.
+        """
+        # Arrange
+        finder = pylsb.compile.install_import_hook(
+            "cached_types_star", [self.header], cache_dir=self.cache_dir
+        )
+        namespace = {}
+
+        # Act
+        try:
+            exec("from cached_types_star import *", namespace)
+            module = sys.modules["cached_types_star"]
+        finally:
+            sys.meta_path.remove(finder)
+            sys.modules.pop("cached_types_star", None)
+
+        # Assert
+        self.assertEqual(namespace["MAX_SAMPLES"], 4)
+        self.assertEqual(namespace["MT_CACHED_SAMPLE"], 4101)
+        for name in ("MDF_CACHED_SAMPLE", "MDF_CACHED_SIGNAL", "CACHED_HEADER"):
+            self.assertNotIn(name, namespace)
+            self.assertNotIn(name, vars(module))
+        self.assertIsNone(msg_registry[4101])
+        self.assertEqual(module.MDF_CACHED_SAMPLE.type_id, 4101)
+
+    def test_whenHeaderIsCompiled_dataStructMatchesTheCtypesLayout(self):
+        """
+        Test if the generated struct codec round trips a ctypes message.
+        """
+        # Arrange
+        module = pylsb.compile.load(
+            [self.header],
+            module_name="cached_types_codec",
+            lazy=False,
+            cache_dir=self.cache_dir,
+        )
+        msg = module.MDF_CACHED_SAMPLE()
+        msg.header.serial_no = 7
+        msg.samples[:] = [1.0, 2.0, 3.0, 4.0]
+        msg.name = b"abc"
+        buffer = bytearray(ctypes.sizeof(msg))
+
+        # Act
+        values = module.MDF_CACHED_SAMPLE.unpack_from(bytes(msg))
+        module.MDF_CACHED_SAMPLE.pack_into(buffer, 0, *values)
+
+        # Assert
+        self.assertEqual(module.MDF_CACHED_SAMPLE.data_struct.format, "=ii4d8s")
+        self.assertEqual(values, (7, 0, 1.0, 2.0, 3.0, 4.0, b"abc\0\0\0\0\0"))
+        self.assertEqual(bytes(buffer), bytes(msg))
+
+    def test_whenDataStructSizeDiffers_msgDefRaises(self):
+        """
+        Test if msg_def checks data_struct against the ctypes size.
+        """
+        # Act & Assert
+        with self.assertRaises(TypeError):
+
+            @msg_def
+            class BAD_CODEC(MessageData):
+                _fields_ = [("val", ctypes.c_double)]
+                type_id = 4103
+                type_name = "BAD_CODEC"
+                data_struct = struct.Struct("=f")
+
+    def test_whenHeaderChanges_itIsRecompiled(self):
+        """
+        Test if the cache is keyed on the header content.
+        """
+        # Arrange
+        path = pylsb.compile.cached_module_path([self.header], cache_dir=self.cache_dir)
+
+        # Act
+        same_path = pylsb.compile.cached_module_path(
+            [self.header], cache_dir=self.cache_dir
+        )
+        with open(self.header, "a") as f:
+            f.write("#define MAX_CHANNELS 8\n")
+        new_path = pylsb.compile.cached_module_path(
+            [self.header], cache_dir=self.cache_dir
+        )
+
+        # Assert
+        self.assertEqual(same_path, path)
+        self.assertNotEqual(new_path, path)
+        with open(new_path) as f:
+            self.assertIn("MAX_CHANNELS = 8", f.read())
+
+    def test_whenImportHookIsInstalled_moduleImportsFromCache(self):
+        """
+        Test if the import hook serves the compiled definitions.
+        """
+        # Arrange
+        finder = pylsb.compile.install_import_hook(
+            "cached_types_hook", [self.header], lazy=False, cache_dir=self.cache_dir
+        )
+
+        # Act
+        try:
+            import cached_types_hook
+        finally:
+            sys.meta_path.remove(finder)
+            sys.modules.pop("cached_types_hook", None)
+
+        # Assert
+        self.assertIn("MDF_CACHED_SAMPLE", vars(cached_types_hook))
+        self.assertEqual(cached_types_hook.MAX_SAMPLES, 4)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)